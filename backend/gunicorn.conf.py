@@ -0,0 +1,53 @@
+"""
+Production server settings: `gunicorn -c gunicorn.conf.py`
+
+export WEB_CONCURRENCY="2"                  # worker processes
+export GUNICORN_THREADS="8"                 # threads per worker (gthread)
+export GUNICORN_WORKER_CLASS="gthread"      # or uvicorn_worker.UvicornWorker (ASGI)
+export GUNICORN_TIMEOUT="120"               # seconds before a silent worker is restarted
+export GUNICORN_BIND="0.0.0.0:8000"
+
+The default runs the WSGI app on threaded workers. With the uvicorn worker
+class the ASGI app is served instead, and persistent database connections
+are turned off as Django cannot reuse them across async requests.
+
+The app is not preloaded: the dispatch, delivery and scheduler threads are
+started by each worker after the fork.
+"""
+import glob
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+preload_app = False
+accesslog = "-"
+
+if "uvicorn" in worker_class.lower():
+    wsgi_app = "backend.asgi:application"
+    os.environ.setdefault("POSTGRES_CONN_MAX_AGE", "0")
+else:
+    wsgi_app = "backend.wsgi:application"
+
+
+
+def on_starting(server):
+    """Start the metrics of a new master from an empty multiprocess directory."""
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        # samples of a previous run would otherwise be aggregated forever
+        for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    """Drop the live gauges of a worker that exited from the aggregated metrics."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,136 @@
+"""
+Load test of `GET /api/post` and `POST /api/post`.
+
+    python loadtest.py --url http://localhost:8000 --concurrency 32 --duration 30
+
+Runs the same mix of requests against a running backend and prints the
+throughput and latency percentiles per endpoint, so serving setups (e.g.
+`manage.py runserver` against `gunicorn -c gunicorn.conf.py`) can be
+compared. Only the standard library is used.
+
+The POST requests create text-only posts scheduled a year ahead, which are
+deleted again at the end unless `--keep` is given.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+
+class Stats:
+    """Latencies and failures of one endpoint, shared by all client threads."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def add(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            if not ok:
+                self.errors += 1
+
+    def summary(self, elapsed: float) -> str:
+        if not self.latencies:
+            return "no requests"
+        lat = sorted(self.latencies)
+        q = statistics.quantiles(lat, n=100) if len(lat) > 1 else lat * 99
+        return (
+            f"{len(lat):7d} req  {len(lat) / elapsed:8.1f} req/s  "
+            f"p50 {q[49] * 1000:7.1f} ms  p95 {q[94] * 1000:7.1f} ms  "
+            f"p99 {q[98] * 1000:7.1f} ms  errors {self.errors}"
+        )
+
+
+def request(method: str, url: str, body: bytes | None = None, timeout: float = 30) -> Tuple[int, bytes]:
+    req = urllib.request.Request(url, data=body, method=method)
+    if body is not None:
+        req.add_header("Content-Type", "application/json")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def new_post() -> bytes:
+    schedule = datetime.now(timezone.utc) + timedelta(days=365, seconds=random.randint(0, 86400))
+    return json.dumps(
+        {
+            "text": f"load test {random.getrandbits(32):08x}",
+            "schedule": schedule.isoformat(),
+            "immediate": False,
+            "socials": ["x"],
+        }
+    ).encode()
+
+
+def run(base: str, concurrency: int, duration: float, post_ratio: float, limit: int) -> Dict[str, object]:
+    stats = {"GET": Stats(), "POST": Stats()}
+    created: List[int] = []
+    created_lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client() -> None:
+        while time.monotonic() < deadline:
+            method = "POST" if random.random() < post_ratio else "GET"
+            started = time.perf_counter()
+            try:
+                if method == "POST":
+                    code, body = request("POST", f"{base}/api/post", new_post())
+                else:
+                    code, body = request("GET", f"{base}/api/post?limit={limit}")
+            except Exception:
+                stats[method].add(time.perf_counter() - started, False)
+                continue
+            stats[method].add(time.perf_counter() - started, code < 400)
+            if method == "POST" and code < 400:
+                post_id = json.loads(body).get("id")
+                if post_id is not None:
+                    with created_lock:
+                        created.append(post_id)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    return {"stats": stats, "elapsed": time.monotonic() - started, "created": created}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the backend.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run.")
+    parser.add_argument("--post-ratio", type=float, default=0.2, help="Share of POST requests.")
+    parser.add_argument("--limit", type=int, default=100, help="Page size of the GET requests.")
+    parser.add_argument("--keep", action="store_true", help="Keep the created posts.")
+    args = parser.parse_args()
+
+    base = args.url.rstrip("/")
+    result = run(base, args.concurrency, args.duration, args.post_ratio, args.limit)
+    elapsed = result["elapsed"]
+    print(f"{base}: {args.concurrency} clients for {elapsed:.1f}s")
+    for method, stats in result["stats"].items():
+        print(f"  {method:4s} /api/post  {stats.summary(elapsed)}")
+    total = sum(len(s.latencies) for s in result["stats"].values())
+    print(f"  total          {total / elapsed:8.1f} req/s")
+
+    if not args.keep and result["created"]:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(lambda i: request("DELETE", f"{base}/api/post/{i}"), result["created"]))
+        print(f"  deleted {len(result['created'])} posts")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,26 @@
 from django.apps import AppConfig
 import logging
+import sys
 from django.db.backends.signals import connection_created
 
 logger = logging.getLogger("posts")
 
 def setup_scheduler(**kwargs):
     """
-    Sets up the scheduler for rescheduling posts that are not marked as immediate.
+    Sets up the scheduler for posts that are not marked as immediate.
 
-    This function retrieves all posts that are not immediate and attempts to reschedule them
-    using the `reschedule_post` helper function. If an error occurs during rescheduling, 
-    it logs a warning with the post ID and the error message.
+    The scheduler itself runs in the worker started by `manage.py
+    run_scheduler`. When `SCHEDULER_EMBEDDED` is enabled, web processes also
+    start a worker thread; only the one holding the leader lock schedules
+    anything, so posts still fire once however many processes are running.
 
     Args:
         **kwargs: Arbitrary keyword arguments, typically passed by Django signals.
     """
-    from .models import Post
-    from .helpers import reschedule_post
-
-    try:
-        posts = Post.objects.filter(immediate=False).values()
-        for _post in posts:
-            try:
-                post = Post(**_post)
-                reschedule_post(post)
-            except Exception as e:
-                logger.warning(f"Error rescheduling post {post.id}: {e}")
-    except Exception as e:
-        logger.warning(f"Error fetching posts for rescheduling: {e}")
+    from .worker import SchedulerWorker, should_embed
+
+    if should_embed(sys.argv):
+        SchedulerWorker().start_background()
 
 
 class PostsConfig(AppConfig):
@@ -4,18 +4,34 @@ export MINIO_ENDPOINT="play.min.io:9000"
 export MINIO_ACCESS_KEY="YOURACCESSKEY"
 export MINIO_SECRET_KEY="YOURSECRET"
 export MINIO_SECURE="true"   # "false" for http
+export MINIO_PUBLIC_ENDPOINT="media.example.com"   # host browsers reach MinIO at
+export MINIO_PUBLIC_SECURE="true"
+export MINIO_REGION="us-east-1"
 """
 from __future__ import annotations
 
-import os, io, threading
-from typing import IO, Optional
+import os, io, mmap, tempfile, threading
+from datetime import timedelta
+from typing import IO, Iterator, List, Optional, Tuple
 import logging
 
 from minio import Minio
+from minio.commonconfig import ComposeSource
+from minio.datatypes import Part
 from minio.error import S3Error
 
+from .metrics import MINIO_DURATION, MINIO_ERRORS, timed
+
 logger = logging.getLogger("posts")
 
+# chunk size used when streaming objects down from MinIO
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+# objects larger than this are spooled to disk instead of kept in memory
+SPOOL_MAX_MEMORY = int(os.getenv("MINIO_SPOOL_MAX_MEMORY", str(16 * 1024 * 1024)))
+# multipart upload tuning (S3 requires parts of at least 5 MiB)
+PART_SIZE = max(int(os.getenv("MINIO_PART_SIZE", str(10 * 1024 * 1024))), 5 * 1024 * 1024)
+PARALLEL_UPLOADS = int(os.getenv("MINIO_PARALLEL_UPLOADS", "4"))
+
 class MinioClient:
     """
     Thread-safe Singleton façade for MinIO.
@@ -28,10 +44,18 @@ class MinioClient:
 
     buf = m.get_object("photos", "pets/cat.jpg")
     print("downloaded", len(buf.getvalue()), "bytes")
+
+    # large objects: stream instead of buffering everything in memory
+    for chunk in m.iter_object("videos", "clip.mp4"):
+        ...
+    f = m.open_object("videos", "clip.mp4")      # spooled temp file
+    mm = m.map_object("videos", "clip.mp4")      # read-only mmap
     """
 
     _lock   = threading.RLock()
     _inst: Optional["MinioClient"] = None
+    # buckets known to exist, shared by the whole process
+    _buckets: Optional[set[str]] = None
 
     # ---------------- singleton ctor ---------------- #
     def __init__(self):
@@ -49,6 +73,15 @@ class MinioClient:
             secret_key=secret_key,
             secure=secure,
         )
+        # presigned URLs are signed for the host the browser uploads to; the
+        # region is fixed so signing needs no round trip
+        self._public = Minio(
+            os.getenv("MINIO_PUBLIC_ENDPOINT", endpoint),
+            access_key=access_key,
+            secret_key=secret_key,
+            secure=os.getenv("MINIO_PUBLIC_SECURE", str(secure)).lower() == "true",
+            region=os.getenv("MINIO_REGION", "us-east-1"),
+        )
 
     @classmethod
     def instance(cls) -> "MinioClient":
@@ -58,32 +91,85 @@ class MinioClient:
         return cls._inst
 
     # ----------------------- API -------------------- #
-    def put_object(self, bucket: str, key: str, data: IO[bytes]) -> None:
+    def ensure_bucket(self, bucket: str) -> None:
+        """
+        Make sure `bucket` exists, creating it if needed.
+
+        The first call lists every bucket once; after that only buckets that
+        have never been seen by this process cost a round trip.
+        """
+        with MinioClient._lock:
+            if MinioClient._buckets is None:
+                MinioClient._buckets = {b.name for b in self._client.list_buckets()}
+            if bucket in MinioClient._buckets:
+                return
+            if not self._client.bucket_exists(bucket):
+                self._client.make_bucket(bucket)
+            MinioClient._buckets.add(bucket)
+
+    def _forget_bucket(self, bucket: str) -> None:
+        """Make the next `ensure_bucket` check `bucket` with MinIO again."""
+        with MinioClient._lock:
+            if MinioClient._buckets is not None:
+                MinioClient._buckets.discard(bucket)
+
+    @timed(MINIO_DURATION, MINIO_ERRORS, operation="put")
+    def put_object(
+        self,
+        bucket: str,
+        key: str,
+        data: IO[bytes],
+        content_type: str = "application/octet-stream",
+        part_size: int = PART_SIZE,
+        parallel: int = PARALLEL_UPLOADS,
+    ) -> None:
         """
         Upload the contents of any IOBase (must be opened in *binary* mode).
 
-        If the bucket doesn’t exist, create it first.
+        The stream is sent as a multipart upload of `part_size` parts, up to
+        `parallel` of them at a time, so non-seekable streams of unknown
+        length are never buffered whole. If the bucket doesn’t exist, create
+        it first. A seekable stream is sent again from where it started if the
+        bucket turns out to be gone.
         """
         length = _length_of(data)
+        replayable = length >= 0
+        if replayable:
+            start = data.tell()
+        else:
+            # a stream that cannot be replayed gets no retry, so the cached
+            # bucket is checked against MinIO before it is consumed instead
+            self._forget_bucket(bucket)
+        self.ensure_bucket(bucket)
         try:
-            # create bucket if it doesn't exist
-            if not self._client.bucket_exists(bucket):
-                self._client.make_bucket(bucket)
             self._client.put_object(
                 bucket_name=bucket,
                 object_name=key,
                 data=data,
                 length=length,
-                part_size=10 * 1024 * 1024,  # 10 MiB multipart
+                content_type=content_type,
+                part_size=part_size,
+                num_parallel_uploads=parallel,
             )
         except S3Error as exc:
-            if exc.code == "NoSuchBucket":
-                self._client.make_bucket(bucket)
-                data.seek(0)
-                self.put_object(bucket, key, data)  # retry once
+            if exc.code == "NoSuchBucket" and replayable:
+                # removed behind our back – forget it and retry once
+                self._forget_bucket(bucket)
+                data.seek(start)
+                self.ensure_bucket(bucket)
+                self._client.put_object(
+                    bucket_name=bucket,
+                    object_name=key,
+                    data=data,
+                    length=length,
+                    content_type=content_type,
+                    part_size=part_size,
+                    num_parallel_uploads=parallel,
+                )
             else:
                 raise
 
+    @timed(MINIO_DURATION, MINIO_ERRORS, operation="get")
     def get_object(self, bucket: str, key: str) -> io.BytesIO:
         """
         Download `bucket/key` and return it as an in-memory BytesIO.
@@ -97,6 +183,150 @@ class MinioClient:
         buf.seek(0)
         return buf
 
+    @timed(MINIO_DURATION, MINIO_ERRORS, operation="stat")
+    def stat_object(self, bucket: str, key: str):
+        """
+        Return the metadata (size, ETag, content type, ...) of `bucket/key`
+        without downloading it.
+        """
+        return self._client.stat_object(bucket, key)
+
+    def exists(self, bucket: str, key: str) -> bool:
+        """
+        Whether `bucket/key` exists.
+        """
+        try:
+            self.stat_object(bucket, key)
+        except S3Error as exc:
+            if exc.code in ("NoSuchKey", "NoSuchBucket", "NoSuchObject"):
+                return False
+            raise
+        return True
+
+    @timed(MINIO_DURATION, MINIO_ERRORS, operation="copy")
+    def copy_object(self, bucket: str, src: str, dst: str) -> None:
+        """
+        Copy `bucket/src` to `bucket/dst` inside MinIO, without downloading it.
+
+        Objects above the 5 GiB limit of a single copy are copied in parts;
+        smaller ones still take one CopyObject request.
+        """
+        self._client.compose_object(bucket, dst, [ComposeSource(bucket, src)])
+
+    def presigned_put(self, bucket: str, key: str, expires: timedelta) -> str:
+        """
+        URL the browser can PUT the whole object to until `expires` passes.
+        """
+        self.ensure_bucket(bucket)
+        return self._public.presigned_put_object(bucket, key, expires=expires)
+
+    def start_multipart(
+        self, bucket: str, key: str, parts: int, expires: timedelta,
+        content_type: str = "application/octet-stream",
+    ) -> Tuple[str, List[str]]:
+        """
+        Start a multipart upload of `parts` parts.
+
+        Returns:
+            Tuple[str, List[str]]: The upload id and the URL to PUT each part
+            to, in part order.
+        """
+        self.ensure_bucket(bucket)
+        # minio-py only exposes multipart uploads to its own put_object
+        upload_id = self._client._create_multipart_upload(
+            bucket, key, {"Content-Type": content_type}
+        )
+        urls = [
+            self._public.get_presigned_url(
+                "PUT", bucket, key, expires=expires,
+                extra_query_params={"uploadId": upload_id, "partNumber": str(n)},
+            )
+            for n in range(1, parts + 1)
+        ]
+        return upload_id, urls
+
+    @timed(MINIO_DURATION, MINIO_ERRORS, operation="complete")
+    def complete_multipart(
+        self, bucket: str, key: str, upload_id: str, parts: List[Tuple[int, str]]
+    ) -> None:
+        """
+        Assemble a multipart upload from its `(part number, ETag)` pairs.
+        """
+        self._client._complete_multipart_upload(
+            bucket, key, upload_id,
+            [Part(n, etag.strip('"')) for n, etag in sorted(parts)],
+        )
+
+    def abort_multipart(self, bucket: str, key: str, upload_id: str) -> None:
+        """
+        Drop a multipart upload and the parts uploaded so far.
+        """
+        try:
+            self._client._abort_multipart_upload(bucket, key, upload_id)
+        except S3Error as exc:
+            logger.error(f"Error aborting upload {upload_id} of {key}: {exc}")
+
+    def iter_object(
+        self, bucket: str, key: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """
+        Stream `bucket/key` as an iterator of chunks of at most `chunk_size` bytes.
+
+        The connection is released once the iterator is exhausted or closed.
+        """
+        response = self._client.get_object(bucket, key)
+        try:
+            yield from response.stream(chunk_size)
+        finally:
+            response.close()
+            response.release_conn()
+
+    @timed(MINIO_DURATION, MINIO_ERRORS, operation="open")
+    def open_object(
+        self, bucket: str, key: str, max_memory: int = SPOOL_MAX_MEMORY
+    ) -> IO[bytes]:
+        """
+        Download `bucket/key` into a spooled temp file and return it rewound.
+
+        Objects up to `max_memory` bytes stay in memory, larger ones are
+        written to disk chunk by chunk, so peak RSS does not grow with the
+        object size.
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        try:
+            for chunk in self.iter_object(bucket, key):
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool
+
+    @timed(MINIO_DURATION, MINIO_ERRORS, operation="map")
+    def map_object(self, bucket: str, key: str) -> mmap.mmap:
+        """
+        Download `bucket/key` into an anonymous local file and memory-map it.
+
+        The returned mapping is read-only, supports the file API (read / seek /
+        tell) and the buffer protocol, and is paged in by the OS on demand.
+        """
+        with tempfile.TemporaryFile() as f:
+            for chunk in self.iter_object(bucket, key):
+                f.write(chunk)
+            f.flush()
+            if f.tell() == 0:
+                # empty files cannot be mapped
+                raise ValueError(f"Object {bucket}/{key} is empty")
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @timed(MINIO_DURATION, MINIO_ERRORS, operation="download")
+    def download_object(self, bucket: str, key: str, path: str) -> None:
+        """
+        Stream `bucket/key` to the local file at `path`.
+        """
+        self._client.fget_object(bucket, key, path)
+
+    @timed(MINIO_DURATION, MINIO_ERRORS, operation="delete")
     def delete_object(self, bucket: str, key: str) -> None:
         """
         Delete the object at `bucket/key`.
@@ -110,27 +340,19 @@ class MinioClient:
 # ───────────────── helpers ───────────────── #
 def _length_of(stream: IO[bytes]) -> int:
     """
-    Ensure we know the stream length (MinIO needs it).
+    Return the number of bytes left in the stream, as MinIO expects it.
 
     • If the object is seek-able → keep position, seek to end.
-    • Otherwise → read entire object into memory and return its size.
+    • Otherwise → -1, MinIO then streams it part by part until EOF.
     """
-    pos = None
     try:
         pos = stream.tell()
         stream.seek(0, io.SEEK_END)
         size = stream.tell()
         stream.seek(pos)
-        return size
+        return size - pos
     except (AttributeError, OSError):
-        pass  # not seek-able
-
-    # fallback – load into BytesIO
-    data = stream.read()
-    size = len(data)
-    stream.close()
-    stream = io.BytesIO(data)  # replace original
-    return size
+        return -1  # not seek-able
 
 
 # ─────────────── demo ─────────────── #
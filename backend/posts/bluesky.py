@@ -7,21 +7,43 @@
 #   BSKY_APP_PASSWORD = "xxxx-xxxx-xxxx-xxxx"
 #
 # If you prefer, pass credentials explicitly via BlueskyCredentials.
+#
+# Sessions are saved in the database and restored on the next start, and the
+# access JWT is refreshed in the background every BSKY_REFRESH_INTERVAL
+# seconds (default 1800) so posting never has to log in or refresh.
+#
+# Media can be staged as blobs ahead of a post; the PDS garbage collects
+# blobs no record references, so staged blobs are only trusted for an hour.
+# A post carries up to 4 images or one video; the blobs of a post are
+# uploaded at the same time.
 
+import os
+import threading
+import time
+import weakref
 from dataclasses import dataclass
-from typing import Optional
-from atproto import Client
+from typing import List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from atproto import Client, SessionEvent, models
+from atproto_client.exceptions import InvokeTimeoutError, NetworkError
+from django.db import connections
 import logging
 
 from .models import IntegrationSecrets
+from .credentials import load_session, save_session
+from .dispatch import Dispatcher
 
 if __name__ == "__main__":
-    from post import MediaObject
+    from post import MediaObject, MediaPost, images_or_video, media_list, staged_list
 else:
-    from .post import MediaObject
+    from .post import MediaObject, MediaPost, images_or_video, media_list, staged_list
 
 logger = logging.getLogger("posts")
 
+REFRESH_INTERVAL = float(os.getenv("BSKY_REFRESH_INTERVAL", "1800"))
+
+_uploads = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bsky-upload")
+
 
 # ──────────────────────────────────────────────────────────────────────────────
 #  Data classes
@@ -35,7 +57,7 @@ class BlueskyCredentials:
 # ──────────────────────────────────────────────────────────────────────────────
 #  Singleton wrapper
 # ──────────────────────────────────────────────────────────────────────────────
-class Bluesky:
+class Bluesky(MediaPost):
     """
     Minimal wrapper around atproto.Client that can:
         • upload a blob (image / video) and
@@ -43,73 +65,203 @@ class Bluesky:
 
     Usage
     -----
-    bsky = Bluesky.instance()               # env-based singleton
+    bsky = Bluesky.instance()               # shared, logged-in instance
     bsky.post("Hello world!")
 
     # with an image
     from pathlib import Path, PurePath
     with Path("cat.png").open("rb") as f:
-        media = MediaObject("cat.png", f, "image/png")
-        bsky.post("Here's my cat", media)
+        media = MediaObject("cat.png", "image/png", f)
+        bsky.post("Here's my cat", [media])
     """
 
-    _inst: Optional["Bluesky"] = None
+    platform = "bluesky"
+    staged_ttl = 3600
+    max_media = 4
 
-    def __init__(self, credentials: BlueskyCredentials):
-        self.client = Client()
-        self.client.login(credentials.handle, credentials.app_password)
+    def __init__(self, credentials: BlueskyCredentials | None = None):
+        self.credentials = credentials
+        if credentials is not None:
+            self.client = Client()
+            self.client.on_session_change(self._on_session_change)
+            http = getattr(self.client.request, "_client", None)   # httpx.Client
+            if http is not None:
+                http.event_hooks["response"].append(_observe_limits)
+            self._login()
+            _start_refresher(self)
+        else:
+            self.client = None
 
-    # -------- convenience singleton -----------------
-    @classmethod
-    def instance(cls) -> "Bluesky":
-        if cls._inst is not None:
-            return cls._inst
+    # -------- session handling ----------------------
+    def _login(self):
+        """
+        Import the saved session if there is one, otherwise create a new one.
+        createSession is heavily rate-limited, so it is the last resort.
+        """
+        saved = load_session(self.platform, self.credentials.handle)
+        if saved and saved.get("session"):
+            try:
+                self.client.login(session_string=saved["session"])
+                return
+            except Exception as e:
+                logger.info(f"Saved Bluesky session was rejected, logging in again: {e}")
+        self.client.login(self.credentials.handle, self.credentials.app_password)
+
+    def _on_session_change(self, event, session):
+        """Persist every new or refreshed session for the next process."""
+        if event in (SessionEvent.CREATE, SessionEvent.REFRESH):
+            save_session(self.platform, self.credentials.handle, {"session": session.export()})
 
+    def refresh(self):
+        """
+        Refresh the access JWT now, falling back to a full login if the
+        refresh token is no longer accepted.
+        """
         try:
-            secrets = IntegrationSecrets.objects.latest("created_at")
-        except IntegrationSecrets.DoesNotExist:
-            return super().instance()
+            # atproto only refreshes lazily on the next request otherwise
+            self.client._refresh_and_set_session()
+        except Exception as e:
+            logger.warning(f"Bluesky session refresh failed, logging in again: {e}")
+            self.client.login(self.credentials.handle, self.credentials.app_password)
 
-        creds = BlueskyCredentials(
+    # -------- credentials ---------------------------
+    @classmethod
+    def credentials_from(cls, secrets: IntegrationSecrets) -> Optional[BlueskyCredentials]:
+        if not secrets.bsky_handle:
+            return None
+        return BlueskyCredentials(
             handle=secrets.bsky_handle,
             app_password=secrets.bsky_app_password,
         )
-        cls._inst = cls(creds)
-        return cls._inst
 
     @classmethod
-    def reset(cls):
+    def retry_after(cls, error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+        if status == 429:
+            reset = (response.headers or {}).get("ratelimit-reset")
+            return max(float(reset) - time.time(), 0) if reset else 60
+        if (status and status >= 500) or isinstance(error, (NetworkError, InvokeTimeoutError)):
+            return 0
+        return super().retry_after(error)
+
+    # -------- public API ----------------------------
+    @classmethod
+    def select_media(cls, media):
+        return images_or_video(media, cls.max_media)
+
+    def stage(self, media: List[MediaObject]) -> Optional[Future]:
         """
-        Reset the singleton instance.  Use this if you change credentials.
+        Upload `media` as blobs without posting them. The Future resolves to
+        `[{"kind": "image" | "video", "blob": <blob ref>}, ...]`.
         """
-        cls._inst = None
+        if self.client is None:
+            raise Exception("Bluesky client is not initialized. Please provide credentials.")
+        media = self.select_media(media_list(media))
+        if not media or any(_kind(m) is None for m in media):
+            return None  # rejected again, with an error, when posting
 
-    # -------- public API ----------------------------
-    def post(self, text: str, media: MediaObject | None = None, alt: str = ""):
+        done: Future = Future()
+        done.set_result(self._upload_blobs(media))
+        return done
+
+    def post(
+        self,
+        text: str,
+        media: List[MediaObject] | None = None,
+        alt: str = "",
+        staged: list | None = None,
+    ) -> str:
         """
         Publish `text` to your feed.  If `media` supplied, attach it.
 
         Parameters
         ----------
-        text   : str            – post text
-        media  : MediaObject    – optional image or video
-        alt    : str            – alt-text for accessibility (defaults to media.name)
+        text   : str                – post text
+        media  : List[MediaObject]  – optional images (up to 4) or a video
+        alt    : str                – alt-text for accessibility
+        staged : list               – blobs uploaded earlier by `stage`, used instead of media
+
+        Returns the AT URI of the new post.
         """
+        if self.client is None:
+            raise Exception("Bluesky client is not initialized. Please provide credentials.")
 
-        if media is not None:
-            media.media.seek(0)  # Reset the file pointer to the beginning
-            b = media.media.read()
-            if "image/" in media.mime_type:
-                self.client.send_image(text, b, image_alt=alt)
-            elif "video/" in media.mime_type:
-                self.client.send_video(text, b, video_alt=alt)
-            else:
-                logger.warning(
-                    f"Unsupported media type: {media.mime_type}.  "
-                    "Only image and video types are supported."
-                )
+        if staged is not None:
+            refs = staged_list(staged)
         else:
-            self.client.send_post(text)
+            media = self.select_media(media_list(media))
+            for m in media:
+                if _kind(m) is None:
+                    raise ValueError(
+                        f"Unsupported media type: {m.mime_type}.  "
+                        "Only image and video types are supported."
+                    )
+            refs = self._upload_blobs(media)
+        if not refs:
+            return self.client.send_post(text).uri
+        return self.client.send_post(text, embed=_embed(refs, alt)).uri
+
+    def _upload_blobs(self, media: List[MediaObject]) -> List[dict]:
+        """Upload every item as a blob at the same time, in order."""
+
+        def upload(m: MediaObject) -> dict:
+            m.media.seek(0)  # Reset the file pointer to the beginning
+            blob = self.client.upload_blob(m.media.read()).blob
+            return {"kind": _kind(m), "blob": blob.model_dump(mode="json", by_alias=True)}
+
+        if len(media) == 1:
+            return [upload(media[0])]
+        return list(_uploads.map(upload, media))
+
+
+def _kind(media: MediaObject) -> Optional[str]:
+    if "image/" in media.mime_type:
+        return "image"
+    if "video/" in media.mime_type:
+        return "video"
+    return None
+
+
+def _embed(refs: List[dict], alt: str = ""):
+    """The embed of a post showing the uploaded blobs."""
+    blobs = [models.BlobRef.model_validate(ref["blob"]) for ref in refs]
+    if refs[0]["kind"] == "video":
+        return models.AppBskyEmbedVideo.Main(video=blobs[0], alt=alt)
+    return models.AppBskyEmbedImages.Main(
+        images=[models.AppBskyEmbedImages.Image(alt=alt, image=blob) for blob in blobs]
+    )
+
+
+def _observe_limits(response) -> None:
+    """Report the record creation limits the PDS sends with every response."""
+    if "com.atproto.repo.createRecord" in str(response.url):
+        Dispatcher.instance().observe(Bluesky.platform, response.headers)
+
+
+def _start_refresher(bsky: Bluesky) -> None:
+    """
+    Refresh the session of `bsky` every REFRESH_INTERVAL seconds until the
+    instance is garbage collected (e.g. replaced after new credentials).
+    """
+    ref = weakref.ref(bsky)
+    stop = threading.Event()
+    weakref.finalize(bsky, stop.set)
+
+    def run():
+        while not stop.wait(REFRESH_INTERVAL):
+            inst = ref()
+            if inst is None:
+                return
+            try:
+                inst.refresh()
+            except Exception as e:
+                logger.error(f"Bluesky session refresh failed: {e}")
+            finally:
+                del inst
+                connections.close_all()
+
+    threading.Thread(target=run, name="bsky-refresh", daemon=True).start()
 
 
 # ──────────────────────────────────────────────────────────────────────────────
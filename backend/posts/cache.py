@@ -0,0 +1,327 @@
+"""
+Disk-backed, content-addressed cache in front of MinioClient.
+
+export MEDIA_CACHE_DIR="/var/cache/vcms"        # defaults to <tmp>/vcms-media-cache
+export MEDIA_CACHE_MAX_BYTES="2147483648"       # total size before LRU eviction
+"""
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import IO, Dict, Iterator, Optional, Tuple
+import logging
+
+from .blob import MinioClient
+
+logger = logging.getLogger("posts")
+
+
+@dataclass
+class CacheEntry:
+    etag: str
+    digest: str  # sha256 of the object content
+    size: int
+
+
+class MediaCache:
+    """
+    Thread-safe Singleton cache of MinIO objects on local disk.
+
+    Objects are stored once per content hash under `<dir>/objects/`, and
+    `bucket/key` is mapped to its hash together with the ETag seen at download
+    time. Objects whose content hash the caller knows (assets with a
+    `sha256`) are served from disk without asking MinIO; for all others every
+    lookup revalidates the ETag with a HEAD request, so a changed object is
+    fetched again while an unchanged one is read from disk. The least
+    recently used blobs are evicted once the cache grows past `max_bytes`.
+
+    The directory is shared by every process on the host (web workers, the
+    scheduler). Changes to the index are made under an `flock` on
+    `<dir>/index.lock`, after merging what the other processes saved, and
+    eviction works on that merged state. The index also records the size
+    and last use of every blob, so merging reads one file; the blobs
+    themselves are only listed at start-up, when the index cannot be read,
+    or after a blob it lists turned out to be gone. Reads are stamped on the
+    blob's atime, which eviction checks before dropping a blob, so reads by
+    processes that did not save since still count.
+
+    Usage
+    -----
+    cache = MediaCache.instance()
+    with cache.open("media", "sha256/1a2b3c4d.jpg", digest="1a2b3c4d") as f:
+        data = f.read()
+    print(cache.stats())    # {'hits': 0, 'misses': 1, ...}
+    """
+
+    _lock   = threading.RLock()
+    _inst: Optional["MediaCache"] = None
+
+    # ---------------- singleton ctor ---------------- #
+    def __init__(self, directory: str | None = None, max_bytes: int | None = None):
+        if MediaCache._inst is not None:               # enforce singleton
+            raise RuntimeError("Use MediaCache.instance()")
+
+        self.directory = directory or os.getenv(
+            "MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "vcms-media-cache")
+        )
+        self.max_bytes = max_bytes or int(
+            os.getenv("MEDIA_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024))
+        )
+        self._objects = os.path.join(self.directory, "objects")
+        self._index_path = os.path.join(self.directory, "index.json")
+        self._lock_path = os.path.join(self.directory, "index.lock")
+        os.makedirs(self._objects, exist_ok=True)
+
+        self._index: Dict[str, CacheEntry] = {}           # "bucket/key" → entry
+        self._lru: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()  # digest → (last use, size)
+        self._used: Dict[str, float] = {}   # blobs this process used since the last save
+        self._rescan = True                 # list the blobs on the next load
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self._shared():
+            self._load()
+            self._save()
+
+    @classmethod
+    def instance(cls) -> "MediaCache":
+        with cls._lock:
+            if cls._inst is None:
+                cls._inst = cls()
+        return cls._inst
+
+    # ----------------------- API -------------------- #
+    def open(self, bucket: str, key: str, digest: str | None = None) -> IO[bytes]:
+        """
+        Return `bucket/key` as a binary file opened from the local cache,
+        downloading it from MinIO first if it is missing or stale.
+
+        With the sha256 `digest` of the object given, a cached copy with that
+        content is used as is, without a HEAD request to MinIO.
+        """
+        client = MinioClient.instance()
+        etag = None if digest else client.stat_object(bucket, key).etag
+        name = _name(bucket, key)
+
+        with self._lock:
+            entry = self._index.get(name)
+            if entry is not None and (entry.digest == digest if digest else entry.etag == etag):
+                f = self._open_blob(entry.digest)
+                if f is not None:
+                    self.hits += 1
+                    return f
+            if digest:
+                # the same content cached under another key
+                f = self._open_blob(digest)
+                if f is not None:
+                    self.hits += 1
+                    self._store(name, CacheEntry(etag="", digest=digest, size=os.fstat(f.fileno()).st_size))
+                    return f
+            self.misses += 1
+
+        entry = self._download(client, bucket, key, etag or "")
+        with self._lock:
+            f = open(self._path(entry.digest), "rb")
+            self._store(name, entry)
+        return f
+
+    def invalidate(self, bucket: str, key: str) -> None:
+        """
+        Drop `bucket/key` from the index. Its blob is removed once no other
+        key refers to the same content.
+        """
+        with self._lock, self._shared():
+            self._load()
+            entry = self._index.pop(_name(bucket, key), None)
+            if entry is None:
+                return
+            if not any(e.digest == entry.digest for e in self._index.values()):
+                self._remove(entry.digest)
+            self._save()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit / miss / eviction counters and the current cache size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    # ------------ internal helpers ------------ #
+    def _path(self, digest: str) -> str:
+        return os.path.join(self._objects, digest)
+
+    @contextmanager
+    def _shared(self) -> Iterator[None]:
+        """Hold the lock on the index files shared with the other processes."""
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _open_blob(self, digest: str) -> Optional[IO[bytes]]:
+        """Open a cached blob, or None if it was evicted (maybe by another process)."""
+        path = self._path(digest)
+        try:
+            f = open(path, "rb")
+            os.utime(path)  # keeps the LRU order across processes and restarts
+        except FileNotFoundError:
+            # the index listed it: it may be out of step with the disk
+            self._rescan = self._rescan or digest in self._lru
+            self._forget(digest)
+            return None
+        self._touch(digest)
+        return f
+
+    def _store(self, name: str, entry: CacheEntry) -> None:
+        """Index `name`, merged with what other processes saved, then evict and save."""
+        with self._shared():
+            self._load()
+            self._index[name] = entry
+            self._touch(entry.digest, entry.size)
+            self._evict()
+            self._save()
+
+    def _download(self, client: MinioClient, bucket: str, key: str, etag: str) -> CacheEntry:
+        """Stream the object into the cache, hashing it on the way."""
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self._objects, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in client.iter_object(bucket, key):
+                    sha.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            digest = sha.hexdigest()
+            os.replace(tmp, self._path(digest))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return CacheEntry(etag=etag, digest=digest, size=size)
+
+    def _touch(self, digest: str, size: int | None = None) -> None:
+        """Mark `digest` as most recently used, adding it if unknown."""
+        if digest in self._lru:
+            _, size = self._lru.pop(digest)
+        elif size is not None:
+            self._size += size
+        else:
+            return
+        now = time.time()
+        self._lru[digest] = (now, size)
+        self._used[digest] = now
+
+    def _evict(self) -> None:
+        """Remove least recently used blobs until the cache fits `max_bytes`."""
+        # never evict the blob that was just used, even if it alone is too big
+        while self._size > self.max_bytes and len(self._lru) > 1:
+            digest, (used, size) = next(iter(self._lru.items()))
+            try:
+                touched = os.stat(self._path(digest)).st_atime
+            except FileNotFoundError:
+                touched = used
+            if touched > used:
+                # another process read it since it last saved the index
+                self._lru[digest] = (touched, size)
+                self._lru = OrderedDict(sorted(self._lru.items(), key=lambda b: b[1][0]))
+                continue
+            self._forget(digest)
+            self.evictions += 1
+
+    def _forget(self, digest: str) -> None:
+        """Remove a blob and every index entry that points at it."""
+        for name in [n for n, e in self._index.items() if e.digest == digest]:
+            del self._index[name]
+        self._remove(digest)
+
+    def _remove(self, digest: str) -> None:
+        blob = self._lru.pop(digest, None)
+        if blob is not None:
+            self._size -= blob[1]
+        self._used.pop(digest, None)
+        try:
+            os.remove(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _load(self) -> None:
+        """
+        Rebuild the index and LRU order as saved by this and every other
+        process, plus the blobs this process used since. Called with the
+        index lock held.
+        """
+        self._index.clear()
+        self._lru.clear()
+        self._size = 0
+        try:
+            with open(self._index_path) as f:
+                raw = json.load(f)
+            entries, blobs = raw["entries"], {d: tuple(b) for d, b in raw["blobs"].items()}
+        except (FileNotFoundError, ValueError, KeyError, TypeError, AttributeError):
+            entries, blobs = {}, None
+        if blobs is None or self._rescan:
+            blobs = self._scan()
+            self._rescan = False
+        for digest, used in self._used.items():
+            if digest in blobs and used > blobs[digest][0]:
+                blobs[digest] = (used, blobs[digest][1])
+
+        for name, e in entries.items():
+            if e.get("digest") in blobs:
+                self._index[name] = CacheEntry(**e)
+        for digest, (used, size) in sorted(blobs.items(), key=lambda b: b[1][0]):
+            self._lru[digest] = (used, size)
+            self._size += size
+        self._evict()
+
+    def _scan(self) -> Dict[str, Tuple[float, int]]:
+        """
+        Last use and size of every blob on disk; interrupted downloads are
+        removed. Called with the index lock held.
+        """
+        blobs: Dict[str, Tuple[float, int]] = {}
+        for name in os.listdir(self._objects):
+            path = self._path(name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue  # a download of another process was just renamed
+            if name.endswith(".part"):
+                if time.time() - st.st_mtime > 3600:
+                    os.remove(path)  # interrupted download
+                continue
+            blobs[name] = (st.st_atime, st.st_size)
+        return blobs
+
+    def _save(self) -> None:
+        """Persist the index atomically. Called with the index lock held."""
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "entries": {n: asdict(e) for n, e in self._index.items()},
+                "blobs": {d: list(b) for d, b in self._lru.items()},
+            }, f)
+        os.replace(tmp, self._index_path)
+        self._used.clear()
+
+
+# ───────────────── helpers ───────────────── #
+def _name(bucket: str, key: str) -> str:
+    return f"{bucket}/{key}"
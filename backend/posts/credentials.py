@@ -0,0 +1,166 @@
+"""
+Process-wide registry of integration secrets and authenticated clients.
+
+export CREDENTIALS_CHECK_INTERVAL="30"   # seconds between secrets version checks
+export LOGIN_RETRY_INTERVAL="300"        # seconds before a failed login is retried
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import astuple
+from typing import Callable, Dict, Optional, Tuple
+import logging
+
+from .models import IntegrationSecrets, PlatformSession
+
+logger = logging.getLogger("posts")
+
+CHECK_INTERVAL = float(os.getenv("CREDENTIALS_CHECK_INTERVAL", "30"))
+LOGIN_RETRY_INTERVAL = float(os.getenv("LOGIN_RETRY_INTERVAL", "300"))
+
+
+class CredentialRegistry:
+    """
+    Thread-safe Singleton caching the active `IntegrationSecrets` and the
+    platform clients built from them.
+
+    The secrets row is loaded once and then only revalidated by primary key
+    every `CHECK_INTERVAL` seconds, so new credentials saved by another
+    process are still picked up. Clients are keyed by platform *and*
+    credentials: invalidating the secrets does not log in again unless the
+    credentials of that platform actually changed. A failed login is cached
+    too and only retried after `LOGIN_RETRY_INTERVAL` seconds.
+
+    Usage
+    -----
+    reg = CredentialRegistry.instance()
+    secrets = reg.secrets()                          # None if none saved yet
+    poster = reg.client("x", creds, lambda: Twitter(creds))
+    reg.invalidate()                                 # after saving new secrets
+    """
+
+    _lock   = threading.RLock()
+    _inst: Optional["CredentialRegistry"] = None
+
+    # ---------------- singleton ctor ---------------- #
+    def __init__(self):
+        if CredentialRegistry._inst is not None:        # enforce singleton
+            raise RuntimeError("Use CredentialRegistry.instance()")
+
+        self._secrets: Optional[IntegrationSecrets] = None
+        self._checked_at = 0.0
+        self._loaded = False
+        # platform → (credentials key, client)
+        self._clients: Dict[str, Tuple[tuple, object]] = {}
+        # platform → (credentials key, failure time, error)
+        self._failures: Dict[str, Tuple[tuple, float, Exception]] = {}
+        self._login_locks: Dict[str, threading.Lock] = {}
+
+    @classmethod
+    def instance(cls) -> "CredentialRegistry":
+        with cls._lock:
+            if cls._inst is None:
+                cls._inst = cls()
+        return cls._inst
+
+    # ----------------------- API -------------------- #
+    def secrets(self) -> Optional[IntegrationSecrets]:
+        """Return the latest secrets, hitting the database only when stale."""
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded and now - self._checked_at < CHECK_INTERVAL:
+                return self._secrets
+
+            latest = (
+                IntegrationSecrets.objects.order_by("-created_at")
+                .values_list("pk", flat=True)
+                .first()
+            )
+            current = self._secrets.pk if self._secrets is not None else None
+            if not self._loaded or latest != current:
+                self._secrets = (
+                    IntegrationSecrets.objects.get(pk=latest) if latest is not None else None
+                )
+                self._loaded = True
+            self._checked_at = now
+            return self._secrets
+
+    def client(self, platform: str, credentials, factory: Callable[[], object]):
+        """
+        Return the client of `platform` for `credentials`, building it with
+        `factory` (which typically logs in) only when none exists yet.
+
+        Raises:
+            Exception: The error of the last failed login, until it may be retried.
+        """
+        key = astuple(credentials)
+        with self._lock:
+            cached = self._clients.get(platform)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            lock = self._login_locks.setdefault(platform, threading.Lock())
+
+        # one login per platform at a time, without blocking other platforms
+        with lock:
+            with self._lock:
+                cached = self._clients.get(platform)
+                if cached is not None and cached[0] == key:
+                    return cached[1]
+                failure = self._failures.get(platform)
+                if (
+                    failure is not None
+                    and failure[0] == key
+                    and time.monotonic() - failure[1] < LOGIN_RETRY_INTERVAL
+                ):
+                    raise failure[2]
+
+            try:
+                client = factory()
+            except Exception as e:
+                logger.error(f"Login to {platform} failed: {e}")
+                with self._lock:
+                    self._failures[platform] = (key, time.monotonic(), e)
+                raise
+
+            with self._lock:
+                self._failures.pop(platform, None)
+                self._clients[platform] = (key, client)
+            return client
+
+    def discard(self, platform: str) -> None:
+        """Forget the client of `platform`, e.g. after its session was rejected."""
+        with self._lock:
+            self._clients.pop(platform, None)
+
+    def invalidate(self) -> None:
+        """Reload the secrets on next use. Clients are kept if their credentials did not change."""
+        with self._lock:
+            self._loaded = False
+            self._failures.clear()
+
+
+# ───────────────── saved sessions ───────────────── #
+def load_session(platform: str, account: str):
+    """Return the saved session data of `platform/account`, or None."""
+    try:
+        return (
+            PlatformSession.objects.filter(platform=platform, account=account)
+            .values_list("data", flat=True)
+            .first()
+        )
+    except Exception as e:
+        logger.warning(f"Could not load the {platform} session of {account}: {e}")
+        return None
+
+
+def save_session(platform: str, account: str, data) -> None:
+    """Store the session data of `platform/account`, replacing the previous one."""
+    try:
+        PlatformSession.objects.update_or_create(
+            platform=platform, account=account, defaults={"data": data}
+        )
+    except Exception as e:
+        logger.warning(f"Could not save the {platform} session of {account}: {e}")
+
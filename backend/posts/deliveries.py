@@ -0,0 +1,123 @@
+"""
+Buffered, bulk writes of `Delivery` rows for the dispatcher.
+
+export DELIVERY_FLUSH_INTERVAL="1"     # seconds between bulk writes
+
+The dispatch workers only update an in-memory buffer; a single thread
+upserts everything that changed since the last flush in one statement, so
+recording deliveries costs the workers no database round trips.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import logging
+
+from django.db import connections
+
+from .models import Delivery, Post
+
+logger = logging.getLogger("posts")
+
+FLUSH_INTERVAL = float(os.getenv("DELIVERY_FLUSH_INTERVAL", "1"))
+
+_UPDATE_FIELDS = ["state", "remote_id", "attempts", "latency", "error", "updated_at"]
+
+
+class DeliveryLog:
+    """
+    Thread-safe Singleton buffering delivery state changes.
+
+    Only the latest state of every (post, social, occurrence) is kept until
+    the next flush.
+
+    Usage
+    -----
+    log = DeliveryLog.instance()
+    log.record(post_id, "x", occurrence, "delivered", attempts=1, latency=0.4, remote_id="123")
+    log.flush()                                   # normally done by its thread
+    """
+
+    _lock   = threading.RLock()
+    _inst: Optional["DeliveryLog"] = None
+
+    # ---------------- singleton ctor ---------------- #
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        if DeliveryLog._inst is not None:             # enforce singleton
+            raise RuntimeError("Use DeliveryLog.instance()")
+        self.interval = interval
+        self._pending: Dict[Tuple[int, str, datetime], Delivery] = {}
+        self._buf_lock = threading.Lock()
+        threading.Thread(target=self._run, name="delivery-log", daemon=True).start()
+
+    @classmethod
+    def instance(cls) -> "DeliveryLog":
+        with cls._lock:
+            if cls._inst is None:
+                cls._inst = cls()
+        return cls._inst
+
+    # ----------------------- API -------------------- #
+    def record(
+        self,
+        post_id: int,
+        social: str,
+        occurrence: datetime,
+        state: str,
+        attempts: int = 0,
+        latency: Optional[float] = None,
+        remote_id: str = "",
+        error: str = "",
+    ) -> None:
+        delivery = Delivery(
+            post_id=post_id,
+            social=social,
+            occurrence=occurrence,
+            state=state,
+            attempts=attempts,
+            latency=latency,
+            remote_id=remote_id or "",
+            error=error,
+        )
+        with self._buf_lock:
+            self._pending[(post_id, social, occurrence)] = delivery
+
+    def flush(self) -> int:
+        """Write the buffered deliveries. Returns how many were written."""
+        with self._buf_lock:
+            batch, self._pending = list(self._pending.values()), {}
+        if not batch:
+            return 0
+        # posts deleted in the meantime would fail the whole statement
+        alive = set(
+            Post.objects.filter(id__in={d.post_id for d in batch}).values_list("id", flat=True)
+        )
+        batch = [d for d in batch if d.post_id in alive]
+        try:
+            Delivery.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=["post", "social", "occurrence"],
+                update_fields=_UPDATE_FIELDS,
+            )
+        except Exception:
+            # keep them for the next flush unless a newer state arrived
+            with self._buf_lock:
+                for d in batch:
+                    self._pending.setdefault((d.post_id, d.social, d.occurrence), d)
+            raise
+        return len(batch)
+
+    # ------------ internal helpers ------------ #
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error writing deliveries: {e}")
+            finally:
+                connections.close_all()
@@ -0,0 +1,308 @@
+"""
+Per-platform dispatch queues with rate limiting, retries and a dead-letter table.
+
+export DISPATCH_WORKERS="2"          # posts sent concurrently per platform
+export DISPATCH_MAX_ATTEMPTS="5"     # attempts before a post is dead-lettered
+export DISPATCH_BACKOFF_BASE="2"     # seconds, doubled after every failed attempt
+export DISPATCH_BACKOFF_MAX="900"    # upper bound of a single backoff
+
+Every platform has its own queue, worker threads and token bucket. The
+bucket starts from `DEFAULT_LIMITS` and is then driven by the rate limit
+headers of the platform's responses, so a burst of scheduled posts is spread
+over what the API allows instead of failing. Transient errors are retried
+with exponential backoff and full jitter; a post that still fails, or fails
+in a way retrying cannot fix, is stored in `DeadLetter`. Every state change
+is recorded as a `Delivery` (see `posts.deliveries`).
+
+Queues and pending retries only live in the memory of the sending process.
+A delivery waiting for its next attempt when that process exits (e.g. a
+recycled or restarted gunicorn worker) is not retried elsewhere; it is left
+`queued` or `retrying` in `Delivery`.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+import logging
+
+from django.db import connections
+
+from .deliveries import DeliveryLog
+from .metrics import DELIVERY_LATENCY, DISPATCH_QUEUE
+from .models import DeadLetter
+from .post import PostResult
+
+logger = logging.getLogger("posts")
+
+WORKERS = int(os.getenv("DISPATCH_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE = float(os.getenv("DISPATCH_BACKOFF_BASE", "2"))
+BACKOFF_MAX = float(os.getenv("DISPATCH_BACKOFF_MAX", "900"))
+
+# platform → (posts per second, burst) until the platform reports its limits
+DEFAULT_LIMITS: Dict[str, Tuple[float, int]] = {
+    "x": (200 / 900, 5),
+    "bluesky": (1.0, 10),
+    "instagram": (1 / 30, 2),
+}
+
+# rate limit headers of X (x-rate-limit-*) and Bluesky (ratelimit-*)
+_HEADER_PREFIXES = ("x-rate-limit-", "ratelimit-")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `observe()` resets it from rate limit headers:
+    the calls left in the window are spread evenly until the window resets.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> float:
+        """Take a token. Returns 0 on success, else the seconds to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def observe(self, headers) -> None:
+        """Adjust to the `limit` / `remaining` / `reset` headers of a response."""
+        limit, remaining, reset = (_header(headers, name) for name in ("limit", "remaining", "reset"))
+        if remaining is None or reset is None:
+            return
+        window = max(reset - time.time(), 1.0)
+        with self._lock:
+            self.tokens = min(self.tokens, remaining)
+            if limit:
+                self.capacity = max(1, min(int(limit), self.capacity))
+            if remaining > 0:
+                self.rate = remaining / window
+            else:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + window)
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for `seconds`, e.g. after a 429."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+@dataclass
+class Dispatch:
+    """One post on its way to one platform."""
+    post_id: int
+    social: str
+    send: Callable[[], object]                     # one attempt, returns the remote id
+    retry_after: Callable[[Exception], Optional[float]]
+    attempts: int = 0
+    occurrence: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started: float = field(default_factory=time.monotonic)
+    result: Future = field(default_factory=Future)
+
+    def record(self, state: str, remote_id: str = "", error: str = "", done: bool = False) -> None:
+        latency = time.monotonic() - self.started if done else None
+        if latency is not None:
+            DELIVERY_LATENCY.labels(self.social, state).observe(latency)
+        DeliveryLog.instance().record(
+            self.post_id,
+            self.social,
+            self.occurrence,
+            state,
+            attempts=self.attempts,
+            latency=latency,
+            remote_id=remote_id,
+            error=error,
+        )
+
+
+class PlatformQueue:
+    """Delay queue of one platform, drained by `WORKERS` threads through its bucket."""
+
+    def __init__(self, platform: str, bucket: TokenBucket, workers: int = WORKERS):
+        self.platform = platform
+        self.bucket = bucket
+        self._heap: list = []   # (due, seq, dispatch)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        for i in range(workers):
+            threading.Thread(
+                target=self._run, name=f"dispatch-{platform}-{i}", daemon=True
+            ).start()
+
+    def put(self, dispatch: Dispatch, delay: float = 0.0) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), dispatch))
+            self._cond.notify()
+        DISPATCH_QUEUE.labels(self.platform).inc()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    # ------------ internal helpers ------------ #
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, dispatch = heapq.heappop(self._heap)
+            DISPATCH_QUEUE.labels(self.platform).dec()
+            while (wait := self.bucket.take()) > 0:
+                time.sleep(wait)
+            self._attempt(dispatch)
+
+    def _attempt(self, dispatch: Dispatch) -> None:
+        dispatch.attempts += 1
+        try:
+            remote = dispatch.send()
+        except Exception as e:
+            self._failed(dispatch, e)
+            return
+        finally:
+            # posters may touch the database (saved sessions) from this thread
+            connections.close_all()
+        if isinstance(remote, Future):
+            # the platform finishes the post in the background (X media processing)
+            remote.add_done_callback(lambda f: self._finished(dispatch, f))
+        else:
+            self._delivered(dispatch, remote)
+
+    def _finished(self, dispatch: Dispatch, remote: Future) -> None:
+        error = remote.exception()
+        if error is not None:
+            self._failed(dispatch, error)
+        else:
+            self._delivered(dispatch, remote.result())
+
+    def _delivered(self, dispatch: Dispatch, remote_id) -> None:
+        remote_id = str(remote_id) if remote_id is not None else ""
+        dispatch.record("delivered", remote_id=remote_id, done=True)
+        dispatch.result.set_result(
+            PostResult(dispatch.social, True, None, time.monotonic() - dispatch.started,
+                       attempts=dispatch.attempts, remote_id=remote_id)
+        )
+
+    def _failed(self, dispatch: Dispatch, error: BaseException) -> None:
+        wait = dispatch.retry_after(error) if isinstance(error, Exception) else None
+        if wait is not None and dispatch.attempts < MAX_ATTEMPTS:
+            if wait > 0:
+                # the limit applies to every post of the platform
+                self.bucket.pause(wait)
+            delay = max(wait, backoff(dispatch.attempts))
+            logger.warning(
+                f"Posting {dispatch.post_id} to {self.platform} failed "
+                f"(attempt {dispatch.attempts}), retrying in {delay:.1f}s: {error}"
+            )
+            dispatch.record("retrying", error=str(error))
+            self.put(dispatch, delay)
+            return
+
+        logger.error(
+            f"Giving up posting {dispatch.post_id} to {self.platform} "
+            f"after {dispatch.attempts} attempts: {error}"
+        )
+        try:
+            DeadLetter.objects.create(
+                post_id=dispatch.post_id,
+                social=dispatch.social,
+                error=f"{type(error).__name__}: {error}",
+                attempts=dispatch.attempts,
+            )
+        except Exception as e:
+            logger.error(f"Could not dead-letter post {dispatch.post_id}: {e}")
+        finally:
+            connections.close_all()
+        dispatch.record("failed", error=f"{type(error).__name__}: {error}", done=True)
+        dispatch.result.set_result(
+            PostResult(dispatch.social, False, error, time.monotonic() - dispatch.started,
+                       attempts=dispatch.attempts)
+        )
+
+
+class Dispatcher:
+    """
+    Thread-safe Singleton owning one `PlatformQueue` per platform.
+
+    Usage
+    -----
+    d = Dispatcher.instance()
+    future = d.submit(Dispatch(post.id, "x", send, Twitter.retry_after))
+    d.observe("x", response.headers)     # from the platform's HTTP hooks
+    """
+
+    _lock   = threading.RLock()
+    _inst: Optional["Dispatcher"] = None
+
+    # ---------------- singleton ctor ---------------- #
+    def __init__(self):
+        if Dispatcher._inst is not None:              # enforce singleton
+            raise RuntimeError("Use Dispatcher.instance()")
+        self._queues: Dict[str, PlatformQueue] = {}
+
+    @classmethod
+    def instance(cls) -> "Dispatcher":
+        with cls._lock:
+            if cls._inst is None:
+                cls._inst = cls()
+        return cls._inst
+
+    # ----------------------- API -------------------- #
+    def submit(self, dispatch: Dispatch) -> Future:
+        """Queue `dispatch`. The Future resolves to its final `PostResult`."""
+        dispatch.record("queued")
+        self.queue(dispatch.social).put(dispatch)
+        return dispatch.result
+
+    def observe(self, platform: str, headers) -> None:
+        """Feed the rate limit headers of a platform response to its bucket."""
+        self.queue(platform).bucket.observe(headers)
+
+    def queue(self, platform: str) -> PlatformQueue:
+        with self._lock:
+            q = self._queues.get(platform)
+            if q is None:
+                rate, burst = DEFAULT_LIMITS.get(platform, (1.0, 5))
+                q = self._queues[platform] = PlatformQueue(platform, TokenBucket(rate, burst))
+            return q
+
+    def stats(self) -> Dict[str, int]:
+        """Number of queued posts per platform."""
+        with self._lock:
+            queues = dict(self._queues)
+        return {platform: len(q) for platform, q in queues.items()}
+
+
+# ───────────────── helpers ───────────────── #
+def backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given (1-based) attempt."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _header(headers, name: str) -> Optional[float]:
+    for prefix in _HEADER_PREFIXES:
+        value = headers.get(prefix + name)
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
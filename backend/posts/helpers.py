@@ -1,13 +1,25 @@
-import io
-from typing import Dict
-from datetime import datetime, timezone
-from .models import Post, Asset, Social
-from .post import MediaObject, MediaPost
+import os
+from logging import getLogger
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef, prefetch_related_objects
+from .models import Post, Asset, DirectUpload, JobRequest, StagedMedia, StoredMedia, DeadLetter
+from .post import MediaObject, MediaPost, shared_buffer, share_media
 from .blob import MinioClient
+from .cache import MediaCache
+from .dispatch import Dispatch, Dispatcher
+from .metrics import JOB_DURATION, timed
+from .renditions import build_renditions, renditions_for
 from .twitter import Twitter
 from .instagram import Instagram
 from .bluesky import Bluesky
 from .scheduler import TaskScheduler
+from .uploads import locked_media, store_upload
+
+logger = getLogger("posts")
 
 MEDIA_POSTERS: Dict[str, MediaPost] = {
     "x": Twitter,
@@ -15,11 +27,34 @@ MEDIA_POSTERS: Dict[str, MediaPost] = {
     "bluesky": Bluesky,
 }
 
+# seconds an immediate post waits for its renditions before the upload is posted
+RENDITION_WAIT = float(os.getenv("MEDIA_RENDITION_WAIT", "120"))
+
+# media of a post moved between MinIO and the backend at the same time
+TRANSFER_WORKERS = int(os.getenv("MEDIA_TRANSFER_WORKERS", "4"))
+_transfers = ThreadPoolExecutor(max_workers=TRANSFER_WORKERS, thread_name_prefix="media-transfer")
+
+# immediate posts prepared (renditions, media) at once, off the request thread
+IMMEDIATE_WORKERS = int(os.getenv("POST_IMMEDIATE_WORKERS", "4"))
+_immediate = ThreadPoolExecutor(max_workers=IMMEDIATE_WORKERS, thread_name_prefix="immediate")
+
+# direct uploads hashed and stored by content at once, off the request thread
+STORE_WORKERS = int(os.getenv("UPLOAD_STORE_WORKERS", "2"))
+_stores = ThreadPoolExecutor(max_workers=STORE_WORKERS, thread_name_prefix="upload-store")
+
+# seconds before its schedule a post's media is uploaded to the platforms
+STAGE_LEAD = float(os.getenv("MEDIA_STAGE_LEAD", "900"))
+# suffix of the id of a post's staging job
+STAGE_SUFFIX = ":stage"
+
 
 def upload_media(media_obj: MediaObject, asset: Asset) -> None:
     """
     Uploads a media object to MinioClient.
 
+    Nothing is uploaded if the asset is keyed by its content hash and that
+    object exists already.
+
     Args:
         media_obj (MediaObject): The media object to upload.
         asset (Asset): The asset containing bucket and key information.
@@ -30,162 +65,651 @@ def upload_media(media_obj: MediaObject, asset: Asset) -> None:
     # Upload the media to MinioClient
     media_obj.media.seek(0)  # Reset the file pointer to the beginning
     try:
+        if asset.sha256 and MinioClient.instance().exists(asset.bucket, asset.key):
+            return  # stored under its content hash by an earlier upload
         MinioClient.instance().put_object(
             asset.bucket,
             asset.key,
             media_obj.media,
+            content_type=media_obj.mime_type or "application/octet-stream",
         )
     except Exception as e:
-        print(f"Error uploading media to MinioClient: {e}")
+        logger.error(f"Error uploading media {asset.key} to MinioClient: {e}")
         raise
 
 
-def post_immediate(post: Post, media_obj: MediaObject = None) -> None:
+def post_immediate(post: Post) -> Dict[str, Future]:
     """
     Posts content immediately to the specified social media platforms.
 
+    The post is handed to the dispatch queue of every platform (see
+    `posts.dispatch`), which sends it as fast as the platform's rate limits
+    allow and retries transient failures. All media of the post is fetched
+    in parallel, each asset once into a read-only buffer, and every attempt
+    gets its own readers over them, so the bytes are not copied per
+    platform. Each platform gets its own rendition of each media where one
+    was built (see `posts.renditions`), limited to what it takes in one
+    post. Platforms the media was staged on ahead of time (see
+    `stage_post`) only create the post, and the media is not fetched at all
+    if every platform has it already.
+
     Args:
         post (Post): The post object containing text and associated assets.
-        media_obj (MediaObject, optional): The media object to post. Defaults to None.
+
+    Returns:
+        Dict[str, Future]: For each social platform, a Future resolving to
+        the `PostResult` once the post was delivered or given up on.
 
     Raises:
         RuntimeError: If an error occurs while retrieving media from MinioClient.
         ValueError: If the social media platform is unsupported.
     """
-    # get media from MinioClient if it exists
-
-    if media_obj is None:
-        for _media in post.assets.all():
-            # deep copy the media object
-            media: Asset = _media
-            try:
-                # get media from MinioClient if it exists
-                file = MinioClient.instance().get_object(media.bucket, media.key)
-                media_obj = MediaObject(media.file_name, media.mime_type, file)
-            except Exception as e:
-                raise RuntimeError(
-                    f"Error retrieving media {media.key} from MinioClient: {e}"
-                )
-            break
-
-    def get_media_copy():
-        if media_obj is None:
-            return None
-        media_obj.media.seek(0)  # Reset the file pointer to the beginning
-        b = media_obj.media.read()
-        return MediaObject(
-            name=media_obj.name,
-            mime_type=media_obj.mime_type,
-            media=io.BytesIO(b),
+    socials = [s.social for s in post.socials.all()]
+    for social in socials:
+        if social not in MEDIA_POSTERS:
+            raise ValueError(f"Unsupported social media platform: {social}")
+
+    staged = staged_media(post) if not post.immediate else {}
+
+    media = platform_media(post, [s for s in socials if s not in staged])
+
+    def send(social: str) -> Optional[Future]:
+        media_poster = MEDIA_POSTERS[social].instance()
+        if social in staged:
+            return media_poster.post(post.text, staged=staged[social])
+        return media_poster.post(
+            post.text,
+            media=[share_media(m, buf) for m, buf in media.get(social, [])] or None,
+        )
+
+    dispatcher = Dispatcher.instance()
+    results = {
+        social: dispatcher.submit(
+            Dispatch(post.id, social, partial(send, social), MEDIA_POSTERS[social].retry_after)
         )
+        for social in socials
+    }
+
+    if staged:
+        # staged media is attached to a post now, the next run stages anew
+        StagedMedia.objects.filter(post=post).delete()
+    return results
+
+
+def platform_media(post: Post, socials: List[str]) -> Dict[str, List[Tuple[MediaObject, object]]]:
+    """
+    Loads the media each platform should get: for every upload of the post
+    its rendition if one was built, otherwise the upload itself, limited to
+    what the platform takes in one post. Every distinct asset is fetched
+    once into a read-only buffer the platforms share, all of them in
+    parallel, so this takes about as long as the largest asset.
+
+    Args:
+        post (Post): The post object containing the assets.
+        socials (List[str]): The platforms to load media for.
+
+    Returns:
+        Dict[str, List[Tuple[MediaObject, object]]]: The media and their
+        buffers in post order, for each platform that has media.
+
+    Raises:
+        RuntimeError: If an error occurs while retrieving media from MinioClient.
+    """
+    assets = list(post.assets.all())
+    chosen = {
+        social: MEDIA_POSTERS[social].select_media(renditions_for(assets, social))
+        for social in socials
+    }
+    distinct = {a.key: a for picked in chosen.values() for a in picked}
 
-    for _s in post.socials.all():
-        s: Social = _s
-        if s.social not in MEDIA_POSTERS:
-            raise ValueError(f"Unsupported social media platform: {s.social}")
-        media_poster = MEDIA_POSTERS[s.social].instance()
-        # deep copy the media object
+    def load(asset: Asset) -> Tuple[MediaObject, object]:
         try:
-            media_poster.post(
-                post.text,
-                media=get_media_copy(),
+            # get media from MinioClient if it exists
+            file = MediaCache.instance().open(asset.bucket, asset.key, digest=asset.sha256)
+        except Exception as e:
+            raise RuntimeError(f"Error retrieving media {asset.key} from MinioClient: {e}")
+        # the buffer outlives the cached file handle
+        with file:
+            return (
+                MediaObject(asset.file_name, asset.mime_type, file, path=file.name),
+                shared_buffer(file),
             )
+
+    loaded = dict(zip(distinct, _transfers.map(load, distinct.values())))
+    return {
+        social: [loaded[a.key] for a in picked]
+        for social, picked in chosen.items()
+        if picked
+    }
+
+
+def staged_media(post: Post) -> Dict[str, dict]:
+    """
+    Returns the references of the media staged for a post that the platforms
+    still hold, keyed by social platform.
+
+    Args:
+        post (Post): The post object whose staged media to look up.
+    """
+    return dict(
+        StagedMedia.objects.filter(post=post, expires_at__gt=datetime.now(timezone.utc))
+        .values_list("social", "ref")
+    )
+
+
+def stage_post(post: Post) -> None:
+    """
+    Downloads the media of a post, checks it and uploads it (or its rendition)
+    to every platform that supports staging, ahead of the post's schedule. The references the
+    platforms return are stored in `StagedMedia` and used by `post_immediate`
+    instead of uploading at the scheduled time. Downloading also warms the
+    media cache for platforms that cannot stage.
+
+    Args:
+        post (Post): The post object containing socials and assets.
+
+    Raises:
+        RuntimeError: If the media cannot be retrieved or is not usable.
+    """
+    socials = [s for s in post.socials.values_list("social", flat=True) if s in MEDIA_POSTERS]
+    media = platform_media(post, socials)
+    for items in media.values():
+        for media_obj, buf in items:
+            if not len(buf):
+                raise RuntimeError(f"Media {media_obj.name} of post {post.id} is empty")
+            if not media_obj.mime_type.startswith(("image/", "video/")):
+                raise RuntimeError(
+                    f"Media {media_obj.name} has unsupported type {media_obj.mime_type}"
+                )
+
+    StagedMedia.objects.filter(post=post).delete()
+    for social, items in media.items():
+        try:
+            media_poster = MEDIA_POSTERS[social].instance()
+            pending = media_poster.stage([share_media(m, buf) for m, buf in items])
         except Exception as e:
-            print(f"Error posting to {s.social}: {e}")
+            logger.warning(f"Error staging media of post {post.id} on {social}: {e}")
+            continue
+        if pending is not None:
+            pending.add_done_callback(
+                partial(_save_staged, post.id, social, media_poster.staged_ttl)
+            )
+
+
+def _save_staged(post_id: int, social: str, ttl: float, pending: Future) -> None:
+    try:
+        StagedMedia.objects.update_or_create(
+            post_id=post_id,
+            social=social,
+            defaults={
+                "ref": pending.result(),
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl),
+            },
+        )
+    except Exception as e:
+        logger.warning(f"Error staging media of post {post_id} on {social}: {e}")
+    finally:
+        # may run on a platform's background thread
+        connections.close_all()
 
 
-def post_safe(post: Post, media_obj: MediaObject = None) -> None:
+def post_safe(post: Post) -> None:
     """
     Safely posts content to social media platforms, handling exceptions.
 
+    Failed deliveries are retried and dead-lettered by the dispatcher; a post
+    that cannot even be handed to it (e.g. its media is gone) is
+    dead-lettered for every platform here.
+
     Args:
         post (Post): The post object containing text and associated assets.
-        media_obj (MediaObject, optional): The media object to post. Defaults to None.
     """
-    print(f"Posting {post.text} to {post.socials.all()}")
+    logger.info(f"Posting {post.id} to {[s.social for s in post.socials.all()]}")
     try:
-        post_immediate(post, media_obj)
+        post_immediate(post)
     except Exception as e:
-        print(e)
+        logger.error(f"Error posting {post.id}: {e}")
+        DeadLetter.objects.bulk_create(
+            [
+                DeadLetter(post=post, social=s.social, error=f"{type(e).__name__}: {e}", attempts=0)
+                for s in post.socials.all()
+            ]
+        )
+
+
+@timed(JOB_DURATION, job="post")
+def post_job(post_id: int) -> None:
+    """
+    Entry point of scheduled jobs. Only the post id is stored with the job,
+    so the post is loaded fresh every time it fires.
+
+    Args:
+        post_id (int): The id of the post to publish.
+    """
+    try:
+        post = Post.objects.get(id=post_id)
+    except Post.DoesNotExist:
+        logger.warning(f"Post {post_id} no longer exists, cancelling its job")
+        if TaskScheduler.current() is not None:
+            cancel_job(post_id)
+        else:
+            enqueue_job(post_id, "cancel")
+        return
+    post_safe(post)
+    # a repeating post is staged again for its next run
+    if TaskScheduler.current() is not None:
+        schedule_stage(post, after=datetime.now(timezone.utc))
+    elif _repeat_of(post):
+        # leadership was lost while posting: the next leader rebuilds the jobs
+        enqueue_job(post.id, "schedule")
+
 
+@timed(JOB_DURATION, job="stage")
+def stage_job(post_id: int) -> None:
+    """
+    Entry point of staging jobs, which run `STAGE_LEAD` seconds before the
+    post job of the same post.
 
-def schedule_post(post: Post, media_obj: MediaObject = None) -> None:
+    Args:
+        post_id (int): The id of the post to stage.
+    """
+    post = Post.objects.filter(id=post_id).first()
+    if post is None:
+        return
+    try:
+        stage_post(post)
+    except Exception as e:
+        # the media is uploaded when the post goes out instead
+        logger.warning(f"Error staging post {post_id}: {e}")
+
+
+def _repeat_of(post: Post):
+    return (
+        post.repeat
+        if post.repeat and post.repeat != "" and post.repeat != "none"
+        else None
+    )
+
+
+def job_fingerprint(post: Post) -> str:
+    """
+    Summarise the fields of a post that its scheduled job depends on.
+
+    Args:
+        post (Post): The post object containing schedule and repeat information.
+
+    Returns:
+        str: A value that changes whenever the job has to be rebuilt.
+    """
+    schedule = post.schedule.isoformat() if post.schedule else ""
+    fingerprint = f"{schedule}|{_repeat_of(post) or ''}"
+    return f"{fingerprint}|{post.misfire}" if post.misfire else fingerprint
+
+
+def schedule_post(post: Post, media_objs: Dict[str, MediaObject] = None) -> None:
     """
     Schedules a post for future publication or posts it immediately if required.
 
+    Immediate posts are sent in the background (see `post_in_background`),
+    so this returns once the media is stored.
+
     Args:
         post (Post): The post object containing text, schedule, and repeat information.
-        media_obj (MediaObject, optional): The media object to post. Defaults to None.
+        media_objs (Dict[str, MediaObject], optional): The uploaded media not
+            yet in MinIO, by the key of its asset. Defaults to None.
     """
-    if media_obj is not None:
-        # Upload the media to MinioClient
-        for _media in post.assets.all():
-            media: Asset = _media
-            upload_media(media_obj, media)
-            break
+    if media_objs:
+        # Upload the media to MinioClient, all files at once
+        assets = [a for a in post.assets.filter(rendition="") if a.key in media_objs]
+        list(_transfers.map(lambda a: upload_media(media_objs[a.key], a), assets))
+
+    renditions = None
+    if post.assets.exists():
+        renditions = build_renditions(post, [s.social for s in post.socials.all()])
 
     if post.immediate:
-        post_immediate(post, media_obj)
+        post_in_background(post, renditions)
         return
 
-    # Schedule the post using a task queue or cron job
+    # hand the job to the scheduler worker
+    enqueue_job(post.id, "schedule")
+
+
+def attach_asset(post: Post, asset: dict) -> Asset:
+    """
+    Adds a stored media object to a scheduled post and builds its renditions.
+
+    Args:
+        post (Post): The post, which must not be immediate (already sent).
+        asset (dict): `file_name`, `bucket`, `key`, `mime_type` and `sha256` of the object.
+
+    Returns:
+        Asset: The new asset.
+    """
+    created = Asset.objects.create(post=post, **asset)
+    build_renditions(post, [s.social for s in post.socials.all()])
+    return created
+
+
+def post_in_background(post: Post, renditions: Future = None) -> Future:
+    """
+    Hands an immediate post to a background thread and returns at once.
+
+    The thread waits for the renditions (up to `RENDITION_WAIT` seconds) and
+    queues the post for every platform; the outcome is recorded as the
+    post's deliveries. The media must already be in MinIO, as the request
+    that uploaded it may be gone by the time the post is sent.
+
+    Args:
+        post (Post): The immediate post, already saved.
+        renditions (Future, optional): The pending `build_renditions()` of the post.
+
+    Returns:
+        Future: Resolves once the post was handed to the dispatch queues.
+    """
+    def run() -> None:
+        try:
+            if renditions is not None:
+                try:
+                    renditions.result(timeout=RENDITION_WAIT)
+                except Exception as e:
+                    logger.warning(f"Posting {post.id} without renditions: {e}")
+            post_safe(post)
+        finally:
+            connections.close_all()
+
+    return _immediate.submit(run)
+
+
+def store_in_background(upload: DirectUpload) -> Future:
+    """
+    Hashes a finalized direct upload and stores it under its content key in
+    a background thread, so the request that finalized it returns at once.
+
+    The outcome is recorded on the upload: `asset` holds the asset to send
+    with a post (or the one attached to `upload.post`), else `error` says
+    what went wrong.
+
+    Args:
+        upload (DirectUpload): The upload, already saved.
+
+    Returns:
+        Future: Resolves once the outcome is recorded.
+    """
+    def run() -> None:
+        uploads = DirectUpload.objects.filter(pk=upload.pk)
+        try:
+            key, sha256 = store_upload(upload.bucket, upload.incoming, upload.file_name)
+            asset = {
+                "file_name": upload.file_name,
+                "bucket": upload.bucket,
+                "key": key,
+                "mime_type": upload.mime_type or "application/octet-stream",
+                "sha256": sha256,
+            }
+            if upload.post_id is not None:
+                attach_asset(Post.objects.get(id=upload.post_id), asset)
+            uploads.update(asset=asset)
+        except Exception as e:
+            logger.error(f"Error storing upload {upload.incoming}: {e}")
+            uploads.update(error=str(e) or type(e).__name__)
+        finally:
+            connections.close_all()
+
+    return _stores.submit(run)
+
+
+def enqueue_job(post_id: int, action: str) -> None:
+    """
+    Queues a change to a post's job for the scheduler worker.
+
+    The API never touches the scheduler directly; the single worker that
+    holds the scheduler lock picks these requests up (see `posts.worker`).
+
+    Args:
+        post_id (int): The id of the post the job belongs to.
+        action (str): "schedule" to (re)build the job, "cancel" to remove it.
+    """
+    JobRequest.objects.create(post_id=post_id, action=action)
+
+
+def schedule_posts(posts: List[Post]) -> None:
+    """
+    Schedules many posts at once: one bulk insert hands every scheduled post
+    to the scheduler worker. Once the current transaction commits, the
+    renditions of posts with media are built (as in `schedule_post`) and
+    immediate posts are handed to the background.
+
+    Args:
+        posts (List[Post]): The post objects, already saved.
+    """
+    JobRequest.objects.bulk_create(
+        [JobRequest(post_id=p.id, action="schedule") for p in posts if not p.immediate]
+    )
+    with_media = set(
+        Asset.objects.filter(post__in=posts, rendition="").values_list("post_id", flat=True)
+    )
+    prefetch_related_objects(posts, "socials")
+
+    def start(post: Post) -> None:
+        renditions = None
+        if post.id in with_media:
+            renditions = build_renditions(post, [s.social for s in post.socials.all()])
+        if post.immediate:
+            post_in_background(post, renditions)
+
+    for post in posts:
+        if post.immediate or post.id in with_media:
+            transaction.on_commit(lambda post=post: start(post))
+
+
+def schedule_job(post: Post) -> None:
+    """
+    Schedules the job of a post that is not immediate. Runs in the worker.
+
+    Args:
+        post (Post): The post object containing schedule and repeat information.
+    """
     TaskScheduler.instance().schedule(
         post.id,
         post.schedule,
-        post_safe,
-        post,
-        repeat=(
-            post.repeat
-            if post.repeat and post.repeat != "" and post.repeat != "none"
-            else None
-        ),
+        post_job,
+        post.id,
+        repeat=_repeat_of(post),
+        job_name=job_fingerprint(post),
+        misfire=post.misfire,
+    )
+    schedule_stage(post)
+
+
+def schedule_stage(post: Post, after: datetime = None) -> None:
+    """
+    Schedules the staging job of a post `STAGE_LEAD` seconds before the next
+    run of its post job, or right away if that is sooner.
+
+    Args:
+        post (Post): The post object, whose post job is already scheduled.
+        after (datetime, optional): Stage the first run after this time
+            instead of the next run. Defaults to None.
+    """
+    scheduler = TaskScheduler.instance()
+    stage_id = f"{post.id}{STAGE_SUFFIX}"
+    fire = scheduler.next_run_time(post.id, after)
+    if fire is None or not post.assets.exists():
+        scheduler.cancel(stage_id)
+        return
+    now = datetime.now(timezone.utc)
+    scheduler.schedule(
+        stage_id,
+        max(fire - timedelta(seconds=STAGE_LEAD), now),
+        stage_job,
+        post.id,
+        job_name=fire.isoformat(),
     )
 
 
+def cancel_job(post_id: int) -> bool:
+    """
+    Cancels the post job and the staging job of a post. Runs in the worker.
+
+    Args:
+        post_id (int): The id of the post.
+
+    Returns:
+        bool: Whether the post job was found and removed.
+    """
+    scheduler = TaskScheduler.instance()
+    scheduler.cancel(f"{post_id}{STAGE_SUFFIX}")
+    return scheduler.cancel(post_id)
+
+
 def delete_post_artifacts(post: Post) -> None:
     """
     Deletes all artifacts related to a post, including scheduled tasks and media.
 
+    Media is stored once per content (see `posts.uploads`), so an object is
+    only deleted when no other post's assets reference it.
+
     Args:
         post (Post): The post object whose artifacts need to be deleted.
     """
     # Delete the post from the task queue or cron job
-    TaskScheduler.instance().cancel(job_id=post.id)
+    enqueue_job(post.id, "cancel")
 
     # Delete the media from MinioClient if it exists
-    for _media in post.assets.all():
-        media: Asset = _media
-        try:
-            MinioClient.instance().delete_object(media.bucket, media.key)
-        except Exception as e:
-            print(f"Error deleting media {media.key} from MinioClient: {e}")
+    for bucket, key in {(a.bucket, a.key) for a in post.assets.all()}:
+        release_media(bucket, key, post=post)
+
+
+def media_refs(bucket: str, key: str, post: Post = None) -> int:
+    """
+    Reference count of a stored object: the assets pointing at it.
+
+    Args:
+        bucket (str): The bucket of the object.
+        key (str): The key of the object.
+        post (Post, optional): Leave out the assets of this post. Defaults to None.
+    """
+    refs = Asset.objects.filter(bucket=bucket, key=key)
+    if post is not None:
+        refs = refs.exclude(post=post)
+    return refs.count()
+
 
+def release_media(bucket: str, key: str, post: Post = None) -> bool:
+    """
+    Deletes a stored object unless assets (other than those of `post`) still
+    reference it, or it was uploaded for a post that is yet to be created.
+    The object's `StoredMedia` row is locked meanwhile, so a new upload of
+    the same content cannot lose its object.
 
-def reschedule_post(post: Post) -> None:
+    Returns:
+        bool: True if the object was deleted.
+    """
+    try:
+        with locked_media(bucket, key) as stored:
+            if media_refs(bucket, key, post) > 0:
+                return False
+            if stored.held_until is not None and stored.held_until > datetime.now(timezone.utc):
+                # just uploaded for a post still to come; collect_media decides later
+                return False
+            MinioClient.instance().delete_object(bucket, key)
+            stored.delete()
+        MediaCache.instance().invalidate(bucket, key)
+    except Exception as e:
+        logger.error(f"Error deleting media {key} from MinioClient: {e}")
+        return False
+    return True
+
+
+def collect_media(batch_size: int = 500) -> int:
+    """
+    Deletes stored objects whose hold expired without any asset referencing
+    them, e.g. direct uploads that were never posted. Runs in the worker.
+
+    Returns:
+        int: The number of objects deleted.
+    """
+    now = datetime.now(timezone.utc)
+    expired = StoredMedia.objects.filter(held_until__lte=now)
+    referenced = Asset.objects.filter(bucket=OuterRef("bucket"), key=OuterRef("key"))
+    # objects in use need no hold anymore; release_media checks their references
+    expired.filter(Exists(referenced)).update(held_until=None)
+    unused = expired.filter(~Exists(referenced)).values_list("bucket", "key")[:batch_size]
+    return sum(release_media(bucket, key) for bucket, key in unused)
+
+
+def reschedule_post(post: Post) -> bool:
     """
     Reschedules a post based on its schedule and repeat settings.
 
     Args:
         post (Post): The post object containing schedule and repeat information.
+
+    Returns:
+        bool: Whether a job was scheduled for the post.
     """
     if post.schedule is None:
-        return
+        return False
 
     # if now is smaller than the schedule, reschedule the post
     if post.schedule > datetime.now(timezone.utc):
-        TaskScheduler.instance().schedule(
+        schedule_job(post)
+        return True
+    elif _repeat_of(post):
+        TaskScheduler.instance().schedule_after(
             post.id,
-            post.schedule,
-            post_safe,
-            post,
-            repeat=(
-                post.repeat
-                if post.repeat and post.repeat != "" and post.repeat != "none"
-                else None
-            ),
+            post.repeat,
+            post_job,
+            post.id,
+            job_name=job_fingerprint(post),
+            misfire=post.misfire,
         )
-    elif post.repeat and post.repeat != "" and post.repeat != "none":
-        TaskScheduler.instance().schedule_after(post.id, post.repeat, post_safe, post)
+        schedule_stage(post)
+        return True
+    return False
+
+
+def reconcile_posts() -> Dict[str, int]:
+    """
+    Brings the persistent job store in line with the `Post` table.
+
+    Jobs are compared with their posts through `job_fingerprint`, so only
+    posts that are new or changed are (re)scheduled and only jobs whose post
+    is gone are removed. Unchanged jobs are left untouched.
+
+    Returns:
+        Dict[str, int]: How many jobs were added, updated and removed.
+    """
+    scheduler = TaskScheduler.instance()
+    jobs = scheduler.job_names()
+    counts = {"added": 0, "updated": 0, "removed": 0}
+
+    posts = Post.objects.filter(immediate=False).only("id", "schedule", "repeat", "misfire")
+    for post in posts.iterator(chunk_size=2000):
+        job_id = str(post.id)
+        name = jobs.pop(job_id, None)
+        jobs.pop(job_id + STAGE_SUFFIX, None)
+        if name == job_fingerprint(post):
+            continue
+        try:
+            scheduled = reschedule_post(post)
+        except Exception as e:
+            logger.warning(f"Error rescheduling post {post.id}: {e}")
+            continue
+        if not scheduled:
+            if name is not None and cancel_job(post.id):
+                counts["removed"] += 1
+        elif name is not None:
+            counts["updated"] += 1
+        else:
+            counts["added"] += 1
+
+    # whatever is left has no post anymore
+    for job_id in jobs:
+        if scheduler.cancel(job_id) and not job_id.endswith(STAGE_SUFFIX):
+            counts["removed"] += 1
+    return counts
 
 
 def reset_posters() -> None:
@@ -1,13 +1,22 @@
-import io
-import os
 from instagrapi import Client
+from instagrapi.exceptions import (
+    ClientConnectionError,
+    ClientThrottledError,
+    LoginRequired,
+    PleaseWaitFewMinutes,
+    RateLimitError,
+)
+from contextlib import ExitStack
 from dataclasses import dataclass
 from os import environ
-from tempfile import NamedTemporaryFile
+from pathlib import Path
+from typing import List, Optional
 from logging import getLogger
 
-from .post import MediaPost, MediaObject
+from .post import MediaPost, MediaObject, media_list
 from .models import IntegrationSecrets
+from .credentials import load_session, save_session
+from .scratch import scratch_file
 
 logger = getLogger("posts")
 
@@ -28,86 +37,139 @@ class Instagram(MediaPost):
     A class to handle Instagram media posting.
 
     Attributes:
-        _inst (Instagram): A singleton instance of the Instagram class.
         client (Client): The Instagram client for API interactions.
     """
 
-    _inst: "Instagram" = None
+    platform = "instagram"
+    # seconds to wait after Instagram throttled us
+    THROTTLE_WAIT = 300
+    # albums hold up to 10 photos and videos
+    max_media = 10
 
     def __init__(self, credentials: InstagramCredentials = None):
         """
         Initializes the Instagram client with the provided credentials.
 
+        A session saved by a previous process is reused when Instagram still
+        accepts it; a full login only happens when it does not.
+
         Args:
             credentials (InstagramCredentials, optional): The Instagram credentials. Defaults to None.
+
+        Raises:
+            Exception: If the login to Instagram fails.
         """
+        self.credentials = credentials
         if credentials is not None:
             self.client = Client()
             try:
-                self.client.login(username=credentials.username, password=credentials.password)
+                self._login()
             except Exception as e:
                 logger.error(f"Failed to login to Instagram: {e}")
-                self.client = None
+                raise
         else:
             self.client = None
-    
-    @classmethod
-    def instance(cls):
+
+    def _login(self, reuse_session: bool = True) -> None:
         """
-        Returns a singleton instance of the Instagram class.
+        Logs in, restoring the saved session (cookies and device) if any.
 
-        If no instance exists, it initializes one using the latest IntegrationSecrets.
+        Args:
+            reuse_session (bool, optional): Try the saved session first. Defaults to True.
+        """
+        username = self.credentials.username
+        password = self.credentials.password
+        settings = load_session(self.platform, username) if reuse_session else None
+        if settings:
+            self.client.set_settings(settings)
+            self.client.login(username, password)
+            try:
+                # cheap request to find out whether the session is still valid
+                self.client.get_timeline_feed()
+            except LoginRequired:
+                logger.info("Saved Instagram session was rejected, logging in again")
+                # keep the device identity, drop the stale cookies
+                self.client.set_settings({})
+                self.client.set_uuids(settings["uuids"])
+                self.client.login(username, password)
+        else:
+            self.client.login(username, password)
+        self._save_session()
 
-        Returns:
-            Instagram: The singleton instance of the Instagram class.
+    def _save_session(self) -> None:
+        save_session(self.platform, self.credentials.username, self.client.get_settings())
+
+    @classmethod
+    def credentials_from(cls, secrets: IntegrationSecrets):
         """
-        if cls._inst is not None:
-            return cls._inst
+        Builds the Instagram credentials from the stored secrets.
 
-        try:
-            secrets = IntegrationSecrets.objects.latest("created_at")
-        except IntegrationSecrets.DoesNotExist:
-            return super().instance()
+        Args:
+            secrets (IntegrationSecrets): The latest integration secrets.
 
-        credentials = InstagramCredentials(
+        Returns:
+            InstagramCredentials: The credentials, or None if Instagram is not configured.
+        """
+        if not secrets.instagram_username:
+            return None
+        return InstagramCredentials(
             username=secrets.instagram_username,
             password=secrets.instagram_password,
         )
 
-        cls._inst = cls(credentials)
-        return cls._inst
-
     @classmethod
-    def reset(cls):
+    def retry_after(cls, error: Exception) -> Optional[float]:
         """
-        Resets the singleton instance of the Instagram class.
+        Instagram does not say how long to back off, so throttling waits
+        `THROTTLE_WAIT` seconds and connection errors use the usual backoff.
         """
-        cls._inst = None
+        if isinstance(error, (PleaseWaitFewMinutes, RateLimitError, ClientThrottledError)):
+            return cls.THROTTLE_WAIT
+        if isinstance(error, ClientConnectionError):
+            return 0
+        return super().retry_after(error)
 
-    def post(self, text: str, media: MediaObject = None):
+    def post(self, text: str, media: List[MediaObject] = None) -> str:
         """
-        Posts media to Instagram with the provided caption.
+        Posts media to Instagram with the provided caption. Several media
+        items are posted as one album.
 
         Args:
             text (str): The caption for the post.
-            media (MediaObject, optional): The media object to post. Defaults to None.
+            media (List[MediaObject], optional): The media objects to post. Defaults to None.
+
+        Returns:
+            str: The id of the new Instagram media.
 
         Raises:
             Exception: If the Instagram client is not initialized or no media is provided.
         """
         if self.client is None:
-            self._inst = None
             raise Exception("Instagram client is not initialized. Please provide credentials.")
-        if media is None:
+        media = self.select_media(media_list(media))
+        if not media:
             raise Exception("No media provided for posting.")
 
-        with open(media.name, 'wb') as media_file:
-            media_file.write(media.media.read())
-
-        if media.mime_type.startswith('video/'):
-            self.client.video_upload(media.name, caption=text)
+        # unique scratch paths, linked instead of copied when possible
+        with ExitStack() as stack:
+            paths = [stack.enter_context(scratch_file(m)) for m in media]
+            try:
+                posted = self._upload(paths, media, text)
+            except LoginRequired:
+                # the session expired while cached, log in once and retry
+                uuids = self.client.get_settings()["uuids"]
+                self.client.set_settings({})
+                self.client.set_uuids(uuids)
+                self._login(reuse_session=False)
+                posted = self._upload(paths, media, text)
+        self._save_session()
+        return str(posted.pk)
+
+    def _upload(self, paths: List[str], media: List[MediaObject], text: str):
+        if len(paths) > 1:
+            # album items are told apart by their file extension
+            return self.client.album_upload([Path(p) for p in paths], caption=text)
+        if media[0].mime_type.startswith('video/'):
+            return self.client.video_upload(paths[0], caption=text)
         else:
-            self.client.photo_upload(media.name, caption=text)
-
-        # Clean up the temporary file
-        os.remove(media.name)
+            return self.client.photo_upload(paths[0], caption=text)
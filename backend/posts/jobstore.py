@@ -0,0 +1,135 @@
+"""
+APScheduler job store backed by the Django database.
+
+Jobs live in the `ScheduledJob` table, so they survive restarts and do not
+have to be rebuilt from the `Post` rows every time a process starts.
+"""
+from __future__ import annotations
+
+import pickle
+from datetime import datetime
+from functools import wraps
+from typing import Dict, List, Optional
+import logging
+
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from django.db import IntegrityError, OperationalError, connection, transaction
+
+from .models import ScheduledJob
+
+logger = logging.getLogger("posts")
+
+
+def _retry_on_disconnect(func):
+    """Retry once on a fresh connection if the database dropped ours."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError:
+            connection.close()
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class DjangoJobStore(BaseJobStore):
+    """
+    Stores pickled jobs in `ScheduledJob`, indexed on their next run time.
+
+    The job name is kept in its own column so callers can compare what is
+    scheduled against their own records without unpickling every job.
+    """
+
+    def __init__(self, pickle_protocol: int = pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.pickle_protocol = pickle_protocol
+
+    # ----------------------- API -------------------- #
+    @_retry_on_disconnect
+    def lookup_job(self, job_id: str) -> Optional[Job]:
+        row = ScheduledJob.objects.filter(id=job_id).values_list("job_state", flat=True).first()
+        return self._reconstitute_job(row) if row is not None else None
+
+    @_retry_on_disconnect
+    def get_due_jobs(self, now: datetime) -> List[Job]:
+        return self._get_jobs(ScheduledJob.objects.filter(next_run_time__lte=now))
+
+    @_retry_on_disconnect
+    def get_next_run_time(self) -> Optional[datetime]:
+        return (
+            ScheduledJob.objects.filter(next_run_time__isnull=False)
+            .order_by("next_run_time")
+            .values_list("next_run_time", flat=True)
+            .first()
+        )
+
+    @_retry_on_disconnect
+    def get_all_jobs(self) -> List[Job]:
+        jobs = self._get_jobs(ScheduledJob.objects.all())
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    @_retry_on_disconnect
+    def add_job(self, job: Job) -> None:
+        try:
+            with transaction.atomic():
+                ScheduledJob.objects.create(**self._row(job))
+        except IntegrityError:
+            raise ConflictingIdError(job.id)
+
+    @_retry_on_disconnect
+    def update_job(self, job: Job) -> None:
+        row = self._row(job)
+        if not ScheduledJob.objects.filter(id=row.pop("id")).update(**row):
+            raise JobLookupError(job.id)
+
+    @_retry_on_disconnect
+    def remove_job(self, job_id: str) -> None:
+        deleted, _ = ScheduledJob.objects.filter(id=job_id).delete()
+        if not deleted:
+            raise JobLookupError(job_id)
+
+    @_retry_on_disconnect
+    def remove_all_jobs(self) -> None:
+        ScheduledJob.objects.all().delete()
+
+    @_retry_on_disconnect
+    def job_names(self) -> Dict[str, str]:
+        """Return `{job_id: name}` for every stored job in a single query."""
+        return dict(ScheduledJob.objects.values_list("id", "name"))
+
+    # ------------ internal helpers ------------ #
+    def _row(self, job: Job) -> dict:
+        return {
+            "id": job.id,
+            "name": job.name or "",
+            "next_run_time": job.next_run_time,
+            "job_state": pickle.dumps(job.__getstate__(), self.pickle_protocol),
+        }
+
+    def _get_jobs(self, rows) -> List[Job]:
+        jobs, failed = [], []
+        for job_id, state in rows.order_by("next_run_time").values_list("id", "job_state"):
+            try:
+                jobs.append(self._reconstitute_job(state))
+            except Exception:
+                self._logger.exception(f"Unable to restore job {job_id!r} -- removing it")
+                failed.append(job_id)
+        if failed:
+            ScheduledJob.objects.filter(id__in=failed).delete()
+        return jobs
+
+    def _reconstitute_job(self, job_state: bytes) -> Job:
+        state = pickle.loads(bytes(job_state))
+        state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}>"
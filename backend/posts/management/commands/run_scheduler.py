@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from posts.metrics import SCHEDULER_METRICS_PORT, serve_metrics
+from posts.worker import SchedulerWorker
+
+
+class Command(BaseCommand):
+    help = "Run the post scheduler worker (leader-elected, one job run per post)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=None,
+            help="Seconds between polls of the job request queue.",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            default=SCHEDULER_METRICS_PORT,
+            help="Port to expose Prometheus metrics on (0 to disable).",
+        )
+
+    def handle(self, *args, **options):
+        kwargs = {}
+        if options["poll_interval"] is not None:
+            kwargs["poll_interval"] = options["poll_interval"]
+        worker = SchedulerWorker(**kwargs)
+        if options["metrics_port"]:
+            serve_metrics(options["metrics_port"])
+            self.stdout.write(f"Metrics exposed on port {options['metrics_port']}")
+        self.stdout.write("Scheduler worker started, waiting for leadership...")
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            worker.stop()
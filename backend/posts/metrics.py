@@ -0,0 +1,178 @@
+"""
+Prometheus metrics of the scheduler, MinIO, the platforms and the API.
+
+pip install prometheus-client
+
+export PROMETHEUS_MULTIPROC_DIR="/tmp/vcms-metrics"   # only with several worker processes
+export SCHEDULER_METRICS_PORT="9100"                  # metrics port of `manage.py run_scheduler`
+
+Everything is exposed in the Prometheus text format on `/metrics`; the
+standalone scheduler, which serves no HTTP, exposes them on its own port. Metrics
+are plain in-process counters and histograms, updated without locks beyond
+prometheus_client's own, so they stay on in production. Labels are kept to
+low-cardinality values (platform, operation, route), never post ids.
+"""
+from __future__ import annotations
+
+import os
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Callable
+
+from django.http import HttpRequest, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+SCHEDULER_METRICS_PORT = int(os.getenv("SCHEDULER_METRICS_PORT", "9100"))
+
+# seconds, from a quick API call up to a long video upload
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# seconds a job fired after its scheduled time
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300, 900)
+
+JOB_DURATION = Histogram(
+    "vcms_scheduler_job_duration_seconds", "Run time of scheduled jobs.",
+    ["job"], buckets=LATENCY_BUCKETS,
+)
+JOB_LAG = Histogram(
+    "vcms_scheduler_job_lag_seconds", "Delay between the scheduled and the actual run time of jobs.",
+    ["job"], buckets=LAG_BUCKETS,
+)
+JOBS = Counter(
+    "vcms_scheduler_jobs_total", "Scheduled job runs by outcome (executed, error, missed).",
+    ["job", "outcome"],
+)
+MINIO_DURATION = Histogram(
+    "vcms_minio_operation_duration_seconds", "Duration of MinIO operations.",
+    ["operation"], buckets=LATENCY_BUCKETS,
+)
+MINIO_ERRORS = Counter(
+    "vcms_minio_errors_total", "Failed MinIO operations.", ["operation"],
+)
+PLATFORM_POST_DURATION = Histogram(
+    "vcms_platform_post_duration_seconds", "Duration of single post attempts on a platform.",
+    ["platform", "outcome"], buckets=LATENCY_BUCKETS,
+)
+DELIVERY_LATENCY = Histogram(
+    "vcms_delivery_latency_seconds", "Time from queueing a post to delivering or giving up on it.",
+    ["platform", "state"], buckets=LATENCY_BUCKETS,
+)
+DISPATCH_QUEUE = Gauge(
+    "vcms_dispatch_queue_depth", "Posts waiting in the dispatch queue of a platform.",
+    ["platform"], multiprocess_mode="livesum",
+)
+HTTP_DURATION = Histogram(
+    "vcms_http_request_duration_seconds", "Duration of API requests.",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+
+
+# ----------------------- API -------------------- #
+def timed(histogram: Histogram, errors: Counter | None = None, **labels) -> Callable:
+    """Decorator observing the duration of every call, and counting the failed ones."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.labels(**labels).inc()
+                raise
+            finally:
+                histogram.labels(**labels).observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def timed_post(func: Callable) -> Callable:
+    """Decorator for `MediaPost.post`, labelled with the poster's platform and outcome."""
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = func(self, *args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            PLATFORM_POST_DURATION.labels(self.platform, outcome).observe(
+                time.perf_counter() - started
+            )
+
+    return wrapper
+
+
+def job_kind(job_id: str) -> str:
+    """Metric label of a scheduler job: its kind, not its post."""
+    return job_id.rsplit(":", 1)[1] if ":" in job_id else "post"
+
+
+def on_job_event(event) -> None:
+    """APScheduler listener recording lag and outcome of every job run."""
+    from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+
+    kind = job_kind(str(event.job_id))
+    if event.code == EVENT_JOB_SUBMITTED:
+        now = datetime.now(timezone.utc)
+        for run_time in event.scheduled_run_times:
+            JOB_LAG.labels(kind).observe(max((now - run_time).total_seconds(), 0))
+    elif event.code == EVENT_JOB_MISSED:
+        JOBS.labels(kind, "missed").inc()
+    elif event.code == EVENT_JOB_ERROR:
+        JOBS.labels(kind, "error").inc()
+    else:
+        JOBS.labels(kind, "executed").inc()
+
+
+class MetricsMiddleware:
+    """Times every request, labelled with its URL route rather than its path."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        HTTP_DURATION.labels(
+            match.route if match is not None else "unmatched",
+            request.method,
+            str(response.status_code),
+        ).observe(time.perf_counter() - started)
+        return response
+
+
+def collecting_registry() -> CollectorRegistry:
+    """The registry to expose: this process's, or the aggregate of all worker processes."""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    # aggregate the samples every worker process wrote
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Expose all metrics in the Prometheus text format."""
+    return HttpResponse(generate_latest(collecting_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def serve_metrics(port: int = SCHEDULER_METRICS_PORT) -> None:
+    """Expose all metrics on their own port, for processes without an HTTP server."""
+    start_http_server(port, registry=collecting_registry())
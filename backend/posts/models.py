@@ -4,22 +4,158 @@ class Post(models.Model):
     text        = models.TextField()
     schedule = models.DateTimeField(null=True, blank=True)  # when to run job
     repeat      = models.CharField(max_length=10, blank=True)  # repeat job
-    immediate   = models.BooleanField(default=False)
+    immediate   = models.BooleanField(default=False, db_index=True)
+    # what to do with runs missed while the scheduler was down or busy,
+    # see posts.scheduler.MISFIRE_POLICIES; blank for the default grace time
+    misfire     = models.CharField(max_length=4, blank=True,
+                                   choices=[("skip", "skip"), ("run", "run")])
     time = models.DateTimeField(auto_now_add=True)      # when record created
 
+    class Meta:
+        indexes = [
+            # keyset pagination and date range filters
+            models.Index(fields=["schedule", "id"], name="post_schedule_id_idx"),
+        ]
+
     def __str__(self) -> str:
         return f"{self.id}: {self.text[:40]}"
 
 class Social(models.Model):
     post   = models.ForeignKey(Post, related_name="socials", on_delete=models.CASCADE)
-    social = models.CharField(max_length=30)
+    social = models.CharField(max_length=30, db_index=True)
 
 class Asset(models.Model):
     post       = models.ForeignKey(Post, related_name="assets", on_delete=models.CASCADE)
     file_name  = models.CharField(max_length=255)
     bucket     = models.CharField(default="media", max_length=255)  # S3 bucket name
-    key        = models.CharField(max_length=255, blank=True)   # S3 key
+    key        = models.CharField(max_length=255, blank=True, db_index=True)   # S3 key
     mime_type  = models.CharField(default="image/jpeg", max_length=255, blank=True)  # mime type
+    sha256     = models.CharField(max_length=64, blank=True)    # content hash
+    rendition  = models.CharField(max_length=30, blank=True)    # platform, blank for the upload
+    original   = models.ForeignKey(
+        "self", related_name="renditions", null=True, blank=True, on_delete=models.CASCADE
+    )                                                           # the upload a rendition was built from
+class ScheduledJob(models.Model):
+    """An APScheduler job persisted by `posts.jobstore.DjangoJobStore`."""
+    id            = models.CharField(max_length=191, primary_key=True)
+    name          = models.CharField(max_length=255, blank=True)  # fingerprint of the source row
+    next_run_time = models.DateTimeField(null=True, db_index=True)
+    job_state     = models.BinaryField()
+
+class JobRequest(models.Model):
+    """A change to a post's job, queued by the API for the scheduler worker."""
+    post_id    = models.BigIntegerField()   # no FK: the post may already be deleted
+    action     = models.CharField(max_length=10)  # "schedule" | "cancel"
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class PlatformSession(models.Model):
+    """Saved login session of a platform account, reused across restarts."""
+    platform   = models.CharField(max_length=30)
+    account    = models.CharField(max_length=255)
+    data       = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["platform", "account"], name="platform_session_account"),
+        ]
+
+class StoredMedia(models.Model):
+    """
+    A content-addressed object in MinIO. Its row is locked while references
+    to the object change (see `posts.uploads.locked_media`).
+    """
+    bucket     = models.CharField(max_length=255)
+    key        = models.CharField(max_length=255)
+    # kept until then even without assets: an upload waiting for its post
+    held_until = models.DateTimeField(null=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["bucket", "key"], name="stored_media_key"),
+        ]
+
+class DirectUpload(models.Model):
+    """
+    A browser upload to MinIO that is hashed and stored by content in the
+    background (see `posts.helpers.store_in_background`).
+    """
+    post       = models.ForeignKey(Post, related_name="uploads", null=True, on_delete=models.CASCADE)
+    bucket     = models.CharField(max_length=255)
+    incoming   = models.CharField(max_length=255)            # where the browser put it
+    file_name  = models.CharField(max_length=255)
+    mime_type  = models.CharField(max_length=255, blank=True)
+    asset      = models.JSONField(null=True)                 # the stored asset, once done
+    error      = models.TextField(blank=True)                # why it could not be stored
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class MediaUpload(models.Model):
+    """Progress of a chunked platform upload, so a retry resumes where it stopped."""
+    platform      = models.CharField(max_length=30)
+    account       = models.CharField(max_length=64, blank=True)  # media ids are per account
+    digest        = models.CharField(max_length=64)   # sha256 of the media
+    media_id      = models.CharField(max_length=64, blank=True)  # blank until INIT
+    total_bytes   = models.BigIntegerField()
+    next_segment  = models.IntegerField(default=0)    # first chunk not yet sent
+    finalized     = models.BooleanField(default=False)
+    expires_at    = models.DateTimeField()
+    claimed_until = models.DateTimeField(null=True)   # lease of the process uploading it
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["platform", "account", "digest"], name="media_upload_account_digest"
+            ),
+        ]
+
+class StagedMedia(models.Model):
+    """Media a platform already holds for a post, uploaded ahead of its schedule."""
+    post       = models.ForeignKey(Post, related_name="staged", on_delete=models.CASCADE)
+    social     = models.CharField(max_length=30)
+    ref        = models.JSONField()          # platform media id / blob ref
+    expires_at = models.DateTimeField()      # the platform may drop it afterwards
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["post", "social"], name="staged_media_post_social"),
+        ]
+
+class DeadLetter(models.Model):
+    """A post that could not be delivered to a platform, even after retrying."""
+    post       = models.ForeignKey(Post, related_name="dead_letters", on_delete=models.CASCADE)
+    social     = models.CharField(max_length=30)
+    error      = models.TextField()
+    attempts   = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+class Delivery(models.Model):
+    """One occurrence of a post on one platform, as seen by the dispatcher."""
+    STATES = [(s, s) for s in ("queued", "retrying", "delivered", "failed")]
+
+    post       = models.ForeignKey(Post, related_name="deliveries", on_delete=models.CASCADE)
+    social     = models.CharField(max_length=30)
+    occurrence = models.DateTimeField()                 # when the post was sent off
+    state      = models.CharField(max_length=10, choices=STATES, default="queued")
+    remote_id  = models.CharField(max_length=255, blank=True)   # tweet id, record uri, ...
+    attempts   = models.IntegerField(default=0)
+    latency    = models.FloatField(null=True)           # seconds until delivered / given up
+    error      = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post", "social", "occurrence"], name="delivery_occurrence"
+            ),
+        ]
+        indexes = [
+            # per post listing, newest first
+            models.Index(fields=["post", "id"], name="delivery_post_id_idx"),
+            # latency and error rates per platform
+            models.Index(fields=["social", "occurrence"], name="delivery_social_idx"),
+        ]
+
 # app/models.py
 from django.db import models
 
@@ -0,0 +1,104 @@
+"""
+Keyset (cursor) pagination over posts ordered by `(schedule, id)`, and over
+any other rows newest first by id (`paginate_by_id`).
+
+Unlike offset pagination a page costs the same whether it is page 1 or
+page 1000. Posts without a schedule (immediate posts) sort after all
+scheduled ones, as Postgres orders NULLs last. The rows after a cursor are
+read as two segments, scheduled posts by a `(schedule, id) > (%s, %s)`
+row-value comparison and then unscheduled posts by id, so that each is a
+single range scan of the `(schedule, id)` index; an OR of both would not be.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.db import connection
+from django.db.models import BooleanField, QuerySet
+from django.db.models.expressions import RawSQL
+
+
+def encode_cursor(schedule: Optional[datetime], id: int) -> str:
+    raw = json.dumps([schedule.isoformat() if schedule else None, id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        schedule, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (datetime.fromisoformat(schedule) if schedule else None, int(id))
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def segments(queryset: QuerySet, cursor: Optional[str]) -> List[QuerySet]:
+    """
+    The rows of `queryset` that come after `cursor`, in page order, as
+    ordered segments to read one after the other.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    unscheduled = queryset.filter(schedule__isnull=True).order_by("id")
+    if not cursor:
+        return [queryset.filter(schedule__isnull=False).order_by("schedule", "id"), unscheduled]
+    schedule, id = decode_cursor(cursor)
+    if schedule is None:
+        return [unscheduled.filter(id__gt=id)]
+    q = connection.ops.quote_name
+    table = q(queryset.model._meta.db_table)
+    # raw SQL skips the field's conversion of the datetime for the database
+    field = queryset.model._meta.get_field("schedule")
+    scheduled = queryset.filter(
+        RawSQL(
+            f"({table}.{q('schedule')}, {table}.{q('id')}) > (%s, %s)",
+            (field.get_db_prep_value(schedule, connection), id),
+            output_field=BooleanField(),
+        )
+    ).order_by("schedule", "id")
+    return [scheduled, unscheduled]
+
+
+def paginate(queryset: QuerySet, cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    """
+    Return one page of `queryset` and the cursor of the next page, if any.
+    """
+    rows: List = []
+    for segment in segments(queryset, cursor):
+        rows += segment[: limit + 1 - len(rows)]
+        if len(rows) > limit:
+            break
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.schedule, last.id)
+
+
+def paginate_by_id(queryset: QuerySet, cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    """
+    Return one page of `queryset`, newest (highest id) first, and the cursor
+    of the next page, if any.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    queryset = queryset.order_by("-id")
+    if cursor:
+        try:
+            last = int(base64.urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid cursor: {cursor!r}") from e
+        queryset = queryset.filter(id__lt=last)
+    rows = list(queryset[: limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, base64.urlsafe_b64encode(str(rows[-1].id).encode()).decode()
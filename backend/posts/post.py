@@ -1,6 +1,14 @@
+import io
+import mmap
+import tempfile
+import threading
+from concurrent.futures import Future
 from dataclasses import dataclass
 from io import IOBase
 from logging import getLogger
+from typing import Iterable, List, Optional, Sequence, Union
+
+from .metrics import timed_post
 
 logger = getLogger("posts")
 
@@ -9,29 +17,272 @@ class MediaObject:
     name: str
     mime_type: str
     media: IOBase
+    path: Optional[str] = None  # local file with the same bytes, if any
+
+
+@dataclass
+class PostResult:
+    """Outcome of publishing one post to one social platform."""
+    social: str
+    ok: bool
+    error: Optional[Exception] = None
+    elapsed: float = 0.0
+    attempts: int = 1
+    remote_id: str = ""  # id of the created post on the platform
+
+
+class BufferView(io.RawIOBase):
+    """
+    Read-only, seek-able file object over a shared buffer.
+
+    Every reader keeps its own position while the underlying bytes are never
+    copied, so several uploads can consume the same media concurrently.
+    """
+
+    def __init__(self, buf):
+        self._view = memoryview(buf).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def readall(self) -> bytes:
+        data = bytes(self._view[self._pos:])
+        self._pos = len(self._view)
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self._pos = pos
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+
+def shared_buffer(stream: IOBase):
+    """
+    Return the bytes of `stream` as a buffer that can back many `BufferView`s.
+
+    In-memory streams hand out their bytes (without a copy when unmodified)
+    and files on disk are memory-mapped; anything else is read once.
+    """
+    if isinstance(stream, tempfile.SpooledTemporaryFile):
+        # BytesIO until it rolls over, a real file afterwards
+        stream = stream._file
+    if isinstance(stream, BufferView):
+        return stream._view
+    if isinstance(stream, io.BytesIO):
+        return stream.getvalue()
+    if isinstance(stream, mmap.mmap):
+        return stream
+    try:
+        stream.flush()
+        return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        pass  # not backed by a (non-empty) file
+    stream.seek(0)
+    return stream.read()
+
+
+def share_media(media: MediaObject, buf) -> MediaObject:
+    """Create an independent reader of `media` backed by the shared `buf`."""
+    return MediaObject(
+        name=media.name,
+        mime_type=media.mime_type,
+        media=BufferView(buf),
+        path=media.path,
+    )
+
+
+def media_list(media: Union[MediaObject, Sequence[MediaObject], None]) -> List[MediaObject]:
+    """`media` as a list, which may be given as a single MediaObject."""
+    if media is None:
+        return []
+    if isinstance(media, MediaObject):
+        return [media]
+    return list(media)
+
+
+def staged_list(staged: Union[dict, list, None]) -> list:
+    """`staged` as a list of references; older stagings hold a single one."""
+    if staged is None:
+        return []
+    return [staged] if isinstance(staged, dict) else list(staged)
+
+
+def images_or_video(media: Sequence, limit: int, single: Iterable[str] = ("video/",)) -> list:
+    """
+    Selection for platforms taking several images or one video: the first
+    item decides. Items only need a `mime_type`.
+
+    Args:
+        media (Sequence): The candidates, in post order.
+        limit (int): Most images in one post.
+        single (Iterable[str]): Mime type prefixes that must be posted alone.
+    """
+    single = tuple(single)
+    if not media:
+        return []
+    if media[0].mime_type.startswith(single):
+        chosen = [media[0]]
+    else:
+        chosen = [m for m in media if not m.mime_type.startswith(single)][:limit]
+    if len(chosen) < len(media):
+        logger.warning(f"Posting {len(chosen)} of {len(media)} media, the platform allows no more")
+    return chosen
+
+
+def gather(futures: Sequence[Future]) -> Future:
+    """Future of the list of results of `futures`, failing with the first error."""
+    gathered: Future = Future()
+    results = [None] * len(futures)
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    if not futures:
+        gathered.set_result([])
+        return gathered
+
+    def done(i: int, f: Future):
+        error = f.exception()
+        with lock:
+            if gathered.done():
+                return
+            if error is not None:
+                gathered.set_exception(error)
+                return
+            results[i] = f.result()
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        gathered.set_result(results)
+
+    for i, f in enumerate(futures):
+        f.add_done_callback(lambda f, i=i: done(i, f))
+    return gathered
 
 
 class MediaPost:
-    _inst = None
+    # key of the platform in the credential registry
+    platform: str = "media"
+    # seconds a staged upload stays usable on the platform
+    staged_ttl: float = 0
+    # most media items in one post
+    max_media: int = 1
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every platform's post is timed, labelled with its platform
+        if "post" in cls.__dict__:
+            cls.post = timed_post(cls.post)
+
+    @classmethod
+    def credentials_from(cls, secrets):
+        """
+        Build this platform's credentials from an `IntegrationSecrets` row.
+
+        Returns None when the platform is not configured.
+        """
+        return None
 
     @classmethod
     def instance(cls):
-        """Get the singleton instance of the MediaPost class."""
-        return cls()
+        """
+        Get the shared instance of the poster for the current credentials.
+
+        Posters are cached by the `CredentialRegistry`, so a login only
+        happens once per set of credentials.
+        """
+        from .credentials import CredentialRegistry
+
+        registry = CredentialRegistry.instance()
+        secrets = registry.secrets()
+        credentials = cls.credentials_from(secrets) if secrets is not None else None
+        if credentials is None:
+            return cls()
+        return registry.client(cls.platform, credentials, lambda: cls(credentials))
+
+    @classmethod
+    def retry_after(cls, error: Exception) -> Optional[float]:
+        """
+        Decide whether a failed post is worth retrying.
+        Args:
+            error (Exception): The error the post failed with.
+        Returns:
+            Optional[float]: Seconds the platform asked to wait, 0 to retry
+            with the usual backoff, or None if retrying cannot help.
+        """
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return 0
+        return None
+
+    @classmethod
+    def select_media(cls, media: Sequence) -> list:
+        """
+        Pick the media of a post this platform can take in one post.
+        Args:
+            media (Sequence): Assets or media objects (anything with a
+                `mime_type`), in post order.
+        Returns:
+            list: The items to post, at most `max_media` of them.
+        """
+        if len(media) > cls.max_media:
+            logger.warning(f"{cls.platform} takes at most {cls.max_media} media, posting the first")
+        return list(media[:cls.max_media])
 
-    def post(self, text: str, media: MediaObject = None):
+    def stage(self, media: List[MediaObject]) -> Optional[Future]:
+        """
+        Upload `media` to the platform ahead of the post that will use it.
+        Args:
+            media (List[MediaObject]): The media objects to upload.
+        Returns:
+            Optional[Future]: Resolves to a JSON serialisable list of
+            references that is passed back to `post` as `staged`, or None if
+            the platform can only upload media together with the post.
+        """
+        return None
+
+    def post(
+        self, text: str, media: List[MediaObject] = None, staged: list = None
+    ) -> Union[str, Future, None]:
         """
         Post a message to the social media platform.
         Args:
             text (str): The text to post.
-            media (MediaObject, optional): The media object to post. Defaults to None.
+            media (List[MediaObject], optional): The media objects to post,
+                a single MediaObject is accepted too. Defaults to None.
+            staged (list, optional): References returned by `stage`, used instead of `media`.
+        Returns:
+            Union[str, Future, None]: The id of the created post, or a Future
+            resolving to it if the post completes in the background.
         """
-        if media:
-            media_str = f" with media {media.name} ({media.mime_type})"
+        media_str = "".join(f" with media {m.name} ({m.mime_type})" for m in media_list(media))
         logger.debug(f"Posting {text} to {self.__class__.__name__}{media_str}")
 
     @classmethod
     def reset(cls):
-        """Reset the singleton instance of the MediaPost class."""
-        # Reset the instance to None
-        cls._inst = None
+        """Reload the credentials on next use, e.g. after new secrets were saved."""
+        from .credentials import CredentialRegistry
+
+        CredentialRegistry.instance().invalidate()
@@ -0,0 +1,406 @@
+"""
+Platform-specific renditions of uploaded media.
+
+export MEDIA_TRANSCODE_WORKERS="2"       # concurrent renditions (ffmpeg processes)
+export MEDIA_TRANSCODE_TIMEOUT="600"     # seconds before an ffmpeg run is killed
+export FFMPEG_PATH="ffmpeg"
+export FFPROBE_PATH="ffprobe"
+
+Every platform has its own limits (Bluesky images must stay under 1 MB,
+X caps video length and bitrate, Instagram wants JPEGs within 4:5–1.91:1).
+Media that does not fit a platform's `Profile` is resized / re-encoded once,
+with Pillow for images and ffmpeg for video, and stored in MinIO as an extra
+`Asset` of the post with `rendition` set to the platform and `original`
+pointing at the upload. Media that already fits gets no rendition and the
+upload itself is posted. Every upload of a post is rendered on its own.
+
+Renditions are keyed by the content hash of the upload and the profile, so
+the same file uploaded again reuses the renditions built the first time.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import astuple, dataclass
+from typing import IO, Dict, List, Optional, Tuple
+import logging
+
+from django.db import connections
+from PIL import Image, ImageOps
+
+from .blob import MinioClient
+from .cache import MediaCache
+from .models import Asset, Post
+from .post import gather
+from .scratch import SCRATCH_DIR
+from .uploads import file_sha256, hold_media
+
+logger = logging.getLogger("posts")
+
+TRANSCODE_WORKERS = int(os.getenv("MEDIA_TRANSCODE_WORKERS", "2"))
+TRANSCODE_TIMEOUT = float(os.getenv("MEDIA_TRANSCODE_TIMEOUT", "600"))
+FFMPEG = os.getenv("FFMPEG_PATH", "ffmpeg")
+FFPROBE = os.getenv("FFPROBE_PATH", "ffprobe")
+
+# JPEG qualities tried, best first, before an image is scaled down further
+JPEG_QUALITIES = (90, 82, 74, 66, 58)
+# images are never scaled below this many pixels on their long side
+MIN_IMAGE_SIDE = 320
+
+
+@dataclass(frozen=True)
+class Profile:
+    image_types: Tuple[str, ...]               # accepted as uploaded
+    image_max_bytes: int
+    image_max_side: int
+    image_aspect: Optional[Tuple[float, float]]  # min / max width ÷ height
+    video_max_bytes: int
+    video_max_side: int
+    video_max_seconds: float
+    video_max_bitrate: int                     # bits per second
+    video_max_fps: float
+    video_aspect: Optional[Tuple[float, float]]
+
+
+PROFILES: Dict[str, Profile] = {
+    "x": Profile(
+        image_types=("image/jpeg", "image/png", "image/webp", "image/gif"),
+        image_max_bytes=5 * 1024 * 1024,
+        image_max_side=4096,
+        image_aspect=None,
+        video_max_bytes=512 * 1024 * 1024,
+        video_max_side=1920,
+        video_max_seconds=140,
+        video_max_bitrate=25_000_000,
+        video_max_fps=60,
+        video_aspect=(1 / 3, 3),
+    ),
+    "bluesky": Profile(
+        image_types=("image/jpeg", "image/png", "image/webp"),
+        image_max_bytes=1_000_000,
+        image_max_side=2000,
+        image_aspect=None,
+        video_max_bytes=100 * 1024 * 1024,
+        video_max_side=1920,
+        video_max_seconds=180,
+        video_max_bitrate=4_000_000,
+        video_max_fps=60,
+        video_aspect=None,
+    ),
+    "instagram": Profile(
+        image_types=("image/jpeg",),
+        image_max_bytes=8 * 1024 * 1024,
+        image_max_side=1080,
+        image_aspect=(0.8, 1.91),
+        video_max_bytes=100 * 1024 * 1024,
+        video_max_side=1080,
+        video_max_seconds=60,
+        video_max_bitrate=3_500_000,
+        video_max_fps=30,
+        video_aspect=(0.8, 1.78),
+    ),
+}
+
+_pool = ThreadPoolExecutor(max_workers=TRANSCODE_WORKERS, thread_name_prefix="rendition")
+
+
+# ----------------------- API -------------------- #
+def build_renditions(post: Post, socials: List[str]) -> Future:
+    """
+    Build the renditions of every uploaded media of a post for `socials`,
+    the uploads side by side on the rendition pool.
+
+    Returns:
+        Future: Resolves to the rendition assets that were created.
+    """
+    originals = list(post.assets.filter(rendition="").order_by("id"))
+    builds = [_pool.submit(_build, post, original, socials) for original in originals]
+    done: Future = Future()
+
+    def flatten(f: Future):
+        try:
+            done.set_result([asset for created in f.result() for asset in created])
+        except Exception as e:
+            done.set_exception(e)
+
+    gather(builds).add_done_callback(flatten)
+    return done
+
+
+def renditions_for(assets: List[Asset], social: str) -> List[Asset]:
+    """
+    The assets to post to `social`, in upload order: the rendition of every
+    upload where there is one, else the upload.
+    """
+    originals = sorted((a for a in assets if not a.rendition), key=lambda a: a.id or 0)
+    chosen = []
+    for original in originals:
+        rendition = next(
+            (
+                a for a in assets
+                if a.rendition == social
+                # renditions built before uploads were linked belong to the only upload
+                and (a.original_id == original.id or (a.original_id is None and len(originals) == 1))
+            ),
+            original,
+        )
+        chosen.append(rendition)
+    return chosen
+
+
+def render_image(src: IO[bytes], mime_type: str, size: int, profile: Profile) -> Optional[Tuple[bytes, str]]:
+    """
+    Fit an image into `profile`.
+
+    Returns:
+        Optional[Tuple[bytes, str]]: The encoded image and its mime type, or
+        None if the image is accepted as it is.
+    """
+    with Image.open(src) as im:
+        w, h = im.size
+        if mime_type == "image/gif" and mime_type in profile.image_types:
+            return None  # may be animated, leave it to the platform
+        if (
+            mime_type in profile.image_types
+            and size <= profile.image_max_bytes
+            and max(w, h) <= profile.image_max_side
+            and _aspect_ok(w, h, profile.image_aspect)
+        ):
+            return None
+
+        im = ImageOps.exif_transpose(im)
+        im = _crop(im, profile.image_aspect)
+        side = min(max(im.size), profile.image_max_side)
+        keep_png = "image/png" in profile.image_types and im.mode in ("RGBA", "LA", "P")
+        while True:
+            im.thumbnail((side, side), Image.LANCZOS)
+            if keep_png:
+                out = io.BytesIO()
+                im.save(out, "PNG", optimize=True)
+                if out.tell() <= profile.image_max_bytes:
+                    return out.getvalue(), "image/png"
+            data = _encode_jpeg(im, profile.image_max_bytes)
+            if data is not None:
+                return data, "image/jpeg"
+            if side <= MIN_IMAGE_SIDE:
+                raise ValueError(f"Cannot fit image into {profile.image_max_bytes} bytes")
+            side = max(int(side * 0.8), MIN_IMAGE_SIDE)
+
+
+def render_video(path: str, mime_type: str, size: int, profile: Profile, out: str) -> bool:
+    """
+    Fit the video at `path` into `profile`, writing an H.264/AAC MP4 to `out`.
+
+    Returns:
+        bool: False if the video is accepted as it is and nothing was written.
+    """
+    info = probe_video(path)
+    stream = (info.get("streams") or [{}])[0]
+    fmt = info.get("format", {})
+    w, h = int(stream.get("width", 0)), int(stream.get("height", 0))
+    duration = float(fmt.get("duration", 0))
+    bitrate = int(fmt.get("bit_rate", 0))
+    if (
+        mime_type == "video/mp4"
+        and stream.get("codec_name") == "h264"
+        and size <= profile.video_max_bytes
+        and max(w, h) <= profile.video_max_side
+        and duration <= profile.video_max_seconds
+        and bitrate <= profile.video_max_bitrate
+        and _fps(stream.get("avg_frame_rate", "0/1")) <= profile.video_max_fps
+        and _aspect_ok(w, h, profile.video_aspect)
+    ):
+        return False
+
+    side = profile.video_max_side
+    filters = []
+    if profile.video_aspect is not None:
+        lo, hi = profile.video_aspect
+        filters.append(f"crop='min(iw,ih*{hi})':'min(ih,iw/{lo})'")
+    filters.append(
+        f"scale='min({side},iw)':'min({side},ih)'"
+        ":force_original_aspect_ratio=decrease:force_divisible_by=2"
+    )
+    # leave room for the audio track within the bitrate cap
+    video_bitrate = profile.video_max_bitrate - 128_000
+    _run([
+        FFMPEG, "-nostdin", "-y", "-v", "error",
+        "-i", path,
+        "-t", str(profile.video_max_seconds),
+        "-vf", ",".join(filters),
+        "-fpsmax", str(profile.video_max_fps),
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p",
+        "-maxrate", str(video_bitrate), "-bufsize", str(2 * video_bitrate),
+        "-c:a", "aac", "-b:a", "128k",
+        "-movflags", "+faststart",
+        out,
+    ])
+    if os.path.getsize(out) > profile.video_max_bytes:
+        raise ValueError(f"Transcoded video is still larger than {profile.video_max_bytes} bytes")
+    return True
+
+
+def probe_video(path: str) -> dict:
+    """Dimensions, codec, frame rate, duration and bitrate of a video, from ffprobe."""
+    result = _run([
+        FFPROBE, "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,width,height,avg_frame_rate:format=duration,bit_rate",
+        "-of", "json", path,
+    ])
+    return json.loads(result.stdout)
+
+
+# ------------ internal helpers ------------ #
+def _build(post: Post, original: Asset, socials: List[str]) -> List[Asset]:
+    try:
+        is_video = original.mime_type.startswith("video/")
+        if not original.mime_type.startswith("image/") and not is_video:
+            return []
+        if is_video and shutil.which(FFMPEG) is None:
+            logger.warning("ffmpeg is not installed, videos are posted as uploaded")
+            return []
+
+        with MediaCache.instance().open(original.bucket, original.key, digest=original.sha256) as src:
+            size = os.fstat(src.fileno()).st_size
+            digest = original.sha256 or file_sha256(src)
+            if not original.sha256:
+                original.sha256 = digest
+                original.save(update_fields=["sha256"])
+
+            built = set(original.renditions.values_list("rendition", flat=True))
+            created: List[Asset] = []
+            for social in dict.fromkeys(socials):
+                profile = PROFILES.get(social)
+                if profile is None or social in built:
+                    continue
+                try:
+                    asset = _rendition(post, original, src, size, digest, social, profile)
+                except Exception as e:
+                    logger.warning(f"Error building {social} rendition of {original.key}: {e}")
+                    continue
+                if asset is not None:
+                    created.append(asset)
+        Asset.objects.bulk_create(created)
+        return created
+    finally:
+        # runs on a pool thread
+        connections.close_all()
+
+
+def _rendition(post, original, src, size, digest, social, profile) -> Optional[Asset]:
+    prefix = f"renditions/{digest}/{social}-{_profile_tag(profile)}"
+    cached = (
+        Asset.objects.filter(bucket=original.bucket, key__startswith=prefix)
+        .exclude(rendition="")
+        .first()
+    )
+    if cached is not None:
+        hold_media(original.bucket, cached.key)
+        return _asset(post, original, social, cached.key, cached.mime_type, cached.sha256)
+
+    src.seek(0)
+    if original.mime_type.startswith("image/"):
+        rendered = render_image(src, original.mime_type, size, profile)
+        if rendered is None:
+            return None
+        data, mime_type = rendered
+        key = prefix + (".png" if mime_type == "image/png" else ".jpg")
+        hold_media(original.bucket, key)
+        MinioClient.instance().put_object(
+            original.bucket, key, io.BytesIO(data), content_type=mime_type
+        )
+        return _asset(post, original, social, key, mime_type, hashlib.sha256(data).hexdigest())
+
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="vcms-", dir=SCRATCH_DIR)
+    try:
+        out = os.path.join(workdir, "rendition.mp4")
+        if not render_video(src.name, original.mime_type, size, profile, out):
+            return None
+        key = prefix + ".mp4"
+        hold_media(original.bucket, key)
+        with open(out, "rb") as f:
+            rendered_digest = file_sha256(f)
+            f.seek(0)
+            MinioClient.instance().put_object(original.bucket, key, f, content_type="video/mp4")
+        return _asset(post, original, social, key, "video/mp4", rendered_digest)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _asset(post, original, social, key, mime_type, sha256) -> Asset:
+    stem, ext = os.path.splitext(original.file_name)
+    new_ext = os.path.splitext(key)[1]
+    return Asset(
+        post=post,
+        file_name=stem + new_ext if new_ext else original.file_name,
+        bucket=original.bucket,
+        key=key,
+        mime_type=mime_type,
+        sha256=sha256,
+        rendition=social,
+        original=original,
+    )
+
+
+def _profile_tag(profile: Profile) -> str:
+    """Short hash of a profile, so changed limits produce new renditions."""
+    return hashlib.sha256(repr(astuple(profile)).encode()).hexdigest()[:8]
+
+
+def _aspect_ok(w: int, h: int, aspect: Optional[Tuple[float, float]]) -> bool:
+    if aspect is None or not h:
+        return True
+    return aspect[0] <= w / h <= aspect[1]
+
+
+def _crop(im: Image.Image, aspect: Optional[Tuple[float, float]]) -> Image.Image:
+    """Center crop `im` into the aspect ratio range."""
+    w, h = im.size
+    if _aspect_ok(w, h, aspect):
+        return im
+    lo, hi = aspect
+    if w / h > hi:
+        nw = int(h * hi)
+        left = (w - nw) // 2
+        return im.crop((left, 0, left + nw, h))
+    nh = int(w / lo)
+    top = (h - nh) // 2
+    return im.crop((0, top, w, top + nh))
+
+
+def _encode_jpeg(im: Image.Image, max_bytes: int) -> Optional[bytes]:
+    if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
+        rgba = im.convert("RGBA")
+        flat = Image.new("RGB", rgba.size, (255, 255, 255))
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+        im = flat
+    elif im.mode != "RGB":
+        im = im.convert("RGB")
+    for quality in JPEG_QUALITIES:
+        out = io.BytesIO()
+        im.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        if out.tell() <= max_bytes:
+            return out.getvalue()
+    return None
+
+
+def _fps(rate: str) -> float:
+    num, _, den = rate.partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    result = subprocess.run(args, capture_output=True, text=True, timeout=TRANSCODE_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(args[0])} failed: {result.stderr.strip()[-500:]}")
+    return result
@@ -1,13 +1,28 @@
 """
 pip install apscheduler
+
+export SCHEDULER_MAX_WORKERS="20"      # threads running due jobs
+export SCHEDULER_MISFIRE_GRACE="300"   # seconds a late run may still start
+export SCHEDULER_JITTER="0"            # spread runs over up to this many seconds
+export SCHEDULER_LAG_WARN="5"          # log runs starting later than this
 """
 from __future__ import annotations
 
 import atexit
-from datetime import datetime, timedelta, time as _time
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta, timezone as _tz, time as _time
 from typing import Callable, Dict, Literal, Optional
 
+from apscheduler.events import (
+    EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED,
+)
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.base import BaseJobStore, JobLookupError
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.util import undefined
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
@@ -15,53 +30,171 @@ from apscheduler.job import Job
 
 Repeat = Optional[Literal["daily", "weekly", "monthly"]]  # or timedelta for custom
 
+logger = logging.getLogger("posts")
+
+MAX_WORKERS = int(os.getenv("SCHEDULER_MAX_WORKERS", "20"))
+MISFIRE_GRACE = int(os.getenv("SCHEDULER_MISFIRE_GRACE", "300"))
+JITTER = float(os.getenv("SCHEDULER_JITTER", "0"))
+LAG_WARN = float(os.getenv("SCHEDULER_LAG_WARN", "5"))
+
+# misfire policy → misfire grace time of the job
+#   ""     the scheduler default (MISFIRE_GRACE)
+#   "skip" only run on time, drop runs that are late
+#   "run"  always run, however late (once, as runs are coalesced)
+MISFIRE_POLICIES = {"": undefined, "skip": 1, "run": None}
+
 
 class TaskScheduler:
     _inst: Optional["TaskScheduler"] = None
+    _lock = threading.Lock()
+    # set while this process holds the scheduler leader lock (see `posts.worker`)
+    _leading = False
+
+    @classmethod
+    def lead(cls, timezone: str | None = None) -> TaskScheduler:
+        """Start the singleton scheduler. Only the scheduler leader calls this."""
+        with cls._lock:
+            cls._leading = True
+        return cls.instance(timezone)
 
     @classmethod
     def instance(cls, timezone: str | None = None) -> TaskScheduler:
-        if cls._inst is None:
-            cls._inst = TaskScheduler(timezone)
+        """
+        The singleton scheduler. It is only ever created while this process
+        leads, so a job still running after leadership was lost cannot start
+        a second scheduler next to the new leader's.
+        """
+        with cls._lock:
+            if cls._inst is None:
+                if not cls._leading:
+                    raise RuntimeError("Only the scheduler leader runs a scheduler")
+                from .jobstore import DjangoJobStore   # needs Django set up
+                cls._inst = TaskScheduler(timezone, jobstore=DjangoJobStore())
+            return cls._inst
+
+    @classmethod
+    def current(cls) -> Optional[TaskScheduler]:
+        """The running singleton scheduler, or None if this process does not lead."""
         return cls._inst
 
-    def __init__(self, timezone: str | None = None):
-        self._sched = BackgroundScheduler(timezone=timezone, daemon=True)
+    @classmethod
+    def reset(cls) -> None:
+        """Give up leadership: shut the singleton scheduler down and forget it."""
+        with cls._lock:
+            cls._leading = False
+            inst, cls._inst = cls._inst, None
+        if inst is not None:
+            inst.shutdown()
+
+    def __init__(
+        self,
+        timezone: str | None = None,
+        jobstore: BaseJobStore | None = None,
+        max_workers: int = MAX_WORKERS,
+        misfire_grace: int = MISFIRE_GRACE,
+    ):
+        """
+        Args:
+            timezone: Timezone used for triggers without one.
+            jobstore: Persistent store for the jobs; in-memory when omitted.
+            max_workers: Threads running due jobs.
+            misfire_grace: Seconds a run may start late before it is skipped.
+        """
+        jobstores = {"default": jobstore} if jobstore is not None else {}
+        self._store = jobstore
+        self._sched = BackgroundScheduler(
+            timezone=timezone,
+            jobstores=jobstores,
+            executors={"default": ThreadPoolExecutor(max_workers)},
+            job_defaults={
+                # runs missed while down collapse into one
+                "coalesce": True,
+                "misfire_grace_time": misfire_grace,
+                "max_instances": 1,
+            },
+            daemon=True,
+        )
+        self._sched.add_listener(self._report_lag, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
+        try:
+            from .metrics import on_job_event
+        except ImportError:   # run as a script, see the demo below
+            on_job_event = None
+        if on_job_event is not None:
+            self._sched.add_listener(
+                on_job_event,
+                EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED,
+            )
         self._sched.start()
-        self._jobs: Dict[int, Job] = {}   # id → Job
         atexit.register(self.shutdown)
 
     # ------------ internal helpers ------------ #
-    def _make_trigger(self, first: datetime, repeat: Repeat | timedelta):
+    def _make_trigger(self, first: datetime, repeat: Repeat | timedelta, jitter: float | None = None):
         """Create a trigger for the first run and repeat interval.
         Args:
             first (datetime): The first run time.
             repeat (Repeat | timedelta): The repeat interval.
+            jitter (float, optional): Delay every run by up to this many seconds.
         Returns:
             Trigger: The trigger for the job.
         """
+        jitter = jitter or None
         if repeat is None:
+            if jitter:
+                first = first + timedelta(seconds=random.uniform(0, jitter))
             return DateTrigger(run_date=first)
 
         if isinstance(repeat, timedelta):
-            return IntervalTrigger(start_date=first, seconds=repeat.total_seconds())
+            return IntervalTrigger(start_date=first, seconds=repeat.total_seconds(), jitter=jitter)
 
         if repeat == "daily":
             return CronTrigger(start_date=first - timedelta(seconds=5),
-                               hour=first.hour, minute=first.minute, second=first.second)
+                               hour=first.hour, minute=first.minute, second=first.second,
+                               jitter=jitter)
 
         if repeat == "weekly":
             return CronTrigger(start_date=first - timedelta(seconds=5),
                                day_of_week=first.weekday(),
-                               hour=first.hour, minute=first.minute, second=first.second)
+                               hour=first.hour, minute=first.minute, second=first.second,
+                               jitter=jitter)
 
         if repeat == "monthly":
             return CronTrigger(start_date=first - timedelta(seconds=5),
                                day=first.day,
-                               hour=first.hour, minute=first.minute, second=first.second)
+                               hour=first.hour, minute=first.minute, second=first.second,
+                               jitter=jitter)
 
         raise ValueError(f"repeat={repeat!r} not supported")
 
+    def _add_job(self, job_id, func, trig, args, kwargs, job_name, misfire: str = "") -> Job:
+        """Add (or replace) the job stored under `job_id`."""
+        if misfire not in MISFIRE_POLICIES:
+            raise ValueError(f"misfire={misfire!r} not supported")
+        return self._sched.add_job(
+            func,
+            trig,
+            args=args,
+            kwargs=kwargs,
+            id=str(job_id),
+            name=job_name,
+            misfire_grace_time=MISFIRE_POLICIES[misfire],
+            replace_existing=True,
+        )
+
+    def _report_lag(self, event) -> None:
+        """Log every run that starts more than LAG_WARN seconds late or is skipped."""
+        if event.code == EVENT_JOB_MISSED:
+            logger.warning(
+                f"Job {event.job_id} missed its run at {event.scheduled_run_time.isoformat()}"
+            )
+            return
+        now = datetime.now(_tz.utc)
+        for run_time in event.scheduled_run_times:
+            lag = (now - run_time).total_seconds()
+            if lag > LAG_WARN:
+                logger.warning(
+                    f"Job {event.job_id} started {lag:.1f}s after {run_time.isoformat()}"
+                )
+
     # ------------ public API ------------ #
     def schedule(
         self,
@@ -70,15 +203,19 @@ class TaskScheduler:
         func: Callable,
         *args,
         repeat: Repeat | timedelta = None,
+        job_name: str | None = None,
+        misfire: str = "",
+        jitter: float | None = JITTER,
         **kwargs,
     ):
-        """Run at `when` (first execution) and optionally keep repeating."""
-        if job_id in self._jobs:
-            self.cancel(job_id)
+        """Run at `when` (first execution) and optionally keep repeating.
 
-        trig = self._make_trigger(when, repeat)
-        job = self._sched.add_job(func, trig, args=args, kwargs=kwargs)
-        self._jobs[job_id] = job
+        `job_name` is stored with the job and reported by `job_names()`.
+        `misfire` is one of `MISFIRE_POLICIES`; `jitter` spreads runs that
+        are due in the same second over up to that many seconds.
+        """
+        trig = self._make_trigger(when, repeat, jitter)
+        self._add_job(job_id, func, trig, args, kwargs, job_name, misfire)
 
     def schedule_after(
         self,
@@ -88,6 +225,9 @@ class TaskScheduler:
         *args,
         at_time: _time | None = None,
         start_from: datetime | None = None,
+        job_name: str | None = None,
+        misfire: str = "",
+        jitter: float | None = JITTER,
         **kwargs,
     ):
         """
@@ -99,9 +239,6 @@ class TaskScheduler:
 
             ts.schedule_after(42, "weekly", job, at_time=time(9,0))
         """
-        if job_id in self._jobs:
-            self.cancel(job_id)
-
         now = start_from or datetime.now(self._sched.timezone)
 
         if isinstance(repeat, timedelta):
@@ -126,20 +263,39 @@ class TaskScheduler:
         else:
             raise ValueError("repeat must be timedelta | 'daily' | 'weekly' | 'monthly'")
 
-        trig = self._make_trigger(first, repeat)
-        job = self._sched.add_job(func, trig, args=args, kwargs=kwargs)
-        self._jobs[job_id] = job
+        trig = self._make_trigger(first, repeat, jitter)
+        self._add_job(job_id, func, trig, args, kwargs, job_name, misfire)
 
     def cancel(self, job_id: int) -> bool:
         """Cancel a job by id.  Returns True if job was found and removed."""
-        job = self._jobs.pop(job_id, None)
-        if job:
-            try:
-                job.remove()
-            except Exception as e:
-                return False
-            return True
-        return False
+        try:
+            self._sched.remove_job(str(job_id))
+        except JobLookupError:
+            return False
+        return True
+
+    def next_run_time(self, job_id: int, after: datetime | None = None) -> datetime | None:
+        """Next time the job fires, or the first time after `after`.  None if it never will."""
+        job = self._sched.get_job(str(job_id))
+        if job is None:
+            return None
+        if after is None:
+            return job.next_run_time
+        fire = job.trigger.get_next_fire_time(None, after)
+        return fire if fire is not None and fire > after else None
+
+    def job_names(self) -> Dict[str, str]:
+        """Return `{job_id: job_name}` for every scheduled job."""
+        if hasattr(self._store, "job_names"):
+            return self._store.job_names()
+        return {job.id: job.name for job in self._sched.get_jobs()}
+
+    def wakeup(self) -> None:
+        """
+        Make the scheduler look at its job store again, e.g. after jobs were
+        added inside a transaction it could not see until the commit.
+        """
+        self._sched.wakeup()
 
     def shutdown(self, wait: bool = False):
         """Shutdown the scheduler and cancel all jobs."""
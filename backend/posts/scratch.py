@@ -0,0 +1,78 @@
+"""
+Unique scratch files for uploaders that need a path on disk (instagrapi).
+
+export MEDIA_SCRATCH_DIR="/dev/shm/vcms"   # defaults to /dev/shm, else <tmp>
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+import logging
+
+from .post import MediaObject
+
+logger = logging.getLogger("posts")
+
+
+def _default_dir() -> str:
+    # tmpfs keeps scratch files in memory pages instead of on the disk
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+SCRATCH_DIR = os.getenv("MEDIA_SCRATCH_DIR") or _default_dir()
+
+
+@contextmanager
+def scratch_file(media: MediaObject) -> Iterator[str]:
+    """
+    Yield the path of a file holding `media`, removed again on exit.
+
+    Every call gets its own directory, so concurrent uploads of files with
+    the same name cannot clash, and files a library writes next to it (e.g.
+    video thumbnails) are cleaned up too. When the media already lives in a
+    local file on the same file system it is hard linked rather than copied.
+
+    Usage
+    -----
+    with scratch_file(media) as path:
+        client.photo_upload(path, caption=text)
+    """
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="vcms-", dir=SCRATCH_DIR)
+    try:
+        path = os.path.join(workdir, os.path.basename(media.name) or "media")
+        if not (media.path and _link(media.path, path)):
+            media.media.seek(0)
+            with open(path, "wb") as f:
+                shutil.copyfileobj(media.media, f, 1024 * 1024)
+        yield path
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _link(src: str, dst: str) -> bool:
+    """
+    Hard link `src` to `dst`, or copy it across file systems.
+
+    Never a symlink: `src` may be a media cache blob that is evicted while
+    the upload still reads `dst`, which a hard link or a copy survives.
+    """
+    if not os.path.isfile(src):
+        return False
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        pass
+    try:
+        shutil.copyfile(src, dst)
+        return True
+    except OSError as e:
+        # e.g. evicted meanwhile; the media is written from its stream instead
+        logger.debug(f"Could not copy {src} into scratch space: {e}")
+        return False
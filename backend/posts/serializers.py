@@ -1,5 +1,6 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Post, Social, Asset, IntegrationSecrets
+from .models import Post, Social, Asset, Delivery, IntegrationSecrets
 
 class SocialSerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,7 +10,35 @@ class SocialSerializer(serializers.ModelSerializer):
 class AssetSerializer(serializers.ModelSerializer):
     class Meta:
         model  = Asset
-        fields = ("file_name", "bucket", "key")
+        fields = ("file_name", "bucket", "key", "mime_type", "sha256", "rendition")
+        read_only_fields = ("rendition",)
+
+def _asset(post, a):
+    return Asset(
+        post=post,
+        file_name=a["file_name"],
+        bucket=a["bucket"],
+        key=a.get("key", ""),
+        mime_type=a.get("mime_type", "image/jpeg"),
+        sha256=a.get("sha256", ""),
+    )
+
+class PostListSerializer(serializers.ListSerializer):
+    # ---------- BULK CREATE ----------
+    def create(self, validated_data):
+        """Insert all posts, socials and assets in three statements."""
+        nested = [(v.pop("socials"), v.pop("assets", [])) for v in validated_data]
+        with transaction.atomic():
+            posts = Post.objects.bulk_create([Post(**v) for v in validated_data])
+            Social.objects.bulk_create(
+                [Social(post=post, social=s["social"])
+                 for post, (socials, _) in zip(posts, nested) for s in socials]
+            )
+            Asset.objects.bulk_create(
+                [_asset(post, a)
+                 for post, (_, assets) in zip(posts, nested) for a in assets]
+            )
+        return posts
 
 class PostSerializer(serializers.ModelSerializer):
     socials = SocialSerializer(many=True)
@@ -17,8 +46,19 @@ class PostSerializer(serializers.ModelSerializer):
 
     class Meta:
         model  = Post
-        fields = ("id", "text", "schedule", "repeat",
+        fields = ("id", "text", "schedule", "repeat", "misfire",
                   "immediate", "time", "socials", "assets")
+        list_serializer_class = PostListSerializer
+
+    def __init__(self, *args, fields=None, **kwargs):
+        """
+        Args:
+            fields (Iterable[str], optional): Only serialize these fields.
+        """
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
     # ---------- CREATE ----------
     def create(self, validated):
@@ -31,16 +71,16 @@ class PostSerializer(serializers.ModelSerializer):
             [Social(post=post, social=s["social"]) for s in socials_data]
         )
 
-        # assets – files already saved via FileField
-        for a in assets_data:
-            Asset.objects.create(
-                post=post,
-                file_name=a["file_name"],
-                bucket=a["bucket"],
-                key=a.get("key", ""),
-            )
+        # assets – files already saved in MinIO
+        Asset.objects.bulk_create([_asset(post, a) for a in assets_data])
         return post
 
+class DeliverySerializer(serializers.ModelSerializer):
+    class Meta:
+        model  = Delivery
+        fields = ("id", "social", "occurrence", "state", "remote_id",
+                  "attempts", "latency", "error", "updated_at")
+
 class IntegrationSecretsSerializer(serializers.ModelSerializer):
     class Meta:
         model = IntegrationSecrets
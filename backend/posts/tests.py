@@ -0,0 +1,414 @@
+"""
+Tests of the posts app: `python manage.py test posts` (needs the Postgres
+database of the settings; MinIO and the platforms are mocked).
+"""
+import hashlib
+import io
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .cache import MediaCache
+from .dispatch import TokenBucket
+from .helpers import collect_media, enqueue_job, release_media, store_in_background
+from .models import Asset, DirectUpload, JobRequest, MediaUpload, Post, StoredMedia
+from .pagination import decode_cursor, encode_cursor, paginate, paginate_by_id
+from .scheduler import TaskScheduler
+from .twitter import Twitter
+from .uploads import ChunkPipe, content_key, store_by_content
+from .views import PostBatchView
+from .worker import SchedulerWorker
+
+T0 = datetime(2030, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(T0, 7)), (T0, 7))
+        self.assertEqual(decode_cursor(encode_cursor(None, 7)), (None, 7))
+
+    def test_malformed(self):
+        for cursor in ("not base64!", "bnVsbA==", encode_cursor(T0, 1)[:-4]):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class PaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        schedules = [T0 + timedelta(hours=2), T0, None, T0, T0 + timedelta(hours=1), None]
+        cls.posts = [Post.objects.create(text=str(i), schedule=s) for i, s in enumerate(schedules)]
+
+    def expected(self):
+        # scheduled ones by (schedule, id), then the unscheduled ones by id
+        scheduled = sorted((p for p in self.posts if p.schedule), key=lambda p: (p.schedule, p.id))
+        return [p.id for p in scheduled] + sorted(p.id for p in self.posts if not p.schedule)
+
+    def walk(self, paginator, limit):
+        ids, cursor = [], None
+        while True:
+            rows, cursor = paginator(Post.objects.all(), cursor, limit)
+            ids += [p.id for p in rows]
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_every_post_once_in_order(self):
+        for limit in (1, 2, 3, 4, 6, 10):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.walk(paginate, limit), self.expected())
+
+    def test_last_full_page_has_no_cursor(self):
+        rows, cursor = paginate(Post.objects.all(), None, len(self.posts))
+        self.assertEqual(len(rows), len(self.posts))
+        self.assertIsNone(cursor)
+
+    def test_by_id_newest_first(self):
+        self.assertEqual(
+            self.walk(paginate_by_id, 4), sorted((p.id for p in self.posts), reverse=True)
+        )
+
+
+class ChunkPipeTests(SimpleTestCase):
+    def test_stream(self):
+        pipe = ChunkPipe(max_chunks=4)
+        pipe.write(b"ab")
+        pipe.write(b"c")
+        pipe.close_writer()
+        self.assertEqual(pipe.read(), b"abc")
+
+    def test_close_fails_once_the_reader_is_gone(self):
+        pipe = ChunkPipe(max_chunks=1)
+        pipe.write(b"ab")
+        with self.assertRaises(BrokenPipeError):
+            pipe.close_writer(alive=lambda: False)
+
+
+class StoreByContentTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("posts.uploads.MinioClient")
+        self.client = patcher.start().instance.return_value
+        self.addCleanup(patcher.stop)
+
+    def test_new_content_is_copied(self):
+        self.client.exists.return_value = False
+        key = store_by_content("media", "incoming/abc", "f00d", "Cat.JPG")
+        self.assertEqual(key, content_key("f00d", "Cat.JPG"))
+        self.assertEqual(key, "sha256/f00d.jpg")
+        self.client.copy_object.assert_called_once_with("media", "incoming/abc", key)
+        self.client.delete_object.assert_called_once_with("media", "incoming/abc")
+
+    def test_known_content_is_not_stored_twice(self):
+        self.client.exists.return_value = True
+        key = store_by_content("media", "incoming/abc", "f00d", "cat.jpg")
+        self.assertEqual(key, "sha256/f00d.jpg")
+        self.client.copy_object.assert_not_called()
+        self.client.delete_object.assert_called_once_with("media", "incoming/abc")
+
+    def test_stored_content_is_held(self):
+        self.client.exists.return_value = False
+        key = store_by_content("media", "incoming/abc", "f00d", "cat.jpg")
+        stored = StoredMedia.objects.get(bucket="media", key=key)
+        self.assertGreater(stored.held_until, datetime.now(timezone.utc))
+
+
+class ReleaseMediaTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("posts.helpers.MinioClient")
+        self.client = patcher.start().instance.return_value
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("posts.helpers.MediaCache")
+        self.cache = patcher.start().instance.return_value
+        self.addCleanup(patcher.stop)
+
+        self.first = Post.objects.create(text="first")
+        self.second = Post.objects.create(text="second")
+        for post in (self.first, self.second):
+            Asset.objects.create(post=post, file_name="cat.jpg", key="sha256/f00d.jpg")
+
+    def test_kept_while_other_posts_reference_it(self):
+        self.assertFalse(release_media("media", "sha256/f00d.jpg", post=self.first))
+        self.client.delete_object.assert_not_called()
+
+    def test_deleted_with_its_last_reference(self):
+        self.second.delete()
+        self.assertTrue(release_media("media", "sha256/f00d.jpg", post=self.first))
+        self.client.delete_object.assert_called_once_with("media", "sha256/f00d.jpg")
+        self.cache.invalidate.assert_called_once_with("media", "sha256/f00d.jpg")
+
+    def test_failed_delete_is_reported(self):
+        Asset.objects.all().delete()
+        self.client.delete_object.side_effect = RuntimeError("down")
+        self.assertFalse(release_media("media", "sha256/f00d.jpg"))
+
+    def test_held_content_is_kept(self):
+        Asset.objects.all().delete()
+        StoredMedia.objects.create(
+            bucket="media", key="sha256/f00d.jpg",
+            held_until=datetime.now(timezone.utc) + timedelta(hours=1),
+        )
+        self.assertFalse(release_media("media", "sha256/f00d.jpg"))
+        self.client.delete_object.assert_not_called()
+
+    def test_collect_deletes_expired_unused_content(self):
+        past = datetime.now(timezone.utc) - timedelta(seconds=1)
+        StoredMedia.objects.create(bucket="media", key="sha256/f00d.jpg", held_until=past)
+        StoredMedia.objects.create(bucket="media", key="sha256/beef.png", held_until=past)
+        self.assertEqual(collect_media(), 1)
+        self.client.delete_object.assert_called_once_with("media", "sha256/beef.png")
+        self.assertEqual(
+            list(StoredMedia.objects.values_list("key", "held_until")),
+            [("sha256/f00d.jpg", None)],
+        )
+
+
+class DirectUploadTests(TransactionTestCase):
+    def setUp(self):
+        patcher = mock.patch("posts.uploads.MinioClient")
+        self.client = patcher.start().instance.return_value
+        self.addCleanup(patcher.stop)
+        self.client.exists.return_value = True
+        self.client.stat_object.return_value = mock.Mock(size=3)
+        self.client.iter_object.return_value = [b"cat"]
+        self.api = APIClient()
+        self.stored = []
+        patcher = mock.patch(
+            "posts.views.store_in_background",
+            side_effect=lambda upload: self.stored.append(store_in_background(upload)),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def finalize(self, **extra):
+        resp = self.api.post(
+            reverse("upload-finalize"),
+            {"key": "incoming/abc", "file_name": "cat.jpg", "mime_type": "image/jpeg", **extra},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 202)
+        for future in self.stored:
+            future.result(timeout=10)
+        return self.api.get(resp.data["status"])
+
+    def test_stored_in_the_background(self):
+        resp = self.finalize()
+        self.assertEqual(resp.status_code, 200)
+        digest = hashlib.sha256(b"cat").hexdigest()
+        self.assertEqual(resp.data["key"], f"sha256/{digest}.jpg")
+        self.assertEqual(resp.data["sha256"], digest)
+        self.assertFalse(Asset.objects.exists())
+
+    def test_attached_to_its_post(self):
+        post = Post.objects.create(text="later", schedule=T0)
+        with mock.patch("posts.helpers.build_renditions") as build:
+            resp = self.finalize(post=post.id)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(list(post.assets.values_list("key", flat=True)), [resp.data["key"]])
+        build.assert_called_once()
+
+    def test_failure_is_reported(self):
+        self.client.iter_object.side_effect = RuntimeError("down")
+        resp = self.finalize()
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(DirectUpload.objects.get().error, "down")
+
+
+class MediaCacheTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("posts.cache.MinioClient")
+        self.client = patcher.start().instance.return_value
+        self.addCleanup(patcher.stop)
+        self.client.iter_object.side_effect = lambda bucket, key: [key.encode() * 3]
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def read(self, cache, key):
+        with cache.open("media", key, digest=hashlib.sha256(key.encode() * 3).hexdigest()) as f:
+            return f.read()
+
+    def test_stores_without_listing_the_blobs(self):
+        cache = MediaCache(directory=self.directory, max_bytes=100)
+        with mock.patch("posts.cache.os.listdir") as listdir:
+            self.assertEqual(self.read(cache, "ab"), b"ababab")
+            self.assertEqual(self.read(cache, "cd"), b"cdcdcd")
+        listdir.assert_not_called()
+        self.assertEqual(cache.stats()["bytes"], 12)
+
+    def test_processes_share_the_lru_order(self):
+        first = MediaCache(directory=self.directory, max_bytes=12)
+        self.read(first, "ab")
+        self.read(first, "cd")
+        other = MediaCache(directory=self.directory, max_bytes=12)
+        self.read(other, "ab")                      # now "cd" is the oldest
+        self.read(first, "ef")
+        self.assertEqual(first.stats()["entries"], 2)
+        self.assertEqual(first.stats()["evictions"], 1)
+        self.read(first, "ab")
+        self.assertEqual(first.stats()["misses"], 3)
+
+
+class PostBatchTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.url = reverse("post-batch")
+
+    def post(self, text="hello"):
+        return {
+            "text": text,
+            "schedule": (T0 + timedelta(days=1)).isoformat(),
+            "socials": [{"social": "x"}],
+        }
+
+    def test_requires_a_non_empty_list(self):
+        for body in ({}, {"posts": []}, {"posts": "nope"}):
+            with self.subTest(body=body):
+                resp = self.api.post(self.url, body, format="json")
+                self.assertEqual(resp.status_code, 400)
+
+    def test_rejects_too_many_posts(self):
+        with mock.patch.object(PostBatchView, "MAX_BATCH", 2):
+            resp = self.api.post(self.url, [self.post()] * 3, format="json")
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+    def test_one_invalid_post_rejects_the_batch(self):
+        invalid = self.post()
+        del invalid["socials"]
+        resp = self.api.post(self.url, {"posts": [self.post(), invalid]}, format="json")
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+    def test_creates_and_queues_scheduled_posts(self):
+        resp = self.api.post(self.url, [self.post("a"), self.post("b")], format="json")
+        self.assertEqual(resp.status_code, 200)
+        ids = resp.data["ids"]
+        self.assertEqual(sorted(Post.objects.values_list("text", flat=True)), ["a", "b"])
+        self.assertEqual(
+            sorted(JobRequest.objects.filter(action="schedule").values_list("post_id", flat=True)),
+            sorted(ids),
+        )
+
+    def test_builds_renditions_of_posts_with_media(self):
+        with_media = dict(self.post("a"), assets=[
+            {"file_name": "cat.jpg", "bucket": "media", "key": "sha256/f00d.jpg"},
+        ])
+        with mock.patch("posts.helpers.build_renditions") as build, \
+                self.captureOnCommitCallbacks(execute=True):
+            resp = self.api.post(self.url, [with_media, self.post("b")], format="json")
+        self.assertEqual(resp.status_code, 200)
+        build.assert_called_once()
+        post, socials = build.call_args.args
+        self.assertEqual((post.id, socials), (resp.data["ids"][0], ["x"]))
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=0.01, capacity=2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        wait = bucket.take()
+        self.assertGreater(wait, 90)
+        self.assertLessEqual(wait, 100)
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=10, capacity=5)
+        bucket.pause(30)
+        self.assertAlmostEqual(bucket.take(), 30, delta=1)
+
+    def test_exhausted_window_blocks_until_reset(self):
+        bucket = TokenBucket(rate=10, capacity=5)
+        bucket.observe({
+            "x-rate-limit-limit": "100",
+            "x-rate-limit-remaining": "0",
+            "x-rate-limit-reset": str(time.time() + 60),
+        })
+        self.assertAlmostEqual(bucket.take(), 60, delta=2)
+
+    def test_remaining_calls_are_spread_over_the_window(self):
+        bucket = TokenBucket(rate=10, capacity=5)
+        bucket.observe({
+            "ratelimit-limit": "3",
+            "ratelimit-remaining": "2",
+            "ratelimit-reset": str(time.time() + 100),
+        })
+        self.assertEqual(bucket.capacity, 3)
+        self.assertAlmostEqual(bucket.rate, 2 / 100, delta=0.001)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertGreater(bucket.take(), 0)
+
+
+class MisfirePolicyTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = TaskScheduler(misfire_grace=300)   # in memory
+        self.addCleanup(self.scheduler.shutdown)
+
+    def grace(self, misfire):
+        self.scheduler.schedule(1, T0, print, misfire=misfire, jitter=None)
+        return self.scheduler._sched.get_job("1").misfire_grace_time
+
+    def test_policies(self):
+        self.assertEqual(self.grace(""), 300)
+        self.assertEqual(self.grace("skip"), 1)
+        self.assertIsNone(self.grace("run"))
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            self.grace("later")
+
+
+class SchedulerWorkerTests(TransactionTestCase):
+    def setUp(self):
+        TaskScheduler.lead()
+        self.addCleanup(TaskScheduler.reset)
+
+    def test_scheduled_post_fires(self):
+        fired = threading.Event()
+        post = Post.objects.create(
+            text="due", schedule=datetime.now(timezone.utc) + timedelta(seconds=2)
+        )
+        enqueue_job(post.id, "schedule")
+        with mock.patch("posts.helpers.post_safe", side_effect=lambda p: fired.set()):
+            self.assertEqual(SchedulerWorker().apply_requests(), 1)
+            self.assertTrue(fired.wait(10), "the post job did not fire")
+
+
+class TwitterChunkedUploadTests(TestCase):
+    def poster(self, account):
+        poster = Twitter()
+        poster.api = mock.MagicMock()
+        poster.api.chunked_upload_init.return_value = mock.Mock(
+            media_id_string=f"m-{account}", expires_after_secs=86400
+        )
+        poster.api.chunked_upload_finalize.return_value = mock.Mock(processing_info=None)
+        poster.account = account
+        return poster
+
+    def upload(self, poster):
+        return poster.upload_media_chunked(io.BytesIO(b"video" * 100), "video/mp4").result()
+
+    def test_reused_per_account(self):
+        first = self.poster("1")
+        self.assertEqual(self.upload(first), "m-1")
+        self.assertEqual(self.upload(first), "m-1")
+        first.api.chunked_upload_init.assert_called_once()
+
+        other = self.poster("2")
+        self.assertEqual(self.upload(other), "m-2")
+        other.api.chunked_upload_init.assert_called_once()
+        self.assertEqual(MediaUpload.objects.filter(finalized=True).count(), 2)
+
+    def test_failed_processing_is_forgotten(self):
+        poster = self.poster("1")
+        poster.api.chunked_upload_finalize.return_value = mock.Mock(
+            processing_info={"state": "failed", "error": {"message": "bad video"}}
+        )
+        with self.assertRaises(RuntimeError):
+            self.upload(poster)
+        self.assertFalse(MediaUpload.objects.exists())
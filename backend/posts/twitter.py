@@ -1,14 +1,39 @@
+import hashlib
+import heapq
 import io
+import itertools
+import os
+import threading
+import time
+import requests
 import tweepy
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import partial
 from os import environ
+from typing import Callable, List, Optional, Union
 import logging
 
-from .post import MediaPost, MediaObject
-from .models import IntegrationSecrets
+from django.db import connections, transaction
+
+from .dispatch import Dispatcher
+from .post import MediaPost, MediaObject, gather, images_or_video, media_list, staged_list
+from .models import IntegrationSecrets, MediaUpload
 
 logger = logging.getLogger("posts")
 
+# X accepts APPEND chunks of up to 5 MB
+CHUNK_SIZE = min(int(os.getenv("X_UPLOAD_CHUNK_SIZE", str(4 * 1024 * 1024))), 5 * 1024 * 1024)
+# seconds a chunked upload stays claimed without progress, and between checks of a claim
+CLAIM_TTL = 600
+CLAIM_POLL = 2
+
+# the images of one tweet are uploaded at the same time
+_uploads = ThreadPoolExecutor(max_workers=4, thread_name_prefix="x-upload")
+# tweets waiting for their media are created here, never on the status poller
+_tweets = ThreadPoolExecutor(max_workers=2, thread_name_prefix="x-tweet")
+
 
 @dataclass
 class TwitterCredentials:
@@ -23,7 +48,11 @@ class Twitter(MediaPost):
     MEDIA_UPLOAD_URL = "https://api.x.com/2/media/upload"
     TWEET_URL = "https://api.x.com/2/tweets"
 
-    _inst: "Twitter" = None
+    platform = "x"
+    # X drops uploaded media that is not used within 24 hours
+    staged_ttl = 23 * 3600
+    # up to 4 images, or a single video or GIF
+    max_media = 4
 
     def __init__(self, credentials: TwitterCredentials = None):
         if credentials is not None:
@@ -43,22 +72,18 @@ class Twitter(MediaPost):
                 access_token=credentials.access_token,
                 access_token_secret=credentials.access_token_secret,
             )
+            self.client.session.hooks["response"].append(_observe_limits)
+            self.account = _account_of(credentials)
         else:
             self.api = None
             self.client = None
+            self.account = ""
 
     @classmethod
-    def instance(cls):
-        if cls._inst is not None:
-            return cls._inst
-
-        # get credentials from IntegrationSecrets most recent entry
-        try:
-            secrets = IntegrationSecrets.objects.latest("created_at")
-        except IntegrationSecrets.DoesNotExist:
-            return super().instance()
-
-        credentials = TwitterCredentials(
+    def credentials_from(cls, secrets: IntegrationSecrets):
+        if not secrets.x_consumer_key:
+            return None
+        return TwitterCredentials(
             bearer_token=secrets.x_bearer_token,
             api_key=secrets.x_consumer_key,
             api_secret_key=secrets.x_consumer_secret,
@@ -66,12 +91,14 @@ class Twitter(MediaPost):
             access_token_secret=secrets.x_access_secret,
         )
 
-        cls._inst = cls(credentials)
-        return cls._inst
-
     @classmethod
-    def reset(cls):
-        cls._inst = None
+    def retry_after(cls, error: Exception) -> Optional[float]:
+        if isinstance(error, tweepy.TooManyRequests):
+            reset = error.response.headers.get("x-rate-limit-reset")
+            return max(float(reset) - time.time(), 0) if reset else 60
+        if isinstance(error, (tweepy.TwitterServerError, requests.ConnectionError, requests.Timeout)):
+            return 0
+        return super().retry_after(error)
 
     def upload_media(
         self, filename: str, media: io.IOBase, mime_type: str, category: str = None
@@ -85,21 +112,318 @@ class Twitter(MediaPost):
         resp = self.api.media_upload(filename, file=media, media_category=category)
         return resp.media_id_string
 
-    def post(self, text: str, media: MediaObject = None):
+    def upload_media_chunked(
+        self, media: io.IOBase, mime_type: str, category: str = None
+    ) -> Future:
+        """
+        Upload `media` with INIT / APPEND / FINALIZE in CHUNK_SIZE chunks.
+
+        Progress is stored in `MediaUpload` per account after every chunk, so
+        calling this again after a failure resumes from the first chunk that
+        was not sent, and media that was already uploaded is not sent again.
+        Media X fails to process is forgotten, so it is uploaded afresh.
+
+        Returns:
+            Future: Resolves to the media id once X has finished processing
+            it; STATUS is polled by a background thread, not the caller.
+        """
+        if self.api is None:
+            raise ValueError("Twitter API client is not initialized.")
+        category = category or (
+            "tweet_gif" if mime_type == "image/gif"
+            else "tweet_image" if mime_type.startswith("image/")
+            else "tweet_video"
+        )
+        digest, total = _digest(media)
+        state = self._claim_upload(digest, total)
+        if state.finalized:
+            done: Future = Future()
+            done.set_result(state.media_id)
+            return done
+
+        try:
+            resumed = bool(state.media_id)
+            try:
+                self._send_chunks(media, mime_type, category, total, state)
+            except (tweepy.NotFound, tweepy.BadRequest):
+                if not resumed:
+                    raise
+                # the stored media id expired on X's side – start over once
+                state.media_id = ""
+                self._send_chunks(media, mime_type, category, total, state)
+            info = getattr(self.api.chunked_upload_finalize(state.media_id), "processing_info", None)
+            if info and info.get("state") == "failed":
+                state.delete()
+                raise RuntimeError(f"X failed to process media {state.media_id}: {info.get('error')}")
+            state.finalized = True
+            state.claimed_until = None
+            state.save(update_fields=["finalized", "claimed_until"])
+        finally:
+            if state.pk is not None and not state.finalized:
+                # resumable by the next attempt, whichever process makes it
+                MediaUpload.objects.filter(pk=state.pk).update(claimed_until=None)
+
+        if info and info.get("state") in ("pending", "in_progress"):
+            pending = status_poller().watch(self.api, state.media_id, info.get("check_after_secs", 1))
+            pending.add_done_callback(partial(_drop_failed_upload, state.pk))
+            return pending
+        done = Future()
+        done.set_result(state.media_id)
+        return done
+
+    def _claim_upload(self, digest: str, total: int) -> MediaUpload:
+        """
+        The upload state of `digest` on this account, claimed for this process
+        unless it is finalized already.
+
+        The row is locked while it is claimed, and the claim is a lease
+        renewed with every chunk, so the same media posted twice at once is
+        uploaded by one of them while the other waits for its media id.
+        """
+        deadline = time.monotonic() + CLAIM_TTL
+        while True:
+            now = datetime.now(timezone.utc)
+            with transaction.atomic():
+                state, created = MediaUpload.objects.select_for_update().get_or_create(
+                    platform=self.platform,
+                    account=self.account,
+                    digest=digest,
+                    defaults={"total_bytes": total, "expires_at": now + timedelta(days=1)},
+                )
+                if not created and (state.expires_at <= now or state.total_bytes != total):
+                    # X forgot the media id, or another file hashed the same
+                    state.media_id = ""
+                    state.total_bytes = total
+                    state.next_segment = 0
+                    state.finalized = False
+                    state.expires_at = now + timedelta(days=1)
+                if state.finalized:
+                    return state
+                if state.claimed_until is None or state.claimed_until <= now or time.monotonic() > deadline:
+                    state.claimed_until = now + timedelta(seconds=CLAIM_TTL)
+                    state.save()
+                    return state
+            time.sleep(CLAIM_POLL)
+
+    def _send_chunks(self, media, mime_type, category, total, state: MediaUpload) -> None:
+        if not state.media_id:
+            init = self.api.chunked_upload_init(total, mime_type, media_category=category)
+            state.media_id = init.media_id_string
+            state.next_segment = 0
+            state.expires_at = datetime.now(timezone.utc) + timedelta(
+                seconds=getattr(init, "expires_after_secs", 86400)
+            )
+            state.save(update_fields=["media_id", "next_segment", "expires_at"])
+        media.seek(state.next_segment * CHUNK_SIZE)
+        while True:
+            chunk = media.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            self.api.chunked_upload_append(state.media_id, chunk, state.next_segment)
+            state.next_segment += 1
+            state.claimed_until = datetime.now(timezone.utc) + timedelta(seconds=CLAIM_TTL)
+            state.save(update_fields=["next_segment", "claimed_until"])
+
+    @classmethod
+    def select_media(cls, media):
+        return images_or_video(media, cls.max_media, single=("video/", "image/gif"))
+
+    def stage(self, media: List[MediaObject]) -> Future:
+        """
+        Upload `media` without tweeting it. The Future resolves to
+        `[{"media_id": ...}, ...]` once X has finished processing the media.
+        """
+        return _then(
+            self._upload_all(self.select_media(media_list(media))),
+            lambda media_ids: [{"media_id": i} for i in media_ids],
+        )
+
+    def post(self, text: str, media: List[MediaObject] = None, staged: list = None) -> Union[str, Future]:
+        """
+        Tweet `text`, with `media` attached if given (up to 4 images, or a
+        single video or GIF), or the media staged earlier if `staged` is
+        given. Returns the id of the tweet.
+
+        Images are uploaded in parallel. Videos and GIFs go through the
+        resumable chunked upload. If X is still processing the media, the
+        tweet is created in the background once it is ready and a Future
+        resolving to the tweet id is returned instead.
+        """
         if self.client is None:
-            self._inst = None
             raise Exception(
                 "Twitter client is not initialized. Please provide credentials."
             )
+        if staged is not None:
+            return self._tweet(text, [ref["media_id"] for ref in staged_list(staged)])
+        media = self.select_media(media_list(media))
+        if not media:
+            return self._tweet(text)
+
+        upload = self._upload_all(media)
+        if _is_photo(media[0]) or upload.done():
+            # images take about as long as the largest of them
+            return self._tweet(text, upload.result())
+        return _then(upload, lambda media_ids: self._tweet(text, media_ids), executor=_tweets)
+
+    def _upload_all(self, media: List[MediaObject]) -> Future:
+        """Future of the media ids of `media`, images uploaded concurrently."""
+        if len(media) == 1 and not _is_photo(media[0]):
+            return _then(
+                self.upload_media_chunked(media[0].media, media[0].mime_type), lambda i: [i]
+            )
+        return gather([
+            _uploads.submit(self.upload_media, m.name, m.media, m.mime_type) for m in media
+        ])
+
+    def _tweet(self, text: str, media_ids: list = None) -> str:
+        resp = self.client.create_tweet(text=text, media_ids=media_ids)
+        return resp.data["id"]
+
+
+class StatusPoller:
+    """
+    Single background thread polling X's media STATUS endpoint.
+
+    Callers get a Future right away instead of sleeping through the
+    `check_after_secs` intervals X asks for while it transcodes a video.
+    """
+
+    def __init__(self, timeout: float = 15 * 60):
+        self.timeout = timeout
+        self._heap: list = []   # (due, seq, api, media_id, future, deadline)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, name="x-media-status", daemon=True).start()
+
+    def watch(self, api, media_id: str, check_after: float) -> Future:
+        future: Future = Future()
+        now = time.monotonic()
+        with self._cond:
+            heapq.heappush(
+                self._heap,
+                (now + check_after, next(self._seq), api, media_id, future, now + self.timeout),
+            )
+            self._cond.notify()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, api, media_id, future, deadline = heapq.heappop(self._heap)
+            self._check(api, media_id, future, deadline)
+
+    def _check(self, api, media_id, future: Future, deadline: float) -> None:
+        try:
+            info = api.get_media_upload_status(media_id).processing_info
+        except Exception as e:
+            future.set_exception(e)
+            return
+        state = info.get("state")
+        if state == "succeeded":
+            future.set_result(media_id)
+        elif state == "failed":
+            future.set_exception(RuntimeError(f"X failed to process media {media_id}: {info.get('error')}"))
+        elif time.monotonic() > deadline:
+            future.set_exception(TimeoutError(f"X is still processing media {media_id}"))
         else:
-            if media is not None:
-                media_id = self.upload_media(media.name, media.media, media.mime_type)
-                # post with media
-                self.client.create_tweet(
-                    text=text,
-                    media_ids=[media_id],
-                )
-            else:
-                self.client.create_tweet(
-                    text=text,
+            with self._cond:
+                heapq.heappush(
+                    self._heap,
+                    (time.monotonic() + info.get("check_after_secs", 5), next(self._seq),
+                     api, media_id, future, deadline),
                 )
+                self._cond.notify()
+
+
+_poller: Optional[StatusPoller] = None
+_poller_lock = threading.Lock()
+
+
+def status_poller() -> StatusPoller:
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = StatusPoller()
+    return _poller
+
+
+# ───────────────── helpers ───────────────── #
+def _observe_limits(response: requests.Response, *args, **kwargs):
+    """Report the tweet creation limits X sends with every response."""
+    if response.request.method == "POST" and response.url.endswith("/2/tweets"):
+        Dispatcher.instance().observe(Twitter.platform, response.headers)
+
+
+def _account_of(credentials: TwitterCredentials) -> str:
+    """
+    The X account the credentials act for: the user id access tokens start
+    with, or a hash of the token.
+    """
+    user_id, sep, _ = credentials.access_token.partition("-")
+    if sep and user_id.isdigit():
+        return user_id
+    return hashlib.sha256(credentials.access_token.encode()).hexdigest()[:32]
+
+
+def _drop_failed_upload(pk: int, pending: Future) -> None:
+    """Forget a finalized upload X could not process, so it is not reused."""
+    if pending.exception() is None:
+        return
+    try:
+        MediaUpload.objects.filter(pk=pk).delete()
+    except Exception as e:
+        logger.warning(f"Could not forget failed X upload {pk}: {e}")
+    finally:
+        # runs on the status poller thread
+        connections.close_all()
+
+
+def _is_photo(media: MediaObject) -> bool:
+    """Images X takes with the simple upload; GIFs are chunked like videos."""
+    return media.mime_type.startswith("image/") and media.mime_type != "image/gif"
+
+
+def _digest(media: io.IOBase):
+    """sha256 and size of the whole stream."""
+    sha = hashlib.sha256()
+    size = 0
+    media.seek(0)
+    while chunk := media.read(CHUNK_SIZE):
+        sha.update(chunk)
+        size += len(chunk)
+    return sha.hexdigest(), size
+
+
+def _then(future: Future, func: Callable, executor: ThreadPoolExecutor = None) -> Future:
+    """
+    Future of `func(result)` once `future` has succeeded.
+
+    `func` runs on the thread that completes `future` (e.g. the status
+    poller), so anything slower than a cheap transformation is run on
+    `executor` instead.
+    """
+    chained: Future = Future()
+
+    def run(result):
+        try:
+            chained.set_result(func(result))
+        except Exception as e:
+            logger.error(f"Error finishing X upload: {e}")
+            chained.set_exception(e)
+
+    def done(f: Future):
+        try:
+            result = f.result()
+        except Exception as e:
+            logger.error(f"Error finishing X upload: {e}")
+            chained.set_exception(e)
+            return
+        if executor is None:
+            run(result)
+        else:
+            executor.submit(run, result)
+
+    future.add_done_callback(done)
+    return chained
@@ -0,0 +1,386 @@
+"""
+Upload handler that streams multipart request bodies straight into MinIO.
+
+Django hands the handler the body in small chunks as they arrive; the chunks
+are hashed and pushed through a bounded pipe that a background thread feeds
+into a MinIO multipart upload. The file is therefore never held in memory or
+written to a temp file, and the bytes are only walked once.
+
+Uploads are stored under the hash of their content (see `content_key`): the
+stream lands under `incoming/` and is then copied inside MinIO to its
+content key, or just dropped if identical bytes were uploaded before. Posts
+reusing the same media therefore share one object. Every content object has
+a `StoredMedia` row that is locked while references to it change, and a new
+upload holds the object for `MEDIA_HOLD` seconds, so that it is not deleted
+before the post using it is created; objects still unused afterwards are
+garbage collected (see `posts.helpers.collect_media`).
+
+Usage (inside a view, before `request.data` is touched)
+-----
+request._request.upload_handlers.insert(0, MinioUploadHandler(request._request))
+uploaded = request.data["media"]        # MinioUploadedFile
+print(uploaded.bucket, uploaded.key, uploaded.sha256, uploaded.size)
+
+Browsers can also upload straight to MinIO through presigned URLs (see
+`presign_upload`); `finalize_upload` checks the object in the request and
+`store_upload` later hashes it and moves it to its content key, off the
+request thread, so Django only handles the metadata.
+
+export UPLOAD_URL_EXPIRY="3600"        # seconds a presigned upload URL is valid
+export UPLOAD_MAX_BYTES="1073741824"   # largest upload accepted, streamed or direct
+export MEDIA_HOLD="86400"              # seconds an upload is kept without a post
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import math
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+import logging
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+from django.db import transaction
+
+from .blob import MinioClient, PART_SIZE
+from .models import StoredMedia
+
+logger = logging.getLogger("posts")
+
+_EOF = object()
+
+# where uploads are streamed to until their hash is known
+INCOMING_PREFIX = "incoming/"
+
+URL_EXPIRY = timedelta(seconds=int(os.getenv("UPLOAD_URL_EXPIRY", "3600")))
+MAX_UPLOAD_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(1024 ** 3)))
+HOLD = timedelta(seconds=int(os.getenv("MEDIA_HOLD", "86400")))
+# S3 limit on the parts of one multipart upload
+MAX_PARTS = 10000
+
+
+class ChunkPipe(io.RawIOBase):
+    """
+    Bounded, blocking pipe turning pushed chunks into a readable stream.
+
+    The producer calls `write()` / `close_writer()`, the consumer reads from
+    another thread. At most `max_chunks` chunks are buffered, so a slow
+    consumer throttles the producer instead of growing memory.
+    """
+
+    def __init__(self, max_chunks: int = 64):
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_chunks)
+        self._pending = b""
+        self._eof = False
+        self._error: Optional[BaseException] = None
+
+    def readable(self) -> bool:
+        return True
+
+    # ------------ producer side ------------ #
+    def write(self, chunk: bytes, alive=lambda: True) -> int:
+        """Queue `chunk`, waiting while the pipe is full and `alive()` holds."""
+        while True:
+            try:
+                self._queue.put(bytes(chunk), timeout=1)
+                return len(chunk)
+            except queue.Full:
+                if not alive():
+                    raise BrokenPipeError("reader stopped consuming the upload")
+
+    def close_writer(self, alive=lambda: True) -> None:
+        """Mark the end of the stream, waiting like `write()` while the pipe is full."""
+        while True:
+            try:
+                self._queue.put(_EOF, timeout=1)
+                return
+            except queue.Full:
+                if not alive():
+                    raise BrokenPipeError("reader stopped consuming the upload")
+
+    def fail(self, exc: BaseException) -> None:
+        """Make the reader raise `exc` instead of waiting for more data."""
+        self._error = exc
+        try:
+            self._queue.put_nowait(_EOF)
+        except queue.Full:
+            pass
+
+    # ------------ consumer side ------------ #
+    def readinto(self, b) -> int:
+        while not self._pending and not self._eof:
+            item = self._queue.get()
+            if self._error is not None:
+                raise self._error
+            if item is _EOF:
+                self._eof = True
+            else:
+                self._pending = item
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+class MinioUploadedFile(UploadedFile):
+    """A file that has already been stored in MinIO while it was uploaded."""
+
+    def __init__(self, name, content_type, size, charset, bucket, key, sha256):
+        super().__init__(None, name, content_type, size, charset)
+        self.bucket = bucket
+        self.key = key
+        self.sha256 = sha256
+
+
+class MinioUploadHandler(FileUploadHandler):
+    """
+    Stream the files of `field_names` to `bucket` while the request is read.
+
+    Other file fields fall through to the next handler in the chain. A file
+    larger than `max_bytes` stops the upload and sets `rejected`.
+    """
+
+    def __init__(
+        self,
+        request=None,
+        bucket: str = "media",
+        field_names: Iterable[str] = ("media",),
+        max_bytes: int = MAX_UPLOAD_BYTES,
+    ):
+        super().__init__(request)
+        self.bucket = bucket
+        self.field_names = set(field_names)
+        self.max_bytes = max_bytes
+        self.active = False
+        self.rejected = False
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.active = field_name in self.field_names
+        if not self.active:
+            return
+        if content_length is not None and content_length > self.max_bytes:
+            self._reject()
+
+        self.key = INCOMING_PREFIX + uuid4().hex
+        self.sha = hashlib.sha256()
+        self.size = 0
+        self.error: Optional[BaseException] = None
+        self.pipe = ChunkPipe()
+        self.uploader = threading.Thread(
+            target=self._upload, name=f"upload-{self.key}", daemon=True
+        )
+        self.uploader.start()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if self.size + len(raw_data) > self.max_bytes:
+            # the failed stream aborts the multipart upload
+            self.upload_interrupted()
+            self._reject()
+        self.sha.update(raw_data)
+        self.size += len(raw_data)
+        try:
+            self.pipe.write(raw_data, alive=self.uploader.is_alive)
+        except BrokenPipeError:
+            self._upload_stopped()
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.active = False
+        try:
+            self.pipe.close_writer(alive=self.uploader.is_alive)
+        except BrokenPipeError:
+            self._upload_stopped()
+        self.uploader.join()
+        if self.error is not None:
+            raise self.error
+        sha256 = self.sha.hexdigest()
+        return MinioUploadedFile(
+            name=self.file_name,
+            content_type=self.content_type,
+            size=self.size,
+            charset=self.charset,
+            bucket=self.bucket,
+            key=store_by_content(self.bucket, self.key, sha256, self.file_name),
+            sha256=sha256,
+        )
+
+    def upload_interrupted(self):
+        if not self.active:
+            return
+        self.active = False
+        self.pipe.fail(ConnectionAbortedError("upload interrupted"))
+        self.uploader.join()
+
+    def _upload_stopped(self) -> None:
+        """The uploader quit while the pipe was full: raise what stopped it."""
+        self.uploader.join()
+        raise self.error or BrokenPipeError("MinIO upload stopped")
+
+    def _reject(self) -> None:
+        """Stop reading the request: the file is larger than `max_bytes`."""
+        self.rejected = True
+        self.active = False
+        raise StopUpload(connection_reset=True)
+
+    def _upload(self) -> None:
+        try:
+            MinioClient.instance().put_object(
+                self.bucket,
+                self.key,
+                self.pipe,
+                content_type=self.content_type or "application/octet-stream",
+            )
+        except BaseException as e:
+            logger.error(f"Error streaming {self.key} to MinIO: {e}")
+            self.error = e
+
+
+# ───────────────── helpers ───────────────── #
+def content_key(sha256: str, file_name: str) -> str:
+    """Key of an upload with the given hash; identical bytes share it."""
+    return f"sha256/{sha256}{os.path.splitext(file_name)[1].lower()}"
+
+
+def file_sha256(f: IO[bytes]) -> str:
+    """SHA-256 of a seekable file, read from the start."""
+    sha = hashlib.sha256()
+    f.seek(0)
+    while chunk := f.read(1024 * 1024):
+        sha.update(chunk)
+    f.seek(0)
+    return sha.hexdigest()
+
+
+def store_by_content(bucket: str, incoming: str, sha256: str, file_name: str) -> str:
+    """
+    Move the upload at `incoming` to its content key, unless the same bytes
+    are stored there already. Returns the content key.
+
+    The copy is a server-side multipart copy, as a single copy is limited to
+    5 GiB.
+    """
+    client = MinioClient.instance()
+    key = content_key(sha256, file_name)
+    try:
+        with locked_media(bucket, key) as stored:
+            if not client.exists(bucket, key):
+                client.copy_object(bucket, incoming, key)
+            hold(stored)
+    finally:
+        client.delete_object(bucket, incoming)
+    return key
+
+
+@contextmanager
+def locked_media(bucket: str, key: str) -> Iterator[StoredMedia]:
+    """
+    Lock the `StoredMedia` row of `bucket/key` until the block ends.
+
+    Whatever adds or drops a reference to a stored object does so inside
+    this block, so checking whether the object is still used and deleting
+    it cannot interleave with a new upload of the same content.
+    """
+    with transaction.atomic():
+        stored, _ = StoredMedia.objects.select_for_update().get_or_create(bucket=bucket, key=key)
+        yield stored
+
+
+def hold_media(bucket: str, key: str) -> None:
+    """Hold `bucket/key` for `HOLD`, before an asset referencing it is created."""
+    with locked_media(bucket, key) as stored:
+        hold(stored)
+
+
+def hold(stored: StoredMedia) -> None:
+    """Keep a locked object for `HOLD`, even while no asset references it yet."""
+    stored.held_until = max(
+        stored.held_until or datetime.min.replace(tzinfo=timezone.utc),
+        datetime.now(timezone.utc) + HOLD,
+    )
+    stored.save(update_fields=["held_until"])
+
+
+# ----------------------- direct uploads -------------------- #
+def presign_upload(file_name: str, mime_type: str, size: int, bucket: str = "media") -> Dict:
+    """
+    Presigned URLs for the browser to upload a file of `size` bytes to.
+
+    Files up to `PART_SIZE` get a single PUT URL, larger ones a multipart
+    upload with one URL per `part_size` slice.
+
+    Raises:
+        ValueError: If the size is not acceptable.
+    """
+    if size <= 0 or size > MAX_UPLOAD_BYTES:
+        raise ValueError(f"size must be between 1 and {MAX_UPLOAD_BYTES} bytes")
+    key = INCOMING_PREFIX + uuid4().hex
+    client = MinioClient.instance()
+    if size <= PART_SIZE:
+        return {"bucket": bucket, "key": key, "url": client.presigned_put(bucket, key, URL_EXPIRY)}
+
+    part_size = max(PART_SIZE, math.ceil(size / MAX_PARTS))
+    upload_id, urls = client.start_multipart(
+        bucket, key, math.ceil(size / part_size), URL_EXPIRY,
+        content_type=mime_type or "application/octet-stream",
+    )
+    return {"bucket": bucket, "key": key, "upload_id": upload_id, "part_size": part_size, "urls": urls}
+
+
+def finalize_upload(
+    bucket: str,
+    key: str,
+    upload_id: Optional[str] = None,
+    parts: Optional[List[Tuple[int, str]]] = None,
+) -> None:
+    """
+    Check that a direct upload is complete and acceptable.
+
+    Multipart uploads are completed first. Only the object's metadata is
+    read; `store_upload` hashes it afterwards.
+
+    Raises:
+        ValueError: If the upload does not exist or is too large.
+    """
+    if not key.startswith(INCOMING_PREFIX):
+        raise ValueError("not a direct upload")
+    client = MinioClient.instance()
+    if upload_id:
+        try:
+            client.complete_multipart(bucket, key, upload_id, parts or [])
+        except Exception:
+            client.abort_multipart(bucket, key, upload_id)
+            raise ValueError("the upload could not be completed")
+    if not client.exists(bucket, key):
+        raise ValueError("the upload does not exist")
+    if client.stat_object(bucket, key).size > MAX_UPLOAD_BYTES:
+        client.delete_object(bucket, key)
+        raise ValueError(f"uploads are limited to {MAX_UPLOAD_BYTES} bytes")
+
+
+def store_upload(bucket: str, key: str, file_name: str) -> Tuple[str, str]:
+    """
+    Store a finalized direct upload under its content key. The object is
+    hashed as it is streamed from MinIO, so this takes a while for large
+    files and runs off the request (see `posts.helpers.store_in_background`).
+
+    Returns:
+        Tuple[str, str]: The content key and the SHA-256 of the object.
+    """
+    client = MinioClient.instance()
+    sha = hashlib.sha256()
+    for chunk in client.iter_object(bucket, key):
+        sha.update(chunk)
+    sha256 = sha.hexdigest()
+    return store_by_content(bucket, key, sha256, file_name), sha256
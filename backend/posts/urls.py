@@ -1,8 +1,16 @@
-from .views import PostView, IntegrationSecretsView
+from .views import (
+    PostView, PostBatchView, DeliveryView, UploadView, UploadFinalizeView, UploadStatusView,
+    IntegrationSecretsView,
+)
 from django.urls import path
 
 urlpatterns = [
     path('post', PostView.as_view(), name='post'),
     path('post/<int:id>', PostView.as_view(), name='post-detail'),
+    path('post/batch', PostBatchView.as_view(), name='post-batch'),
+    path('post/<int:id>/deliveries', DeliveryView.as_view(), name='post-deliveries'),
+    path('upload', UploadView.as_view(), name='upload'),
+    path('upload/finalize', UploadFinalizeView.as_view(), name='upload-finalize'),
+    path('upload/<int:id>', UploadStatusView.as_view(), name='upload-status'),
     path('secrets', IntegrationSecretsView.as_view(), name='secrets'),
 ]
\ No newline at end of file
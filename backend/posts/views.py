@@ -1,18 +1,33 @@
+from datetime import datetime, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework import status
-from uuid import uuid4
 from typing import Dict
 from logging import getLogger
 
-from .models import Post, IntegrationSecrets
-from .serializers import PostSerializer, IntegrationSecretsSerializer
+from .models import Post, Social, Delivery, DirectUpload, IntegrationSecrets
+from .serializers import (
+    PostSerializer, DeliverySerializer, IntegrationSecretsSerializer,
+)
 from .post import MediaObject, MediaPost
 from .twitter import Twitter
 from .instagram import Instagram
 from .bluesky import Bluesky
-from .helpers import schedule_post, delete_post_artifacts, reset_posters
+from .pagination import paginate, paginate_by_id
+from .helpers import (
+    schedule_post, schedule_posts, store_in_background, delete_post_artifacts, release_media,
+    reset_posters,
+)
+from .uploads import (
+    MAX_UPLOAD_BYTES, MinioUploadHandler, MinioUploadedFile, content_key, file_sha256,
+    finalize_upload, presign_upload,
+)
 
 logger = getLogger("posts")
 
@@ -24,59 +39,174 @@ MEDIA_POSTERS: Dict[str, MediaPost] = {
 
 
 class PostView(APIView):
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+
     def get(self, request: Request) -> Response:
-        posts = Post.objects.all()
-        serialized_posts = PostSerializer(posts, many=True).data
-        return Response(serialized_posts, status=status.HTTP_200_OK)
+        """
+        List posts one page at a time, ordered by (schedule, id).
+
+        Query parameters: `cursor` (from the previous page's `next`), `limit`,
+        `fields` (comma separated), `from` / `to` (ISO datetimes bounding the
+        schedule), `social` (comma separated), `repeat` and `immediate`.
+        """
+        params = request.query_params
+        try:
+            limit = min(int(params.get("limit", self.PAGE_SIZE)), self.MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError("limit must be positive")
+            posts = self._filter(Post.objects.all(), params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = None
+        if params.get("fields"):
+            fields = {f.strip() for f in params["fields"].split(",") if f.strip()}
+            # the cursor needs schedule and id even when they are not returned
+            columns = {"id", "schedule"} | (fields & {"text", "repeat", "misfire", "immediate", "time"})
+            posts = posts.only(*columns)
+        if fields is None or "socials" in fields:
+            posts = posts.prefetch_related(
+                Prefetch("socials", queryset=Social.objects.only("post_id", "social"))
+            )
+        if fields is None or "assets" in fields:
+            posts = posts.prefetch_related("assets")
+
+        try:
+            page, next_cursor = paginate(posts, params.get("cursor"), limit)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {
+                "results": PostSerializer(page, many=True, fields=fields).data,
+                "next": next_cursor,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @staticmethod
+    def _filter(posts, params):
+        """
+        Raises:
+            ValueError: If a filter value is malformed.
+        """
+        if params.get("from"):
+            posts = posts.filter(schedule__gte=_parse_datetime(params["from"]))
+        if params.get("to"):
+            posts = posts.filter(schedule__lt=_parse_datetime(params["to"]))
+        if params.get("repeat"):
+            posts = posts.filter(repeat=params["repeat"])
+        if params.get("immediate"):
+            posts = posts.filter(immediate=params["immediate"] == "true")
+        if params.get("social"):
+            socials = [s.strip() for s in params["social"].split(",") if s.strip()]
+            posts = posts.filter(
+                Exists(Social.objects.filter(post=OuterRef("pk"), social__in=socials))
+            )
+        return posts
 
     def post(self, request: Request) -> Response:
-        # Here you would typically handle the creation of a new post
-        # For demonstration, we will just return a success message
-        req_dict = {k: v for k, v in request.data.items() if "[]" not in k}
+        # stream uploaded media straight to MinIO while the body is parsed
+        handler = MinioUploadHandler(request._request)
+        request._request.upload_handlers.insert(0, handler)
+        try:
+            data = request.data
+        except Exception as e:
+            logger.error(f"Error receiving upload: {e}")
+            return Response(
+                {"error": "Error uploading media."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        if handler.rejected:
+            # files completed before the one that was too large are stored already
+            for media in data.getlist("media") if hasattr(data, "getlist") else []:
+                if isinstance(media, MinioUploadedFile):
+                    release_media(media.bucket, media.key)
+            return Response(
+                {"error": f"Media files may be at most {MAX_UPLOAD_BYTES} bytes."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        req_dict = {k: v for k, v in data.items() if "[]" not in k}
         arrs = {k.replace("[]", ""): v for k, v in request.POST.lists() if "[]" in k}
         req_dict.update(arrs)
 
-        media_obj = None
+        media_objs = {}  # asset key → media not in MinIO yet
         if "socials" in req_dict:
-            req_dict["socials"] = [{"social": s} for s in req_dict["socials"]]
+            req_dict["socials"] = [
+                s if isinstance(s, dict) else {"social": s} for s in req_dict["socials"]
+            ]
         if "immediate" in req_dict:
-            req_dict["immediate"] = True if req_dict["immediate"] == "true" else False
+            # "true" from forms, true from JSON
+            req_dict["immediate"] = req_dict["immediate"] in (True, "true")
         if "media" in req_dict:
-            file_name = req_dict["media"].name
-            mime_type = req_dict["media"].content_type
-            media_obj = MediaObject(
-                name=file_name,
-                mime_type=mime_type,
-                media=req_dict["media"].file,
-            )
-            req_dict["assets"] = [
-                {
-                    "file_name": file_name,
-                    "key": str(uuid4())[:8] + "-" + req_dict["media"].name,
+            req_dict.pop("media")
+            assets = []
+            for media in data.getlist("media") if hasattr(data, "getlist") else [data["media"]]:
+                if isinstance(media, MinioUploadedFile):
+                    # already stored while the request was read
+                    assets.append({
+                        "file_name": media.name,
+                        "key": media.key,
+                        "bucket": media.bucket,
+                        "mime_type": media.content_type,
+                        "sha256": media.sha256,
+                    })
+                    continue
+                sha256 = file_sha256(media.file)
+                key = content_key(sha256, media.name)
+                media_objs[key] = MediaObject(
+                    name=media.name,
+                    mime_type=media.content_type,
+                    media=media.file,
+                    path=(
+                        media.temporary_file_path()
+                        if hasattr(media, "temporary_file_path")
+                        else None
+                    ),
+                )
+                assets.append({
+                    "file_name": media.name,
+                    "key": key,
                     "bucket": "media",
-                    "mime_type": mime_type,
-                }
-            ]
-            del req_dict["media"]
+                    "mime_type": media.content_type,
+                    "sha256": sha256,
+                })
+            req_dict["assets"] = assets
 
         serial = PostSerializer(data=req_dict)
         post = None
         if not serial.is_valid():
             logger.error(f"Post serializer error: {serial.errors}")
+            # drop media that was already stored in MinIO, unless other posts use it
+            for a in req_dict.get("assets", []):
+                if a.get("key") and a["key"] not in media_objs:
+                    release_media(a.get("bucket", "media"), a["key"])
             return Response(serial.errors, status=status.HTTP_400_BAD_REQUEST)
         else:
             post = serial.save()
 
         try:
-            schedule_post(post, media_obj=media_obj)
+            schedule_post(post, media_objs=media_objs)
         except Exception as e:
             logger.error(f"Error scheduling post: {e}")
             return Response(
                 {"error": "Error scheduling post."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        if post.immediate:
+            # sent in the background, its deliveries tell how it went
+            return Response(
+                {
+                    "message": f"Post {post.id} accepted for posting.",
+                    "id": post.id,
+                    "deliveries": reverse("post-deliveries", args=[post.id]),
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
         return Response(
-            {"message": f"Post {post.id} created successfully!"}, status=status.HTTP_200_OK
+            {"message": f"Post {post.id} created successfully!", "id": post.id},
+            status=status.HTTP_200_OK,
         )
 
     def delete(self, request: Request, id: int) -> Response:
@@ -98,6 +228,191 @@ class PostView(APIView):
             )
 
 
+def _parse_datetime(value: str) -> datetime:
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid datetime: {value!r}")
+    if is_naive(parsed):
+        parsed = make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+class PostBatchView(APIView):
+    # upper bound on the number of posts accepted in one request
+    MAX_BATCH = 1000
+
+    def post(self, request: Request) -> Response:
+        posts = request.data
+        if isinstance(posts, dict):
+            posts = posts.get("posts")
+        if not isinstance(posts, list) or not posts:
+            return Response(
+                {"error": "Expected a non-empty list of posts."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(posts) > self.MAX_BATCH:
+            return Response(
+                {"error": f"At most {self.MAX_BATCH} posts per batch."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serial = PostSerializer(data=posts, many=True)
+        if not serial.is_valid():
+            logger.error(f"Post batch serializer error: {serial.errors}")
+            return Response(serial.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                created = serial.save()
+                schedule_posts(created)
+        except Exception as e:
+            logger.error(f"Error scheduling post batch: {e}")
+            return Response(
+                {"error": "Error scheduling posts."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return Response(
+            {
+                "message": f"{len(created)} posts created successfully!",
+                "ids": [p.id for p in created],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class UploadView(APIView):
+    def post(self, request: Request) -> Response:
+        """
+        Presigned URLs to upload a file straight to MinIO.
+
+        Body: `file_name`, `mime_type` and `size` (bytes). Small files get a
+        single `url` to PUT to; larger ones an `upload_id`, a `part_size` and
+        one URL per part in `urls`. Either way, hand `key` to
+        `upload/finalize` once the upload is done.
+        """
+        data = request.data
+        mime_type = data.get("mime_type") or ""
+        if not data.get("file_name"):
+            return Response({"error": "file_name is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if not mime_type.startswith(("image/", "video/")):
+            return Response(
+                {"error": "Only images and videos can be uploaded."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            upload = presign_upload(data["file_name"], mime_type, int(data.get("size", 0)))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error presigning upload: {e}")
+            return Response(
+                {"error": "Error preparing upload."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response(upload, status=status.HTTP_200_OK)
+
+
+class UploadFinalizeView(APIView):
+    def post(self, request: Request) -> Response:
+        """
+        Finish a direct upload; it is turned into an asset in the background.
+
+        Body: `key`, `file_name` and `mime_type` of the upload, plus
+        `upload_id` and `parts` (`[{"part_number", "etag"}]`) for multipart
+        uploads. With `post` (an id) the asset is attached to that scheduled
+        post; without it, it is to be sent as one of the `assets` of
+        `POST /api/post`. Answers 202 with the `status` URL to poll for the
+        asset (see `UploadStatusView`).
+        """
+        data = request.data
+        post = None
+        if data.get("post") is not None:
+            post = Post.objects.filter(id=data["post"]).first()
+            if post is None:
+                return Response({"error": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
+            if post.immediate:
+                return Response(
+                    {"error": "Immediate posts are sent already."}, status=status.HTTP_409_CONFLICT
+                )
+        if not data.get("key") or not data.get("file_name"):
+            return Response(
+                {"error": "key and file_name are required."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        bucket = data.get("bucket") or "media"
+        try:
+            parts = [(int(p["part_number"]), str(p["etag"])) for p in data.get("parts") or []]
+            finalize_upload(bucket, data["key"], data.get("upload_id"), parts)
+        except (ValueError, KeyError, TypeError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error finalizing upload {data['key']}: {e}")
+            return Response(
+                {"error": "Error finalizing upload."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        upload = DirectUpload.objects.create(
+            post=post,
+            bucket=bucket,
+            incoming=data["key"],
+            file_name=data["file_name"],
+            mime_type=data.get("mime_type") or "",
+        )
+        transaction.on_commit(lambda: store_in_background(upload))
+        return Response(
+            {"id": upload.id, "status": reverse("upload-status", args=[upload.id])},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class UploadStatusView(APIView):
+    def get(self, request: Request, id: int) -> Response:
+        """
+        The outcome of a finalized direct upload: 202 while it is being
+        stored, then 200 with the asset, or 400 with the `error`.
+        """
+        upload = DirectUpload.objects.filter(id=id).first()
+        if upload is None:
+            return Response({"error": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+        if upload.error:
+            return Response({"error": upload.error}, status=status.HTTP_400_BAD_REQUEST)
+        if upload.asset is None:
+            return Response({"status": "pending"}, status=status.HTTP_202_ACCEPTED)
+        return Response(upload.asset, status=status.HTTP_200_OK)
+
+
+class DeliveryView(APIView):
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+
+    def get(self, request: Request, id: int) -> Response:
+        """
+        List the deliveries of a post one page at a time, newest first.
+
+        Query parameters: `cursor` (from the previous page's `next`), `limit`,
+        `social` (comma separated) and `state`.
+        """
+        if not Post.objects.filter(id=id).exists():
+            return Response({"error": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        params = request.query_params
+        deliveries = Delivery.objects.filter(post_id=id)
+        if params.get("social"):
+            deliveries = deliveries.filter(
+                social__in=[s.strip() for s in params["social"].split(",") if s.strip()]
+            )
+        if params.get("state"):
+            deliveries = deliveries.filter(state=params["state"])
+        try:
+            limit = min(int(params.get("limit", self.PAGE_SIZE)), self.MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError("limit must be positive")
+            page, next_cursor = paginate_by_id(deliveries, params.get("cursor"), limit)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {"results": DeliverySerializer(page, many=True).data, "next": next_cursor},
+            status=status.HTTP_200_OK,
+        )
+
+
 class IntegrationSecretsView(APIView):
     def get(self, request: Request) -> Response:
         latest = IntegrationSecrets.objects.order_by("created_at").first()
@@ -0,0 +1,154 @@
+"""
+Scheduler worker: the only process that runs scheduled posts.
+
+export SCHEDULER_EMBEDDED="true"        # also try to lead from web processes
+export SCHEDULER_POLL_INTERVAL="2"      # seconds between job-request polls
+export MEDIA_GC_INTERVAL="3600"         # seconds between sweeps for unused media
+
+Web processes only write `JobRequest` rows. Every worker competes for a
+Postgres advisory lock; the one holding it starts the `TaskScheduler`,
+reconciles the job store with the `Post` table and then applies queued
+requests. The others stand by, so each job fires exactly once no matter how
+many API or worker processes are running.
+
+Run it with `python manage.py run_scheduler`.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Optional
+import logging
+
+from django.db import OperationalError, connection, transaction
+
+logger = logging.getLogger("posts")
+
+# arbitrary but fixed key identifying the scheduler leader lock
+LEADER_LOCK_KEY = 0x76636D73  # "vcms"
+POLL_INTERVAL = float(os.getenv("SCHEDULER_POLL_INTERVAL", "2"))
+EMBEDDED = os.getenv("SCHEDULER_EMBEDDED", "true").lower() == "true"
+GC_INTERVAL = float(os.getenv("MEDIA_GC_INTERVAL", "3600"))
+
+
+class SchedulerWorker:
+    """
+    Leader-elected loop that owns the scheduler.
+
+    Usage
+    -----
+    SchedulerWorker().run()                 # blocks, e.g. from run_scheduler
+    SchedulerWorker().start_background()    # daemon thread inside a web process
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL, batch_size: int = 500):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----------------------- API -------------------- #
+    def run(self) -> None:
+        """Wait for leadership, then schedule and apply requests until stopped."""
+        while not self._stop.is_set():
+            try:
+                if self._acquire_leadership():
+                    self._lead()
+            except OperationalError as e:
+                # lost the database (and with it the lock) – start over
+                logger.warning(f"Scheduler worker lost its database connection: {e}")
+                connection.close()
+            except Exception as e:
+                # closing the connection also releases the lock for others
+                logger.error(f"Scheduler worker failed: {e}")
+                connection.close()
+            self._stop.wait(self.poll_interval)
+
+    def start_background(self) -> threading.Thread:
+        """Run the worker in a daemon thread of the current process."""
+        self._thread = threading.Thread(target=self.run, name="scheduler-worker", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # ------------ internal helpers ------------ #
+    def _acquire_leadership(self) -> bool:
+        if connection.vendor != "postgresql":
+            return True  # no advisory locks, assume a single worker
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [LEADER_LOCK_KEY])
+            return cursor.fetchone()[0]
+
+    def _lead(self) -> None:
+        from .helpers import collect_media, reconcile_posts
+        from .scheduler import TaskScheduler
+
+        logger.info("Scheduler worker is the leader, starting scheduler")
+        TaskScheduler.lead()
+        try:
+            counts = reconcile_posts()
+            logger.info(f"Reconciled scheduled posts: {counts}")
+
+            next_gc = time.monotonic()
+            while not self._stop.is_set():
+                if time.monotonic() >= next_gc:
+                    logger.info(f"Collected unused media: {collect_media()}")
+                    next_gc = time.monotonic() + GC_INTERVAL
+                if not self.apply_requests():
+                    self._stop.wait(self.poll_interval)
+        finally:
+            # never keep firing jobs without holding the lock
+            TaskScheduler.reset()
+
+    def apply_requests(self) -> int:
+        """
+        Apply one batch of queued job requests. Returns how many were applied.
+
+        Requests are collapsed per post so only the latest action counts.
+        """
+        from .helpers import cancel_job, schedule_job
+        from .models import JobRequest, Post
+        from .scheduler import TaskScheduler
+
+        with transaction.atomic():
+            batch = list(
+                JobRequest.objects.select_for_update(skip_locked=True)
+                .order_by("id")[: self.batch_size]
+            )
+            if not batch:
+                return 0
+
+            actions = {r.post_id: r.action for r in batch}   # latest wins
+            posts = Post.objects.in_bulk(
+                [pid for pid, action in actions.items() if action == "schedule"]
+            )
+            for post_id, action in actions.items():
+                try:
+                    post = posts.get(post_id)
+                    if action == "schedule" and post is not None and not post.immediate:
+                        schedule_job(post)
+                    else:
+                        cancel_job(post_id)
+                except Exception as e:
+                    logger.warning(f"Error applying {action} for post {post_id}: {e}")
+
+            JobRequest.objects.filter(id__in=[r.id for r in batch]).delete()
+        # the jobs were written inside the transaction, invisible to the
+        # scheduler thread when add_job woke it up
+        TaskScheduler.instance().wakeup()
+        return len(batch)
+
+
+def should_embed(argv) -> bool:
+    """
+    Whether this process should compete for the scheduler from a background
+    thread: web servers do, one-off management commands do not.
+    """
+    if not EMBEDDED:
+        return False
+    if len(argv) > 1 and os.path.basename(argv[0]) == "manage.py":
+        return argv[1] == "runserver"
+    return True
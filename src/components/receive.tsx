@@ -22,10 +22,18 @@ export interface ScheduledPost {
     time: string; // Timestamp of when the post was created
 }
 
+/** One page of posts as returned by GET /api/post */
+interface PostPage {
+    results: ScheduledPost[]; // Posts on this page
+    next: string | null; // Cursor of the next page, null on the last one
+}
+
 /**
  * Fetch the list of scheduled / queued posts.
  *
- * @param endpoint  The API route that returns JSON (default: '/api/social/posts')
+ * The backend paginates by cursor, so pages are requested until `next`
+ * is null.
+ *
  * @returns         Array of scheduled-post objects
  * @throws          Error when response is not OK or JSON fails to parse
  */
@@ -34,19 +42,29 @@ export async function getScheduledPosts(): Promise<ScheduledPost[]> {
     const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
     const endpoint = `${apiUrl}/api/post`;
 
-    const res = await fetch(endpoint, {
-        method: "GET",
-        headers: { Accept: "application/json" },
-    });
-
-    if (!res.ok) {
-        const msg = await res.text().catch(() => res.statusText);
-        throw new Error(`Fetch failed (${res.status}): ${msg}`);
-    }
-
-    // Validate / narrow the JSON if you like (zod, io-ts, etc.)
-    const data = (await res.json()) as ScheduledPost[];
-    return data;
+    const posts: ScheduledPost[] = [];
+    let cursor: string | null = null;
+    do {
+        const url: string = cursor
+            ? `${endpoint}?cursor=${encodeURIComponent(cursor)}`
+            : endpoint;
+        const res = await fetch(url, {
+            method: "GET",
+            headers: { Accept: "application/json" },
+        });
+
+        if (!res.ok) {
+            const msg = await res.text().catch(() => res.statusText);
+            throw new Error(`Fetch failed (${res.status}): ${msg}`);
+        }
+
+        // Validate / narrow the JSON if you like (zod, io-ts, etc.)
+        const page = (await res.json()) as PostPage;
+        posts.push(...page.results);
+        cursor = page.next;
+    } while (cursor);
+
+    return posts;
 }
 interface Props {
     posts: ScheduledPost[];
@@ -6,40 +6,46 @@ import { ScheduleParameters } from "@/components/post";
  * The backend is responsible for authenticating with Instagram, X, Bluesky,
  * scheduling jobs, etc.
  *
+ * Media is uploaded straight to MinIO first (see `uploadMedia`), so the
+ * post itself is a small JSON request.
+ *
  * @param payload data collected by ScheduledPostModal
- * @param endpoint defaults to '/api/social/post'
  */
 export async function postSocial(
   payload: ScheduleParameters,
 ): Promise<Response> {
   const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
   const endpoint = `${apiUrl}/api/post`;
-  // ---------- 1. Build multipart body ----------
-  const form = new FormData();
 
-  form.append("text", payload.text);
-  form.append("immediate", String(payload.immediate));
+  // ---------- 1. Upload media straight to MinIO ----------
+  const assets = [];
+  for (const file of payload.assets) {
+    assets.push(await uploadMedia(apiUrl, file));
+  }
+
+  // ---------- 2. Build JSON body ----------
+  const body: Record<string, unknown> = {
+    text: payload.text,
+    immediate: payload.immediate,
+    socials: payload.social,
+    assets,
+    time: new Date().toISOString(), // optional timestamp
+  };
 
   // Date/time only when scheduling
   if (!payload.immediate && payload.dateTime) {
-    form.append("schedule", payload.dateTime.toISOString());
-    form.append("repeat", payload.repeat);          // daily / weekly / ...
+    body.schedule = payload.dateTime.toISOString();
+    body.repeat = payload.repeat;          // daily / weekly / ...
   }
 
-  // Multi-select platforms → comma-separated list (or append each one)
-  payload.social.forEach((platform) => form.append("socials[]", platform));
-
-  // Media files (raw bytes)
-  payload.assets.forEach((file) => form.append("media", file, file.name));
-  form.append("time", new Date().toISOString()); // optional timestamp
-
-  // ---------- 2. Fire the request ----------
+  // ---------- 3. Fire the request ----------
   const res = await fetch(endpoint, {
     method: "POST",
-    body: form,   // browser sets Content-Type: multipart/form-data; boundary=...
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
   });
 
-  // ---------- 3. Handle response ----------
+  // ---------- 4. Handle response ----------
   if (!res.ok) {
     // Optional: surface backend message
     const msg = await res.text().catch(() => res.statusText);
@@ -49,6 +55,92 @@ export async function postSocial(
   return res; // caller can await res.json() if backend returns JSON
 }
 
+/** Milliseconds between polls for a finalized upload to be stored. */
+const UPLOAD_POLL_MS = 1000;
+
+/** Asset as returned once an upload is stored, ready for `/api/post`. */
+export interface UploadedAsset {
+  file_name: string;
+  bucket: string;
+  key: string;
+  mime_type: string;
+  sha256: string;
+}
+
+/**
+ * Upload a file to MinIO through presigned URLs, so the bytes never pass
+ * through the backend; large files are sent as parallel multipart parts.
+ */
+export async function uploadMedia(apiUrl: string, file: File): Promise<UploadedAsset> {
+  const mimeType = file.type || "application/octet-stream";
+  const presign = await fetch(`${apiUrl}/api/upload`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ file_name: file.name, mime_type: mimeType, size: file.size }),
+  });
+  if (!presign.ok) {
+    const msg = await presign.text().catch(() => presign.statusText);
+    throw new Error(`Upload failed (${presign.status}): ${msg}`);
+  }
+  const upload = await presign.json();
+
+  let parts: { part_number: number; etag: string }[] | undefined;
+  if (upload.url) {
+    await putBlob(upload.url, file, mimeType);
+  } else {
+    parts = await Promise.all(
+      (upload.urls as string[]).map(async (url, i) => {
+        const chunk = file.slice(i * upload.part_size, (i + 1) * upload.part_size);
+        const res = await putBlob(url, chunk);
+        return { part_number: i + 1, etag: res.headers.get("ETag") || "" };
+      }),
+    );
+  }
+
+  const finalize = await fetch(`${apiUrl}/api/upload/finalize`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      bucket: upload.bucket,
+      key: upload.key,
+      file_name: file.name,
+      mime_type: mimeType,
+      upload_id: upload.upload_id,
+      parts,
+    }),
+  });
+  if (!finalize.ok) {
+    const msg = await finalize.text().catch(() => finalize.statusText);
+    throw new Error(`Upload failed (${finalize.status}): ${msg}`);
+  }
+
+  // the backend hashes and stores the file in the background
+  const { status } = await finalize.json();
+  for (;;) {
+    const res = await fetch(`${apiUrl}${status}`);
+    if (res.status !== 202) {
+      if (!res.ok) {
+        const msg = await res.text().catch(() => res.statusText);
+        throw new Error(`Upload failed (${res.status}): ${msg}`);
+      }
+      return res.json();
+    }
+    await new Promise((resolve) => setTimeout(resolve, UPLOAD_POLL_MS));
+  }
+}
+
+async function putBlob(url: string, blob: Blob, contentType?: string): Promise<Response> {
+  const res = await fetch(url, {
+    method: "PUT",
+    body: blob,
+    headers: contentType ? { "Content-Type": contentType } : undefined,
+  });
+  if (!res.ok) {
+    throw new Error(`Upload to storage failed (${res.status})`);
+  }
+  return res;
+}
+
 export async function fileToBytes(file: File | Blob): Promise<Uint8Array> {
   const buffer = await file.arrayBuffer();
   return new Uint8Array(buffer);